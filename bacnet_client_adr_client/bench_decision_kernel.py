@@ -0,0 +1,63 @@
+"""
+Micro-benchmark for the vectorized DR decision kernel
+
+$ python bench_decision_kernel.py
+"""
+
+import time
+
+import numpy as np
+
+from decision_kernel import decide, changed_zones, released_state
+
+
+REPEATS = 50
+
+
+def make_zone_state(zone_count, rng):
+    return {
+        "mode": rng.choice([2.0, 4.0, 1.0], size=zone_count),
+        "occupied": rng.random(zone_count) > 0.5,
+        "base_setpoint": rng.uniform(68.0, 76.0, size=zone_count),
+        "payload": 1.0,
+        "dr_active": True,
+        "setpoint_adj": 1.5,
+        "previous_mecho_mode": np.zeros(zone_count),
+    }
+
+
+def bench(zone_count, rng):
+    state = make_zone_state(zone_count, rng)
+    written = released_state(zone_count)
+
+    # warm up
+    decide(**state)
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        targets = decide(**state)
+    decide_seconds = (time.perf_counter() - start) / REPEATS
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        for field, previous in written.items():
+            changed_zones(previous, targets.hvac(field))
+    diff_seconds = (time.perf_counter() - start) / REPEATS
+
+    return decide_seconds, diff_seconds
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'zones':>8} {'decide ms':>10} {'diff ms':>9} {'ns/zone':>9}")
+    for zone_count in (1, 10, 100, 1_000, 10_000, 100_000):
+        decide_seconds, diff_seconds = bench(zone_count, rng)
+        per_zone_ns = (decide_seconds + diff_seconds) / zone_count * 1e9
+        print(
+            f"{zone_count:>8} {decide_seconds * 1e3:>10.3f} "
+            f"{diff_seconds * 1e3:>9.3f} {per_zone_ns:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark for the DR state segment, publish / read cost and a torn read
+check against a writer running flat out in another process
+
+$ python bench_dr_state_segment.py
+"""
+
+import os
+import time
+import tempfile
+import multiprocessing
+
+import numpy as np
+
+from decision_kernel import HVAC_FIELDS
+from dr_state_segment import DrStateSegment, DrStateReader
+
+
+WRITE_SECONDS = 2.0
+
+
+def hammer(path, zones, seconds):
+    # every publish writes the same k everywhere, a reader seeing two values saw a torn write
+    segment = DrStateSegment(path, zones, HVAC_FIELDS)
+    deadline = time.perf_counter() + seconds
+    k = 0
+    while time.perf_counter() < deadline:
+        k += 1
+        values = np.full(zones, float(k))
+        segment.publish(float(k), k % 2 == 0, None, None, {field: values for field in HVAC_FIELDS})
+    segment.close()
+
+
+def main():
+    print(f"{'zones':>6} {'publish us':>11} {'read us':>8} {'reads':>8} {'torn':>5} {'retries':>8}")
+    for zones in (1, 100, 1_000, 10_000):
+        path = os.path.join(tempfile.gettempdir(), f"bench_dr_state_{zones}")
+        segment = DrStateSegment(path, zones, HVAC_FIELDS)
+        values = np.zeros(zones)
+        overrides = {field: values for field in HVAC_FIELDS}
+        start = time.perf_counter()
+        for _ in range(1_000):
+            segment.publish(1.0, True, None, None, overrides)
+        publish_us = (time.perf_counter() - start) * 1e3
+        segment.close()
+
+        writer = multiprocessing.get_context("spawn").Process(target=hammer, args=(path, zones, WRITE_SECONDS))
+        writer.start()
+        time.sleep(0.5)
+        reader = DrStateReader(path, HVAC_FIELDS)
+        reads = torn = 0
+        read_seconds = 0.0
+        while writer.is_alive():
+            start = time.perf_counter()
+            snapshot = reader.read()
+            read_seconds += time.perf_counter() - start
+            reads += 1
+            seen = np.concatenate([snapshot.overrides[field] for field in HVAC_FIELDS])
+            if not (np.all(seen == snapshot.payload) and snapshot.event_active == (int(snapshot.payload) % 2 == 0)):
+                torn += 1
+        writer.join()
+        print(
+            f"{zones:>6} {publish_us:>11.1f} {read_seconds / max(reads, 1) * 1e6:>8.1f} "
+            f"{reads:>8} {torn:>5} {reader.retries:>8}"
+        )
+        reader.close()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark of OpenADR pull vs push event delivery against a local VTN stand-in
+
+Time is compressed: the stand-in publishes EVENTS events at random times
+during RUN_SECONDS. The pull VEN polls every POLL_SECONDS, the push VEN
+only polls every HEALTH_POLL_SECONDS and gets events posted to its own
+endpoint. Reports are left out, they are the same in both modes.
+
+$ python bench_push_listener.py
+"""
+
+import time
+import random
+import asyncio
+
+import numpy as np
+from aiohttp import web, ClientSession, TCPConnector
+
+
+RUN_SECONDS = 20.0
+EVENTS = 10
+POLL_SECONDS = 2.0
+HEALTH_POLL_SECONDS = 10.0
+VTN_PORT = 18080
+VEN_PORT = 18081
+KEEPALIVE_SECONDS = 75.0
+
+# about the sizes of openleadr's signed messages
+POLL_BODY = b"<oadrPoll>" + b" " * 1500 + b"</oadrPoll>"
+EMPTY_BODY = b"<oadrResponse>" + b" " * 1500 + b"</oadrResponse>"
+EVENT_BODY = b"<oadrDistributeEvent>" + b" " * 4000 + b"</oadrDistributeEvent>"
+
+
+class VtnStandIn:
+    """
+    Answers polls with the oldest pending event, or posts each event to
+    `push_url` as soon as it is published
+    """
+    def __init__(self, push_url=None):
+        self.push_url = push_url
+        self.pending = []
+        self.requests = 0
+        self.bytes = 0
+        self.session = None
+
+    async def handle_poll(self, request):
+        self.requests += 1
+        self.bytes += len(await request.read())
+        headers = {}
+        body = EMPTY_BODY
+        if self.pending:
+            headers["x-published"] = repr(self.pending.pop(0))
+            body = EVENT_BODY
+        self.bytes += len(body)
+        return web.Response(body=body, headers=headers)
+
+    async def publish(self):
+        published = time.perf_counter()
+        if self.push_url is None:
+            self.pending.append(published)
+            return
+        self.requests += 1
+        self.bytes += len(EVENT_BODY)
+        async with self.session.post(
+            self.push_url, data=EVENT_BODY, headers={"x-published": repr(published)}
+        ) as response:
+            self.bytes += len(await response.read())
+
+
+def record(headers, latencies):
+    if "x-published" in headers:
+        latencies.append(time.perf_counter() - float(headers["x-published"]))
+
+
+async def poll_loop(session, interval, latencies, stop):
+    while not stop.is_set():
+        async with session.post(f"http://127.0.0.1:{VTN_PORT}/OadrPoll", data=POLL_BODY) as response:
+            await response.read()
+            record(response.headers, latencies)
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def start_site(routes, port):
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app, keepalive_timeout=KEEPALIVE_SECONDS, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def run_mode(push, rng):
+    latencies = []
+    vtn = VtnStandIn(f"http://127.0.0.1:{VEN_PORT}/EiEvent" if push else None)
+    runners = [await start_site([web.post("/OadrPoll", vtn.handle_poll)], VTN_PORT)]
+
+    if push:
+        async def handle_push(request):
+            await request.read()
+            record(request.headers, latencies)
+            return web.Response(body=EMPTY_BODY)
+        runners.append(await start_site([web.post("/EiEvent", handle_push)], VEN_PORT))
+
+    connector = TCPConnector(keepalive_timeout=KEEPALIVE_SECONDS)
+    async with ClientSession(connector=connector) as ven_session, ClientSession() as vtn_session:
+        vtn.session = vtn_session
+        stop = asyncio.Event()
+        interval = HEALTH_POLL_SECONDS if push else POLL_SECONDS
+        poller = asyncio.create_task(poll_loop(ven_session, interval, latencies, stop))
+
+        # events land in the first 80% of the run so pull mode can pick them all up
+        offsets = sorted(rng.uniform(0.0, 0.8 * RUN_SECONDS) for _ in range(EVENTS))
+        start = time.perf_counter()
+        for offset in offsets:
+            await asyncio.sleep(max(0.0, start + offset - time.perf_counter()))
+            await vtn.publish()
+        await asyncio.sleep(max(0.0, start + RUN_SECONDS - time.perf_counter()))
+
+        stop.set()
+        await poller
+    for runner in runners:
+        await runner.cleanup()
+    return vtn, np.array(latencies)
+
+
+async def main():
+    print(f"{'mode':>5} {'requests':>9} {'kB':>7} {'events':>7} {'mean ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for push in (False, True):
+        vtn, latencies = await run_mode(push, random.Random(0))
+        latencies_ms = latencies * 1e3 if len(latencies) else np.zeros(1)
+        print(
+            f"{'push' if push else 'pull':>5} {vtn.requests:>9} {vtn.bytes / 1e3:>7.1f} {len(latencies):>7} "
+            f"{latencies_ms.mean():>9.1f} {np.percentile(latencies_ms, 99):>9.1f} {latencies_ms.max():>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
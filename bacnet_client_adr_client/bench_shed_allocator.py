@@ -0,0 +1,48 @@
+"""
+Micro-benchmark for the kW target shed allocator
+
+$ python bench_shed_allocator.py
+"""
+
+import time
+
+import numpy as np
+
+from shed_allocator import setpoint_ladders, allocate_shed
+
+
+REPEATS = 20
+STEP_DEGREES = 0.5
+MAX_STEPS = 6
+
+
+def bench(zone_count, rng):
+    kw_per_degree = rng.uniform(0.2, 3.0, size=zone_count)
+    comfort_weight = rng.uniform(0.5, 2.0, size=zone_count)
+    available = rng.random(zone_count) > 0.2
+    step_kw, step_cost = setpoint_ladders(kw_per_degree, comfort_weight, STEP_DEGREES, MAX_STEPS)
+    # ask for half of what the zones could shed
+    target_kw = 0.5 * float(np.where(available[:, None], step_kw, 0.0).sum())
+
+    # warm up
+    allocate_shed(target_kw, step_kw, step_cost, available, STEP_DEGREES)
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        plan = allocate_shed(target_kw, step_kw, step_cost, available, STEP_DEGREES)
+    return (time.perf_counter() - start) / REPEATS, plan
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'zones':>8} {'allocate ms':>12} {'target kW':>10} {'planned kW':>11} {'zones shed':>11}")
+    for zone_count in (1, 10, 100, 1_000, 10_000, 100_000):
+        seconds, plan = bench(zone_count, rng)
+        print(
+            f"{zone_count:>8} {seconds * 1e3:>12.3f} {plan.target_kw:>10.1f} "
+            f"{plan.planned_kw:>11.1f} {int((plan.steps > 0).sum()):>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Benchmark for the RC thermal model fit and precool planner
+
+$ python bench_thermal_model.py
+"""
+
+import time
+
+import numpy as np
+
+from thermal_model import hvac_drive, fit_rc_models, plan_precool
+
+
+STEP_SECONDS = 300
+HISTORY_STEPS = 7 * 24 * 3600 // STEP_SECONDS
+
+
+def simulate_history(zone_count, rng):
+    # known models, a setpoint that steps every 4 hours and a daily outdoor swing
+    k_hvac = rng.uniform(0.1, 0.4, zone_count)
+    k_env = rng.uniform(0.005, 0.03, zone_count)
+    drift = rng.uniform(0.0, 0.05, zone_count)
+
+    steps = np.arange(HISTORY_STEPS)
+    setpoint = np.broadcast_to(np.where((steps // 48) % 2 == 0, 72.0, 76.0), (zone_count, HISTORY_STEPS))
+    outdoor = np.broadcast_to(85.0 + 10.0 * np.sin(steps / 288 * 2 * np.pi), (zone_count, HISTORY_STEPS))
+    mode = np.full((zone_count, HISTORY_STEPS), 4.0)
+    temp = np.empty((zone_count, HISTORY_STEPS))
+    temp[:, 0] = 72.0
+    for k in range(HISTORY_STEPS - 1):
+        drive = hvac_drive(temp[:, k], setpoint[:, k], mode[:, k])
+        temp[:, k + 1] = (
+            temp[:, k] + k_hvac * drive + k_env * (outdoor[:, k] - temp[:, k]) + drift
+            + rng.normal(0.0, 0.02, zone_count)
+        )
+    return temp, setpoint, mode, outdoor, k_hvac
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'zones':>6} {'fit ms':>8} {'plan ms':>8} {'k_hvac err':>11} {'zones precooled':>16}")
+    for zone_count in (10, 100, 500, 1_000):
+        temp, setpoint, mode, outdoor, k_hvac = simulate_history(zone_count, rng)
+
+        start = time.perf_counter()
+        models = fit_rc_models(temp, setpoint, mode, STEP_SECONDS, outdoor=outdoor)
+        fit_seconds = time.perf_counter() - start
+
+        now = time.time()
+        start = time.perf_counter()
+        plan = plan_precool(
+            models,
+            event_start=now + 3 * 3600,
+            event_seconds=4 * 3600,
+            current_temp=temp[:, -1],
+            base_setpoint=np.full(zone_count, 72.0),
+            mode=np.full(zone_count, 4.0),
+            event_adj=2.0,
+            max_offset=3.0,
+            offset_step=0.5,
+            lead_options=(0, 1800, 3600, 7200),
+            peak_weight=1.0,
+            offpeak_weight=0.4,
+            now=now,
+            outdoor=90.0,
+        )
+        plan_seconds = time.perf_counter() - start
+
+        print(
+            f"{zone_count:>6} {fit_seconds * 1e3:>8.1f} {plan_seconds * 1e3:>8.1f} "
+            f"{np.abs(models.k_hvac - k_hvac).max():>11.4f} {int((plan.offset != 0).sum()):>16}"
+        )
+
+
+if __name__ == "__main__":
+    main()
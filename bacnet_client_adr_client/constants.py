@@ -4,15 +4,92 @@ from bacpypes3.primitivedata import ObjectIdentifier
 
 VEN_NAME = "some_ven"
 VTN_URL = "https://some.adr.server/OpenADR2/Simple/2.0b"
+# every program the site is enrolled in runs as a VEN in this process, where
+# their events overlap the lower priority number wins, see ven_host.py
+VEN_PROGRAMS = [
+    {"ven_name": VEN_NAME, "vtn_url": VTN_URL, "priority": 0},
+]
 DEFAULT_PAYLOAD_SIGNAL = 0 # normal operations
 
+# OpenADR XML work runs in a thread pool, off the loop that runs BACnet
+VEN_XML_WORKERS = 2
+VEN_XML_MAX_PENDING = 4  # messages in or waiting for the pool before callers wait
+LOOP_LAG_SAMPLE_SECONDS = 0.1
+LOOP_LAG_WARN_MS = 5.0
+
+# VEN client certificate for mutual TLS with the VTN, and the CA that signs the VTN's
+VEN_CERT_PATH = None
+VEN_KEY_PATH = None
+VTN_CA_PATH = None
+VEN_TLS_KEEPALIVE_SECONDS = 75.0
+
+# OpenADR push mode, the VTN posts events to PUSH_TRANSPORT_ADDRESS instead of
+# waiting for a poll, polling is kept as a health check, see push_listener.py.
+# Needs VEN_CERT_PATH, VEN_KEY_PATH and VTN_CA_PATH, it is never served without mutual TLS
+PUSH_MODE_ENABLED = False
+PUSH_TRANSPORT_ADDRESS = "https://some.ven.host:8443/OpenADR2/Simple/2.0b"
+PUSH_LISTEN_HOST = "0.0.0.0"
+PUSH_LISTEN_PORT = 8443
+PUSH_HEALTH_POLL_SECONDS = 900
+
+# event loop and startup, see bootstrap.py
+USE_UVLOOP = True  # when installed, else the asyncio loop
+STARTUP_BUDGET_SECONDS = 5.0  # a warning is logged when a (re)start takes longer
+
 USE_DR_SERVER = True
 CLOUD_DR_SERVER_CHECK_SECONDS = 10
 
 BACNET_SERVER_API_UPDATE_INTERVAL = 2.0
+# memory mapped live DR state for local consumers, refreshed with the BACnet
+# server values, None turns it off, see dr_state_segment.py
+DR_STATE_SEGMENT_PATH = "/dev/shm/bacnet_adr_dr_state"
 ALGORITHM_RUN_FREQUENCY_SECONDS = 60.0
 BACNET_WRITE_PRIORITY = 3
 
+# adaptive per device timeouts and circuit breakers for BACnet requests
+BACNET_INITIAL_TIMEOUT_SECONDS = 3.0
+BACNET_MIN_TIMEOUT_SECONDS = 0.5
+BACNET_MAX_TIMEOUT_SECONDS = 10.0
+BACNET_BREAKER_FAILURE_THRESHOLD = 3
+BACNET_BREAKER_OPEN_SECONDS = 30.0
+BACNET_BREAKER_MAX_OPEN_SECONDS = 600.0
+
+# requests per second and burst per BACnet network for the request dispatcher,
+# remote MS/TP networks by network number, "ip" for the local BACnet/IP network
+BACNET_NETWORK_RATES = {"32": (5.0, 5), "ip": (50.0, 20)}
+BACNET_DEFAULT_NETWORK_RATE = 10.0
+BACNET_DEFAULT_NETWORK_BURST = 5
+
+# post event releases are spread over this window, with their own write
+# budget per network kept under the dispatcher rates above
+RELEASE_WINDOW_SECONDS = 300.0
+RELEASE_NETWORK_RATES = {"32": (1.0, 2), "ip": (10.0, 5)}
+RELEASE_DEFAULT_NETWORK_RATE = 2.0
+RELEASE_DEFAULT_NETWORK_BURST = 2
+
+# durable journal of ADR events and BACnet overrides for crash recovery
+EVENT_JOURNAL_PATH = "adr_event_journal.jsonl"
+EVENT_JOURNAL_FSYNC_BATCH = 8
+EVENT_JOURNAL_FSYNC_INTERVAL_SECONDS = 1.0
+# finished events kept for mv_baseline.py after the journal is compacted
+EVENT_HISTORY_PATH = "adr_event_history.jsonl"
+
+# occupancy engine fed by the CO2 stream, optional motion and schedule
+OCCUPANCY_ZONE = "trane-vav"
+OCCUPANCY_CO2_RISE_PPM_PER_MIN = 15.0
+OCCUPANCY_WINDOW_SAMPLES = 15
+OCCUPANCY_MIN_STATE_SECONDS = 300.0
+OCCUPANCY_MOTION_HOLD_SECONDS = 900.0
+OCCUPANCY_SCHEDULE_HOURS = (7, 18)  # local hours the zone is scheduled occupied
+TRANE_MOTION_READ_POINT = None  # e.g. ObjectIdentifier("binary-input,3") if the zone has one
+
+# background task supervisor, crashed loops restart with backoff between these
+TASK_RESTART_MIN_SECONDS = 1.0
+TASK_RESTART_MAX_SECONDS = 60.0
+
+# how often priority arrays are read back and compared to the override ledger
+OVERRIDE_RECONCILE_INTERVAL_SECONDS = 300.0
+
 BACNET_PRESENT_VALUE_PROP_IDENTIFIER = "present-value"
 BACNET_PROPERTY_ARRAY_INDEX = None
 
@@ -20,6 +97,24 @@ BACNET_PROPERTY_ARRAY_INDEX = None
 MECHO_ADDRESS = Address("10.7.6.161/24:47820")
 TRANE_ADDRESS = Address("32:18")
 
+# sharded runtime (python shard_runtime.py), one worker process per shard with its
+# own BACnet application, devices and journal, the coordinator owns the VENs and
+# event store and streams it to the workers over SHARD_STATE_SOCKET
+SHARDS = [
+    {
+        "name": "shard-1",
+        "instance": 3056673,
+        "address": "10.7.6.201/24:47821",
+        "trane_address": "32:18",
+        "mecho_address": "10.7.6.161/24:47820",
+        "cpu": None,  # CPU core to pin the worker to
+    },
+]
+SHARD_STATE_SOCKET = "/tmp/bacnet_adr_dr_state.sock"
+SHARD_STATE_INTERVAL_SECONDS = 5.0
+SHARD_COORDINATOR_JOURNAL_PATH = "adr_event_journal_coordinator.jsonl"
+SHARD_JOURNAL_PATH = "adr_event_journal_{name}.jsonl"
+
 # writes only to mecho object_identifiers
 MECHO_DR_WRITE_POINT = ObjectIdentifier("analog-value,99")
 MECHO_OCC_WRITE_POINT = ObjectIdentifier("analog-value,98")
@@ -33,3 +128,54 @@ TRANE_CO2_PPM_READ_POINT = ObjectIdentifier("analog-input,8")
 # HVAC writes object_identifiers
 TRANE_AIR_FLOW_STP_WRITE_POINT = ObjectIdentifier("analog-value,13")
 TRANE_COOL_VALVE_WRITE_POINT = ObjectIdentifier("analog-output,2")
+
+# HVAC override point for each decision kernel output field
+HVAC_WRITE_POINTS = {
+    "setpoint": TRANE_TEMP_SETPOINT_READ_WRITE_POINT,
+    "airflow": TRANE_AIR_FLOW_STP_WRITE_POINT,
+    "valve": TRANE_COOL_VALVE_WRITE_POINT,
+}
+
+# kW target shed allocator, see shed_allocator.py
+SHED_PAYLOAD_MODE = "simple"  # "simple": signal_payload is a SIMPLE level, "kw": a kW reduction
+SHED_SIMPLE_LEVEL_FRACTIONS = {0: 0.0, 1: 0.25, 2: 0.5, 3: 1.0}  # of the zones' max shed
+SHED_SETPOINT_STEP_DEGREES = 0.5
+SHED_MAX_SETPOINT_STEPS = 6
+# estimated kW shed per degree of setpoint offset and comfort weight, one per zone
+SHED_ZONE_KW_PER_DEGREE = [1.5]
+SHED_ZONE_COMFORT_WEIGHT = [1.0]
+
+# RC thermal model and precool / preheat planner, see thermal_model.py
+TRANE_ZONE_TEMP_READ_POINT = None  # e.g. ObjectIdentifier("analog-input,1"), enables precooling
+THERMAL_STEP_SECONDS = 300
+THERMAL_HISTORY_SECONDS = 7 * 24 * 3600
+THERMAL_MIN_SAMPLES = 48  # grid steps with every channel present, 4 hours at 5 minutes
+PRECOOL_MAX_OFFSET_DEGREES = 3.0
+PRECOOL_OFFSET_STEP_DEGREES = 0.5
+PRECOOL_LEAD_OPTIONS_SECONDS = (0, 1800, 3600, 7200)
+# relative cost of HVAC effort before vs during the event
+PRECOOL_PEAK_WEIGHT = 1.0
+PRECOOL_OFFPEAK_WEIGHT = 0.4
+
+# how old a cached point value may be before a read goes back to the device
+POINT_CACHE_DEFAULT_MAX_AGE_SECONDS = 5.0
+POINT_CACHE_MAX_AGE_SECONDS = {
+    TRANE_TEMP_SETPOINT_READ_WRITE_POINT: 30.0,
+    TRANE_HVAC_MODE_READ_POINT: 30.0,
+    TRANE_CO2_PPM_READ_POINT: 10.0,
+}
+
+# adaptive poll intervals, each point is read about as often as it takes to move by its deadband
+POLL_MIN_INTERVAL_SECONDS = 15.0
+POLL_MAX_INTERVAL_SECONDS = 300.0
+POLL_DR_INTERVAL_SCALE = 0.25  # DR relevant points poll this much faster during an event
+POLL_DR_MIN_INTERVAL_SECONDS = 5.0
+POLL_RATE_SMOOTHING = 0.3
+# point name: (deadband, DR relevance 0.0 to 1.0)
+POLL_POINTS = {
+    "setpoint": (0.5, 1.0),
+    "mode": (1.0, 0.5),
+    "co2": (25.0, 1.0),
+    "motion": (1.0, 1.0),
+    "zone_temp": (0.25, 1.0),
+}
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+# Trane VAV hvac mode multi-state values
+TRANE_MODE_HEATING = 2.0
+TRANE_MODE_COOLING = 4.0
+
+# Mecho hvac mode analog values
+MECHO_MODE_HEATING = 1.0
+MECHO_MODE_COOLING = 0.0
+
+# HVAC override fields the kernel produces targets for, NaN is a BACnet release
+HVAC_FIELDS = ("setpoint", "airflow", "valve")
+
+
+class ZoneTargets:
+    """
+    Arrays of target writes for every zone, one element per zone.
+    A NaN in an HVAC field means release that point ("null").
+    """
+    def __init__(self, setpoint, airflow, valve, mecho_dr, mecho_occ, mecho_mode):
+        self.setpoint = setpoint
+        self.airflow = airflow
+        self.valve = valve
+        self.mecho_dr = mecho_dr
+        self.mecho_occ = mecho_occ
+        self.mecho_mode = mecho_mode
+
+    def hvac(self, field):
+        return getattr(self, field)
+
+
+def decide(
+    mode,
+    occupied,
+    base_setpoint,
+    payload,
+    dr_active,
+    setpoint_adj,
+    previous_mecho_mode,
+):
+    """
+    Pure DR decision for all zones in one NumPy pass, no I/O and no
+    state is touched.
+
+    During a DR event an occupied zone gets its setpoint nudged by
+    `setpoint_adj` (down when heating, up when cooling) with airflow and
+    valve released, and an unoccupied zone gets its setpoint released
+    with airflow and valve closed. Outside of an event every HVAC point
+    is released. Mecho gets the DR payload, occupancy as 1.0/0.0 and the
+    hvac mode, keeping the previous Mecho mode for unknown Trane modes.
+    `setpoint_adj` is a scalar or one value per zone (see shed_allocator),
+    a NaN adjustment releases that zone's setpoint.
+    """
+    mode = np.asarray(mode, dtype=float)
+    occupied = np.asarray(occupied, dtype=bool)
+    base_setpoint = np.asarray(base_setpoint, dtype=float)
+    payload = np.broadcast_to(np.asarray(payload, dtype=float), mode.shape)
+    dr_active = np.broadcast_to(np.asarray(dr_active, dtype=bool), mode.shape)
+    setpoint_adj = np.asarray(setpoint_adj, dtype=float)
+    previous_mecho_mode = np.asarray(previous_mecho_mode, dtype=float)
+
+    heating = mode == TRANE_MODE_HEATING
+    cooling = mode == TRANE_MODE_COOLING
+
+    adjustment = np.where(heating, -setpoint_adj, np.where(cooling, setpoint_adj, 0.0))
+
+    shed_occupied = dr_active & occupied
+    shed_unoccupied = dr_active & ~occupied
+
+    setpoint = np.where(shed_occupied, base_setpoint + adjustment, np.nan)
+    airflow = np.where(shed_unoccupied, 0.0, np.nan)
+    valve = np.where(shed_unoccupied, 0.0, np.nan)
+
+    mecho_mode = np.where(
+        heating, MECHO_MODE_HEATING, np.where(cooling, MECHO_MODE_COOLING, previous_mecho_mode)
+    )
+
+    return ZoneTargets(
+        setpoint=setpoint,
+        airflow=airflow,
+        valve=valve,
+        mecho_dr=payload.copy(),
+        mecho_occ=occupied.astype(float),
+        mecho_mode=mecho_mode,
+    )
+
+
+def changed_zones(previous, target):
+    """
+    Indexes of zones whose target differs from what was last written,
+    two NaNs (released and still released) count as unchanged
+    """
+    previous = np.asarray(previous, dtype=float)
+    target = np.asarray(target, dtype=float)
+    same = (previous == target) | (np.isnan(previous) & np.isnan(target))
+    return np.flatnonzero(~same)
+
+
+def released_state(zone_count):
+    """
+    Last written state for zones with nothing overridden
+    """
+    return {field: np.full(zone_count, np.nan) for field in HVAC_FIELDS}
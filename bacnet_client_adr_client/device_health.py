@@ -0,0 +1,193 @@
+from bacpypes3.apdu import AbortPDU, AbortReason, ErrorRejectAbortNack
+
+import time
+import asyncio
+import logging
+from enum import Enum
+
+
+# abort reasons that mean the device never answered, not that it refused
+NO_RESPONSE_REASONS = {
+    getattr(AbortReason, name)
+    for name in ("noResponse", "tsmTimeout", "applicationExceededReplyTime")
+    if hasattr(AbortReason, name)
+}
+
+
+class DeviceUnavailable(Exception):
+    """
+    Raised right away for requests to a device whose circuit breaker is open
+    """
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class RttEstimator:
+    """
+    SRTT/RTTVAR round trip estimate per device, the same smoothing TCP
+    uses (RFC 6298), giving a timeout of srtt + 4 * rttvar
+    """
+    def __init__(self, initial_timeout=3.0, min_timeout=0.5, max_timeout=10.0):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.srtt = None
+        self.rttvar = None
+        self.timeout = initial_timeout
+
+    def sample(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2.0
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.timeout = min(max(self.srtt + 4.0 * self.rttvar, self.min_timeout), self.max_timeout)
+
+    def backoff(self):
+        # no sample from a timed out request, just widen the timeout
+        self.timeout = min(self.timeout * 2.0, self.max_timeout)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` timeouts in a row so requests fail
+    fast, then lets a single half-open probe through once `open_seconds`
+    have passed. A failed probe doubles the wait up to `max_open_seconds`.
+    """
+    def __init__(self, failure_threshold=3, open_seconds=30.0, max_open_seconds=600.0):
+        self.failure_threshold = failure_threshold
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.open_seconds = open_seconds
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow_request(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.state == BreakerState.CLOSED:
+            return True
+        if self.state == BreakerState.OPEN and now - self.opened_at >= self.open_seconds:
+            self.state = BreakerState.HALF_OPEN
+            self.probe_in_flight = False
+        if self.state == BreakerState.HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.open_seconds = self.base_open_seconds
+        self.probe_in_flight = False
+
+    def record_failure(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.failures += 1
+        if self.state == BreakerState.HALF_OPEN:
+            self.open_seconds = min(self.open_seconds * 2.0, self.max_open_seconds)
+            self._open(now)
+        elif self.failures >= self.failure_threshold:
+            self._open(now)
+
+    def _open(self, now):
+        self.state = BreakerState.OPEN
+        self.opened_at = now
+        self.probe_in_flight = False
+
+
+class DeviceHealth:
+    """
+    Adaptive timeout and circuit breaker per BACnet device address
+    wrapped around every request the app makes to that device
+    """
+    def __init__(
+        self,
+        initial_timeout=3.0,
+        min_timeout=0.5,
+        max_timeout=10.0,
+        failure_threshold=3,
+        open_seconds=30.0,
+        max_open_seconds=600.0,
+    ):
+        self.initial_timeout = initial_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.devices = {}
+
+    def device(self, address):
+        address = str(address)
+        if address not in self.devices:
+            self.devices[address] = (
+                RttEstimator(self.initial_timeout, self.min_timeout, self.max_timeout),
+                CircuitBreaker(self.failure_threshold, self.open_seconds, self.max_open_seconds),
+            )
+        return self.devices[address]
+
+    async def call(self, address, request_factory):
+        """
+        Run one request to a device, `request_factory` returns the
+        coroutine to await, e.g. lambda: app.read_property(...)
+        """
+        estimator, breaker = self.device(address)
+        if not breaker.allow_request():
+            raise DeviceUnavailable(f"{address} circuit open, skipping request")
+
+        start = time.monotonic()
+        try:
+            result = await asyncio.wait_for(request_factory(), estimator.timeout)
+        except asyncio.TimeoutError:
+            self._failed(address, estimator, breaker)
+            raise
+        except AbortPDU as err:
+            if err.apduAbortRejectReason in NO_RESPONSE_REASONS:
+                self._failed(address, estimator, breaker)
+            else:
+                # the device answered, it is alive even if it refused
+                self._answered(estimator, breaker, start)
+            raise
+        except ErrorRejectAbortNack:
+            # errors and rejects still came back from the device
+            self._answered(estimator, breaker, start)
+            raise
+        except BaseException:
+            # local failure or cancellation says nothing about the device
+            breaker.probe_in_flight = False
+            raise
+
+        self._answered(estimator, breaker, start)
+        return result
+
+    def _answered(self, estimator, breaker, start):
+        if breaker.state != BreakerState.CLOSED:
+            logging.info(" Device answered half-open probe, closing circuit")
+        estimator.sample(time.monotonic() - start)
+        breaker.record_success()
+
+    def _failed(self, address, estimator, breaker):
+        estimator.backoff()
+        was_open = breaker.state
+        breaker.record_failure()
+        if breaker.state == BreakerState.OPEN and was_open != BreakerState.OPEN:
+            logging.warning(
+                f" Device {address} not responding, circuit open for {breaker.open_seconds:.0f}s"
+            )
+
+    def status(self):
+        return {
+            address: {
+                "state": breaker.state.value,
+                "srtt": estimator.srtt,
+                "timeout": estimator.timeout,
+                "failures": breaker.failures,
+            }
+            for address, (estimator, breaker) in self.devices.items()
+        }
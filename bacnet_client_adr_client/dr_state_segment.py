@@ -0,0 +1,174 @@
+"""
+Live DR state in a memory mapped segment for local consumers
+
+The gateway publishes its DR payload, whether an event is active, the
+next event's start / end and the override written per zone into a
+fixed layout file (on /dev/shm by default). Any number of local
+processes (analytics, a dashboard, a second BACnet server) map the same
+file and read it without a network round trip or polling the BACnet
+`dr_signal` object.
+
+Consistency is a seqlock: the writer makes the sequence number odd,
+writes the body, then makes it even again. A reader copies the body
+between two reads of the sequence number and retries if they differ or
+are odd, so it never sees a half written state and never blocks the
+writer.
+"""
+
+import os
+import mmap
+import time
+
+import numpy as np
+
+MAGIC = b"DRSS"
+LAYOUT_VERSION = 1
+
+HEADER = np.dtype([
+    ("magic", "S4"),
+    ("layout", "<u4"),
+    ("seq", "<u8"),
+    ("zones", "<u4"),
+    ("fields", "<u4"),
+    ("payload", "<f8"),
+    ("event_active", "<u1"),
+    ("pad", "V7"),
+    ("next_start", "<f8"),
+    ("next_end", "<f8"),
+    ("published", "<f8"),
+])
+
+
+def segment_size(zones, fields):
+    return HEADER.itemsize + 8 * zones * fields
+
+
+def _map(path, size, writable):
+    flags = os.O_RDWR | os.O_CREAT if writable else os.O_RDONLY
+    fd = os.open(path, flags, 0o644)
+    try:
+        if writable:
+            os.ftruncate(fd, size)
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+        return mmap.mmap(fd, size, access=access)
+    finally:
+        os.close(fd)
+
+
+class DrStateSnapshot:
+    def __init__(self, seq, payload, event_active, next_start, next_end, published, overrides):
+        self.seq = seq
+        self.payload = payload
+        self.event_active = event_active
+        # epoch seconds, NaN when no event is scheduled
+        self.next_start = next_start
+        self.next_end = next_end
+        self.published = published
+        # {field: array per zone}, NaN means released
+        self.overrides = overrides
+
+    def __repr__(self):
+        return (
+            f"DrStateSnapshot(seq={self.seq}, payload={self.payload}, "
+            f"event_active={self.event_active}, next_start={self.next_start}, "
+            f"next_end={self.next_end})"
+        )
+
+
+class DrStateSegment:
+    """
+    Writer side, owned by the gateway. `fields` are the override
+    fields (decision_kernel.HVAC_FIELDS), each with one value per zone.
+    """
+    def __init__(self, path, zones, fields):
+        self.path = path
+        self.fields = tuple(fields)
+        self.mm = _map(path, segment_size(zones, len(self.fields)), writable=True)
+        self.header = np.ndarray((), dtype=HEADER, buffer=self.mm)
+        self.body = np.ndarray(
+            (len(self.fields), zones), dtype="<f8", buffer=self.mm, offset=HEADER.itemsize
+        )
+        self.header["seq"] = 0
+        self.header["magic"] = MAGIC
+        self.header["layout"] = LAYOUT_VERSION
+        self.header["zones"] = zones
+        self.header["fields"] = len(self.fields)
+        self.body[:] = np.nan
+        self.publish(float("nan"), False, None, None, {})
+
+    def publish(self, payload, event_active, next_start, next_end, overrides):
+        """
+        Write one state, `next_start` / `next_end` are aware datetimes or
+        None, `overrides` is {field: array per zone}
+        """
+        header = self.header
+        seq = int(header["seq"])
+        header["seq"] = seq + 1  # odd, readers retry
+        header["payload"] = payload
+        header["event_active"] = bool(event_active)
+        header["next_start"] = next_start.timestamp() if next_start is not None else np.nan
+        header["next_end"] = next_end.timestamp() if next_end is not None else np.nan
+        header["published"] = time.time()
+        for row, field in enumerate(self.fields):
+            if field in overrides:
+                self.body[row] = overrides[field]
+        header["seq"] = seq + 2
+
+    def close(self):
+        del self.header, self.body
+        self.mm.close()
+
+
+class DrStateReader:
+    """
+    Reader side, for any local process, `fields` as the writer's.
+    read() returns a consistent DrStateSnapshot, view() the live arrays
+    without copying (which may change under the caller, check `seq`
+    before and after if it matters).
+    """
+    def __init__(self, path, fields):
+        self.fields = tuple(fields)
+        with open(path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+        self.mm = _map(path, size, writable=False)
+        self.header = np.ndarray((), dtype=HEADER, buffer=self.mm)
+        if bytes(self.header["magic"]) != MAGIC or int(self.header["layout"]) != LAYOUT_VERSION:
+            raise ValueError(f"{path} is not a DR state segment of layout {LAYOUT_VERSION}")
+        self.zones = int(self.header["zones"])
+        if int(self.header["fields"]) != len(self.fields):
+            raise ValueError(f"{path} holds {int(self.header['fields'])} override fields, not {len(self.fields)}")
+        self.body = np.ndarray(
+            (len(self.fields), self.zones), dtype="<f8", buffer=self.mm, offset=HEADER.itemsize
+        )
+        self.retries = 0
+
+    def view(self):
+        return self.header, self.body
+
+    def read(self, max_tries=100_000):
+        for _ in range(max_tries):
+            seq = int(self.header["seq"])
+            if seq & 1:
+                # mid write, let the writer finish
+                self.retries += 1
+                time.sleep(0)
+                continue
+            header = self.header.copy()
+            body = self.body.copy()
+            if int(self.header["seq"]) != seq:
+                self.retries += 1
+                continue
+            return DrStateSnapshot(
+                seq=seq,
+                payload=float(header["payload"]),
+                event_active=bool(header["event_active"]),
+                next_start=float(header["next_start"]),
+                next_end=float(header["next_end"]),
+                published=float(header["published"]),
+                overrides={field: body[row] for row, field in enumerate(self.fields)},
+            )
+        raise TimeoutError("DR state segment kept changing while being read")
+
+    def close(self):
+        del self.header, self.body
+        self.mm.close()
@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import asyncio
+import logging
+from enum import Enum
+from datetime import datetime
+
+
+class JournalRecord(Enum):
+    """
+    Record types written to the append only event journal
+    """
+    EVENT = "event"
+    EVENT_END = "event_end"
+    EVENT_CANCEL = "event_cancel"
+    OVERRIDE = "override"
+    RELEASE = "release"
+
+
+def override_key(device_address, object_identifier, property_identifier):
+    """
+    Key used to track one BACnet point override in the journal
+    """
+    return f"{device_address}|{object_identifier}|{property_identifier}"
+
+
+class JournalState:
+    """
+    Result of replaying the journal, future events and
+    overrides that were written but never released
+    """
+    def __init__(self):
+        self.events = {}
+        self.overrides = {}
+        self.records = 0
+
+
+class EventJournal:
+    """
+    Append only JSON lines journal of received ADR events,
+    applied BACnet overrides and releases. Every append is flushed to
+    the OS right away and fsync'd in batches so a burst of writes
+    costs one disk sync instead of one per record.
+    """
+    def __init__(self, path, fsync_batch=8, fsync_interval=1.0, history_path=None):
+        self.path = path
+        self.history_path = history_path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+        self._sync_handle = None
+        self._live_overrides = {}
+        self._repair_tail()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _repair_tail(self):
+        # a crash mid append leaves a torn line, terminate it so the
+        # next record starts on a fresh line and replay can skip it
+        try:
+            with open(self.path, "rb+") as file:
+                file.seek(0, os.SEEK_END)
+                if file.tell() == 0:
+                    return
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    file.write(b"\n")
+        except FileNotFoundError:
+            pass
+
+    def append(self, record_type, durable=False, **fields):
+        record = {"ts": time.time(), "type": record_type.value}
+        record.update(fields)
+        self._file.write(json.dumps(record, default=self._encode) + "\n")
+        self._file.flush()
+        self._pending += 1
+
+        if (
+            durable
+            or self._pending >= self.fsync_batch
+            or time.monotonic() - self._last_fsync >= self.fsync_interval
+        ):
+            self.sync()
+        else:
+            self._schedule_sync()
+
+    def sync(self):
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+        if not self._pending:
+            return
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+
+    def _schedule_sync(self):
+        # make sure a lone record does not sit unsynced waiting for the batch
+        if self._sync_handle is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.sync()
+            return
+        self._sync_handle = loop.call_later(self.fsync_interval, self.sync)
+
+    def record_event(self, event_id, start, end, payload, rank=None):
+        # the merge rank goes along, a recovered event must keep its place
+        self.append(
+            JournalRecord.EVENT,
+            durable=True,
+            event_id=event_id,
+            start=start,
+            end=end,
+            payload=payload,
+            rank=rank,
+        )
+
+    def record_event_end(self, event_id, event=None):
+        self.append(JournalRecord.EVENT_END, event_id=event_id)
+        if event is not None and self.history_path:
+            self.archive_event(event_id, event)
+
+    def archive_event(self, event_id, event):
+        """
+        Compaction drops ended events from the journal, keep a copy of
+        each finished event for measurement and verification
+        """
+        record = {
+            "ts": time.time(),
+            "type": JournalRecord.EVENT.value,
+            "event_id": event_id,
+            "start": event["start"],
+            "end": event["end"],
+            "payload": event["payload"],
+        }
+        with open(self.history_path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(record, default=self._encode) + "\n")
+
+    def record_event_cancel(self, event_id):
+        self.append(JournalRecord.EVENT_CANCEL, durable=True, event_id=event_id)
+
+    def record_override(self, device_address, object_identifier, property_identifier, value, priority):
+        # written before the BACnet write so a crash mid write still gets released
+        key = override_key(device_address, object_identifier, property_identifier)
+        if self._live_overrides.get(key) == (value, priority):
+            # same override rewritten every algorithm cycle, nothing new to journal
+            return
+        self._live_overrides[key] = (value, priority)
+        self.append(
+            JournalRecord.OVERRIDE,
+            durable=True,
+            address=str(device_address),
+            object_identifier=str(object_identifier),
+            property_identifier=property_identifier,
+            value=value,
+            priority=priority,
+        )
+
+    def record_release(self, device_address, object_identifier, property_identifier, priority):
+        key = override_key(device_address, object_identifier, property_identifier)
+        self._live_overrides.pop(key, None)
+        self.append(
+            JournalRecord.RELEASE,
+            address=str(device_address),
+            object_identifier=str(object_identifier),
+            property_identifier=property_identifier,
+            priority=priority,
+        )
+
+    def replay(self):
+        """
+        Read the journal front to back and fold it into a JournalState.
+        A torn last line from a crash mid append is skipped.
+        """
+        state = JournalState()
+        self._file.flush()
+
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logging.warning(" Skipping unreadable event journal line")
+                    continue
+
+                state.records += 1
+                self._apply(state, record)
+
+        return state
+
+    def _apply(self, state, record):
+        record_type = record.get("type")
+        event_id = record.get("event_id")
+
+        if record_type == JournalRecord.EVENT.value:
+            state.events[event_id] = {
+                "start": datetime.fromisoformat(record["start"]),
+                "end": datetime.fromisoformat(record["end"]),
+                "payload": record["payload"],
+            }
+            if record.get("rank") is not None:
+                state.events[event_id]["rank"] = tuple(record["rank"])
+        elif record_type in (JournalRecord.EVENT_END.value, JournalRecord.EVENT_CANCEL.value):
+            state.events.pop(event_id, None)
+        elif record_type == JournalRecord.OVERRIDE.value:
+            key = override_key(
+                record["address"], record["object_identifier"], record["property_identifier"]
+            )
+            state.overrides[key] = {
+                "address": record["address"],
+                "object_identifier": record["object_identifier"],
+                "property_identifier": record["property_identifier"],
+                "value": record["value"],
+                "priority": record["priority"],
+            }
+        elif record_type == JournalRecord.RELEASE.value:
+            key = override_key(
+                record["address"], record["object_identifier"], record["property_identifier"]
+            )
+            state.overrides.pop(key, None)
+
+    def compact(self, events, overrides):
+        """
+        Rewrite the journal with only the live events and overrides
+        so replay time stays flat no matter how long the gateway runs.
+        """
+        tmp_path = self.path + ".tmp"
+        now = time.time()
+
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            for event_id, event in events.items():
+                record = {
+                    "ts": now,
+                    "type": JournalRecord.EVENT.value,
+                    "event_id": event_id,
+                    "start": event["start"],
+                    "end": event["end"],
+                    "payload": event["payload"],
+                    "rank": event.get("rank"),
+                }
+                file.write(json.dumps(record, default=self._encode) + "\n")
+            for override in overrides.values():
+                record = {"ts": now, "type": JournalRecord.OVERRIDE.value}
+                record.update(override)
+                file.write(json.dumps(record, default=self._encode) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+        self.sync()
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._fsync_dir()
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._live_overrides = {
+            key: (override["value"], override["priority"])
+            for key, override in overrides.items()
+        }
+
+    def _fsync_dir(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+    @staticmethod
+    def _encode(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+        return str(value)
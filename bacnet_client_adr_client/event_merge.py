@@ -0,0 +1,75 @@
+"""
+Merging events of several programs into one event store by priority
+
+Where two events overlap, the lower rank (program priority, then the
+event's own OpenADR priority) holds the overlap and the other event is
+trimmed around it.
+"""
+
+import math
+
+# events journaled before ranks were recorded, any new event outranks them
+LOWEST_RANK = (math.inf, math.inf)
+
+
+def event_rank(program_priority, event):
+    """
+    Rank of an openleadr event dict, lower wins. OpenADR priority 1 is
+    the highest and 0 means none, which sorts last.
+    """
+    priority = event["event_descriptor"].get("priority") or math.inf
+    return (program_priority, priority)
+
+
+def subtract(pieces, start, end):
+    """
+    (start, end) pieces with the span start to end cut out
+    """
+    left = []
+    for piece_start, piece_end in pieces:
+        if piece_end <= start or piece_start >= end:
+            left.append((piece_start, piece_end))
+            continue
+        if piece_start < start:
+            left.append((piece_start, start))
+        if piece_end > end:
+            left.append((end, piece_end))
+    return left
+
+
+def is_piece_of(held_id, event_id):
+    """
+    Whether `held_id` is `event_id` itself or one of its id/n pieces
+    """
+    return held_id == event_id or held_id.startswith(f"{event_id}/")
+
+
+def merge_event(events, start, end, rank, event_id=None):
+    """
+    Fit a new event from start to end into `events` (id: dict with
+    start, end and rank). Returns (pieces, trimmed), the (start, end)
+    pieces the new event keeps and {id: pieces left} for each held
+    event of a worse rank it overlaps, an empty list drops that event.
+    At equal rank the event already held keeps the overlap. Held pieces
+    of `event_id` are the same event (a redelivery), not a competitor.
+    """
+    others = {
+        held_id: event
+        for held_id, event in events.items()
+        if event_id is None or not is_piece_of(held_id, event_id)
+    }
+    pieces = [(start, end)]
+    for event in others.values():
+        if event.get("rank", LOWEST_RANK) <= rank:
+            pieces = subtract(pieces, event["start"], event["end"])
+
+    trimmed = {}
+    for held_id, event in others.items():
+        if event.get("rank", LOWEST_RANK) <= rank:
+            continue
+        left = [(event["start"], event["end"])]
+        for piece_start, piece_end in pieces:
+            left = subtract(left, piece_start, piece_end)
+        if left != [(event["start"], event["end"])]:
+            trimmed[held_id] = left
+    return pieces, trimmed
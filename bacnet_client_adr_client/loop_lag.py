@@ -0,0 +1,40 @@
+import asyncio
+import logging
+
+_log = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes a sleeper, the delay every
+    BACnet timer on the loop sees too
+    """
+    def __init__(self, interval=0.1, warn_ms=5.0, window=600):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.window = window
+        self.samples = []
+        self.max_ms = 0.0
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - start - self.interval) * 1000.0)
+            self.samples.append(lag_ms)
+            if len(self.samples) > self.window:
+                del self.samples[0]
+            self.max_ms = max(self.max_ms, lag_ms)
+            if lag_ms > self.warn_ms:
+                _log.warning(f" Event loop lag {lag_ms:.1f} ms")
+
+    def stats(self):
+        if not self.samples:
+            return {"p50_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "p50_ms": round(ordered[len(ordered) // 2], 2),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+            "max_ms": round(self.max_ms, 2),
+        }
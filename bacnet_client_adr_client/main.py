@@ -1,15 +1,32 @@
 
+from bootstrap import startup
+
 from bacpypes3.argparse import SimpleArgumentParser
 from bacpypes3.local.analog import AnalogValueObject
 from bacpypes3.local.binary import BinaryValueObject
 from bacpypes3.app import Application
 
+import time
 import asyncio
+import functools
 import logging
+from datetime import datetime
+
+import numpy as np
 
 from constants import *
 from utils import Utils
 from utils import CommandableAnalogValueObject
+from reconcile import PriorityArrayReconciler
+from occupancy import OccupancyDetector
+from poll_planner import PollPlanner
+from decision_kernel import HVAC_FIELDS, decide, changed_zones, released_state
+from shed_allocator import plan_setpoint_shed
+from thermal_model import ZoneHistory, fit_rc_models, plan_precool
+from request_dispatcher import RequestClass
+from dr_state_segment import DrStateSegment
+
+startup.mark("imports")
 
 # python main.py --name Slipstream --instance 3056672 --address 10.7.6.201/24:47820
 
@@ -19,10 +36,23 @@ logging.basicConfig(level=logging.INFO)
 _info = 0
 
 class DrApplication(Utils):
-    def __init__(self, args, dr_signal, power_level, app_status):
+    def __init__(
+        self,
+        args,
+        dr_signal,
+        power_level,
+        app_status,
+        ven=True,
+        journal_path=EVENT_JOURNAL_PATH,
+        history_path=EVENT_HISTORY_PATH,
+        trane_address=TRANE_ADDRESS,
+        mecho_address=MECHO_ADDRESS,
+        dr_state_path=DR_STATE_SEGMENT_PATH,
+    ):
+        self.trane_address = trane_address
+        self.mecho_address = mecho_address
         self.hvac_setpoint_adj = 1.5
         self.hvac_needs_to_be_released = False
-        self.room_setpoint_written = False
         self.hvac_setpoint_value = 70
         self.hvac_mode_trane = 2
 
@@ -32,10 +62,41 @@ class DrApplication(Utils):
         self.room_is_occupied = False
         self.occ_to_write = 0.0
 
-        self.dr_event_event_first_sweep_done = False
-        self.hvac_mode_or_room_occ_has_changed = False
+        # last HVAC value written per zone and field, NaN means released
+        self.hvac_written = released_state(1)
+
+        # hysteresis over the CO2 stream, emits only on state changes
+        self.occupancy = OccupancyDetector(
+            [OCCUPANCY_ZONE],
+            on_ppm=self.ppm_for_occ,
+            dead_band=self.ppm_dead_band,
+            rise_ppm_per_min=OCCUPANCY_CO2_RISE_PPM_PER_MIN,
+            window=OCCUPANCY_WINDOW_SAMPLES,
+            min_state_seconds=OCCUPANCY_MIN_STATE_SECONDS,
+            motion_hold=OCCUPANCY_MOTION_HOLD_SECONDS,
+        )
+
+        # live DR state for other local processes, see dr_state_segment.py
+        self.dr_state = None
+        if dr_state_path:
+            try:
+                self.dr_state = DrStateSegment(dr_state_path, 1, HVAC_FIELDS)
+            except OSError as e:
+                logging.error(f" Could not map DR state segment {dr_state_path}: {e}")
+
+        # zone temperature history the RC thermal model is fit from
+        self.zone_history = ZoneHistory(1)
+
+        # per point poll intervals from how fast each point has been changing
+        self.poll_planner = PollPlanner(
+            min_interval=POLL_MIN_INTERVAL_SECONDS,
+            max_interval=POLL_MAX_INTERVAL_SECONDS,
+            dr_scale=POLL_DR_INTERVAL_SCALE,
+            dr_min_interval=POLL_DR_MIN_INTERVAL_SECONDS,
+            smoothing=POLL_RATE_SMOOTHING,
+        )
         
-        super().__init__()
+        super().__init__(ven=ven, journal_path=journal_path, history_path=history_path)
 
         # embed the bacpypes BACnet application
         self.app = Application.from_args(args)
@@ -47,328 +108,430 @@ class DrApplication(Utils):
         self.app.add_object(power_level)
         self.app_status = app_status
         self.app.add_object(app_status)
+
+        # confirms priority arrays match what the app thinks it wrote
+        self.override_reconciler = PriorityArrayReconciler(
+            self.app,
+            self.override_ledger,
+            self.do_write_property_task,
+            journal=self.journal,
+            request=self.bacnet_request,
+        )
         
-        # Start the openleadr client
-        asyncio.create_task(self.client.run())
+        # Replay the event journal then start the openleadr client
+        self.tasks.spawn("ven", self.start_ven)
 
-        # create a task to update the values
-        asyncio.create_task(self.update_bacnet_server_values())
-        asyncio.create_task(self.do_write_values_to_mecho())
+        # long running loops, restarted with backoff if they crash
+        self.tasks.spawn("bacnet_server", self.update_bacnet_server_values, restart=True)
+        self.tasks.spawn("mecho", self.do_write_values_to_mecho, restart=True)
+        self.tasks.spawn("reconcile", self.reconcile_overrides_loop, restart=True)
+        self.tasks.spawn("loop_lag", self.loop_lag.run, restart=True)
 
     async def algorithm(self):
         """
         This method handles the logic for processing the demand response
-        (DR) event signal changes and corresponding actions.
+        (DR) event signal changes and corresponding actions. The decision
+        itself is the pure decide() kernel, this only diffs its targets
+        against what was last written and dispatches the BACnet writes.
         """
         logging.info(" algorithm Go!")
-        logging.info(
-            " is dr event first sweep done? %r", self.dr_event_event_first_sweep_done
-        )
-
-        if (
-            self.dr_event_active
-            and not self.hvac_needs_to_be_released
-            and not self.dr_event_event_first_sweep_done
-            or self.hvac_mode_or_room_occ_has_changed
-        ):
-            logging.info(" Handle DR Writes Go!!")
-
-            # HVAC writes
-            if self.room_is_occupied:
-                await self.do_write_hvac_dr_active_and_room_is_occupied()
-            else:
-                await self.do_write_hvac_dr_active_and_room_is_not_occupied()
-
-            # set flag to indicate first sweep is done
-            self.dr_event_event_first_sweep_done = True
-
-        elif not self.dr_event_active and self.hvac_needs_to_be_released:
-            logging.info("Handling dr release operations!")
 
-            await self.do_release_all_hvac()
+        targets = self.decide_zone_targets()
+        writes = await self.dispatch_hvac_targets(targets)
 
-            # reset flag
-            self.dr_event_event_first_sweep_done = False
-
-        else:
+        if not writes:
             logging.info(" No Need to make BACnet writes")
 
-    async def do_release_all_hvac(self):
-        logging.info(" Releasing all HVAC!")
+    def decide_zone_targets(self):
+        mode = np.array([self.hvac_mode_trane], dtype=float)
+        occupied = np.array([self.room_is_occupied])
+        payload = self.current_adr_payload()
 
-        write_requests = [
-            (
-                TRANE_ADDRESS,
-                TRANE_TEMP_SETPOINT_READ_WRITE_POINT,
-                BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                "null",
-            ),
-            (
-                TRANE_ADDRESS,
-                TRANE_AIR_FLOW_STP_WRITE_POINT,
-                BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                "null",
-            ),
-            (
-                TRANE_ADDRESS,
-                TRANE_COOL_VALVE_WRITE_POINT,
-                BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                "null",
-            ),
-        ]
+        # size each zone's setpoint nudge to the requested shed
+        plan = self.shed_plan(mode, occupied, payload, self.dr_event_active)
+        if self.dr_event_active:
+            logging.info(
+                f" Shed plan {plan.planned_kw:.2f} of {plan.target_kw:.2f} kW,"
+                f" setpoint adj {plan.setpoint_adj}"
+            )
 
-        for request in write_requests:
-            try:
-                # Destructure the request into its components
-                address, object_id, prop_id, value = request
+        return decide(
+            mode=mode,
+            occupied=occupied,
+            base_setpoint=np.array([self.hvac_setpoint_value], dtype=float),
+            payload=payload,
+            dr_active=self.dr_event_active,
+            setpoint_adj=plan.setpoint_adj,
+            previous_mecho_mode=np.array([self.hvac_mode_mecho], dtype=float),
+        )
 
-                # Perform the BACnet write property operation
-                await self.do_write_property_task(address, object_id, prop_id, value)
-                logging.info(f" Write successful for {object_id}")
+    def shed_plan(self, mode, occupied, payload, dr_active):
+        return plan_setpoint_shed(
+            payload=payload,
+            mode=mode,
+            occupied=occupied,
+            dr_active=dr_active,
+            kw_per_degree=SHED_ZONE_KW_PER_DEGREE,
+            comfort_weight=SHED_ZONE_COMFORT_WEIGHT,
+            step_degrees=SHED_SETPOINT_STEP_DEGREES,
+            max_steps=SHED_MAX_SETPOINT_STEPS,
+            payload_mode=SHED_PAYLOAD_MODE,
+            level_fractions=SHED_SIMPLE_LEVEL_FRACTIONS,
+        )
 
-            except Exception as e:
-                logging.error(f" An unexpected error occurred on WRITE REQUEST: {e}")
+    async def precool_for_event(self, event_id):
+        """
+        Fit the zones' RC models from the logged history, plan the
+        precool / preheat setpoints for the upcoming event and hold them
+        until it starts. algorithm() takes the setpoints over from there.
+        """
+        event = self.active_events.get(event_id)
+        if event is None:
+            return
+        event_start = event["start"].timestamp()
+        event_seconds = (event["end"] - event["start"]).total_seconds()
+
+        start = time.perf_counter()
+        _, history = self.zone_history.grid(THERMAL_STEP_SECONDS, THERMAL_HISTORY_SECONDS)
+        has_outdoor = bool(np.isfinite(history["outdoor"]).any())
+        models = fit_rc_models(
+            history["temp"],
+            history["setpoint"],
+            history["mode"],
+            THERMAL_STEP_SECONDS,
+            outdoor=history["outdoor"] if has_outdoor else None,
+            min_samples=THERMAL_MIN_SAMPLES,
+        )
+        if not models.usable.any():
+            logging.info(f" Not enough zone history to precool for event {event_id}")
+            return
+
+        mode = np.array([self.hvac_mode_trane], dtype=float)
+        # assume the zone is occupied for the event, the larger shed
+        shed = self.shed_plan(mode, np.array([True]), event["payload"], True)
+        plan = plan_precool(
+            models,
+            event_start,
+            event_seconds,
+            current_temp=self.zone_history.latest("temp"),
+            base_setpoint=np.array([self.hvac_setpoint_value], dtype=float),
+            mode=mode,
+            event_adj=shed.setpoint_adj,
+            max_offset=PRECOOL_MAX_OFFSET_DEGREES,
+            offset_step=PRECOOL_OFFSET_STEP_DEGREES,
+            lead_options=PRECOOL_LEAD_OPTIONS_SECONDS,
+            peak_weight=PRECOOL_PEAK_WEIGHT,
+            offpeak_weight=PRECOOL_OFFPEAK_WEIGHT,
+            outdoor=self.zone_history.latest("outdoor")[:, None] if has_outdoor else None,
+        )
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        logging.info(
+            f" Precool plan for event {event_id} in {elapsed_ms:.1f} ms:"
+            f" offsets {plan.offset}, leads {plan.lead_seconds} s,"
+            f" model time constants {models.hvac_time_constant} s"
+        )
 
-        self.room_setpoint_written = False
-        self.hvac_needs_to_be_released = False
-        logging.info(" Releasing all HVAC Success.")
+        releasing_setpoints = True
+        try:
+            while time.time() < event_start and event_id in self.active_events:
+                if self.dr_event_active:
+                    # an earlier event is still running, it owns the setpoints
+                    await asyncio.sleep(THERMAL_STEP_SECONDS)
+                    continue
+                if releasing_setpoints:
+                    # the previous event's release wave would undo the precool,
+                    # its other points are still released
+                    self.release_scheduler.drop("setpoint")
+                    releasing_setpoints = False
+                setpoints = plan.setpoint_at(time.time())
+                for zone in changed_zones(self.hvac_written["setpoint"], setpoints):
+                    await self.write_hvac_target("setpoint", zone, setpoints[zone])
+                await asyncio.sleep(min(THERMAL_STEP_SECONDS, max(0.0, event_start - time.time())))
+        finally:
+            # cancel_event() cancels this task, the event is gone by the time it lands
+            if event_id not in self.active_events and not self.dr_event_active:
+                # event was cancelled, put the precooled setpoints back
+                await self.do_release_all_hvac(event_id)
+
+    async def dispatch_hvac_targets(self, targets, force=False):
+        """
+        Write only the HVAC points whose target changed since the last
+        write, a NaN target is written as a BACnet release. All writes are
+        queued at once as DR overrides so the dispatcher gets them to
+        every zone ahead of any polling already in the queue.
+        """
+        pending = []
+        for field in HVAC_FIELDS:
+            target = targets.hvac(field)
+            if force:
+                zones = np.arange(target.size)
+            else:
+                zones = changed_zones(self.hvac_written[field], target)
+            pending.extend((field, zone, target[zone]) for zone in zones)
 
-    async def do_write_hvac_dr_active_and_room_is_occupied(self):
-        logging.info(" DR EVENT ACTIVE Room is occupied Go!")
+        results = await asyncio.gather(
+            *(self.write_hvac_target(field, zone, target) for field, zone, target in pending)
+        )
+        writes = sum(results)
 
-        write_requests = [
-            (
-                TRANE_ADDRESS,
-                TRANE_TEMP_SETPOINT_READ_WRITE_POINT,
-                BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                self.hvac_setpoint_value,
-            ),
-            (
-                TRANE_ADDRESS,
-                TRANE_AIR_FLOW_STP_WRITE_POINT,
-                BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                "null",
-            ),
-            (
-                TRANE_ADDRESS,
-                TRANE_COOL_VALVE_WRITE_POINT,
+        self.hvac_needs_to_be_released = any(
+            not np.all(np.isnan(written)) for written in self.hvac_written.values()
+        )
+        return writes
+
+    async def write_hvac_target(self, field, zone, target):
+        value = "null" if np.isnan(target) else float(target)
+        object_id = HVAC_WRITE_POINTS[field]
+        try:
+            # Perform the BACnet write property operation
+            ok = await self.do_write_property_task(
+                self.trane_address,
+                object_id,
                 BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                "null",
-            ),
-        ]
-
-        for request in write_requests:
-            try:
-                # Destructure the request into its components
-                address, object_id, prop_id, value = request
-
-                # Perform the BACnet write property operation
-                await self.do_write_property_task(address, object_id, prop_id, value)
-                logging.info(f" Write successful for {object_id}")
-
-            except Exception as e:
-                logging.error(f" An unexpected error occurred on WRITE REQUEST: {e}")
-
-        self.hvac_needs_to_be_released = True
-        logging.info(" DR EVENT ACTIVE Room is Occupied Writes Success.")
-
-    async def do_write_hvac_dr_active_and_room_is_not_occupied(self):
-        logging.info(" DR EVENT ACTIVE Room is not occupied Go!")
+                value,
+                request_class=RequestClass.DR_OVERRIDE,
+            )
+            if not ok:
+                # the point still holds what was written before, retried next pass
+                return False
+            logging.info(f" Write successful for {object_id}: {value}")
+            self.hvac_written[field][zone] = target
+            return True
+
+        except Exception as e:
+            logging.error(f" An unexpected error occurred on WRITE REQUEST: {e}")
+            return False
+
+    async def do_release_all_hvac(self, event_id=""):
+        """
+        Release every HVAC override still written, staggered across the
+        release window with deterministic per zone jitter instead of all
+        at once. Runs in the background so the event end is not held up.
+        """
+        targets = decide(
+            mode=np.array([self.hvac_mode_trane], dtype=float),
+            occupied=np.array([self.room_is_occupied]),
+            base_setpoint=np.array([self.hvac_setpoint_value], dtype=float),
+            payload=DEFAULT_PAYLOAD_SIGNAL,
+            dr_active=False,
+            setpoint_adj=self.hvac_setpoint_adj,
+            previous_mecho_mode=np.array([self.hvac_mode_mecho], dtype=float),
+        )
 
-        write_requests = [
-            (
-                TRANE_ADDRESS,
-                TRANE_TEMP_SETPOINT_READ_WRITE_POINT,
-                BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                "null",
-            ),
-            (
-                TRANE_ADDRESS,
-                TRANE_AIR_FLOW_STP_WRITE_POINT,
-                BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                0,
-            ),
-            (
-                TRANE_ADDRESS,
-                TRANE_COOL_VALVE_WRITE_POINT,
-                BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                0,
-            ),
-        ]
+        releases = []
+        for field in HVAC_FIELDS:
+            target = targets.hvac(field)
+            for zone in changed_zones(self.hvac_written[field], target):
+                releases.append((
+                    f"{self.trane_address}/{zone}",
+                    self.trane_address,
+                    field,
+                    functools.partial(self.write_hvac_target, field, zone, target[zone]),
+                ))
+
+        if not releases:
+            logging.info(" No HVAC overrides to release")
+            return
+
+        logging.info(f" Releasing {len(releases)} HVAC overrides!")
+        task = self.release_scheduler.start(releases, salt=event_id)
+        if task is not None:
+            task.add_done_callback(self.on_release_wave_done)
+
+    def on_release_wave_done(self, task):
+        self.hvac_needs_to_be_released = any(
+            not np.all(np.isnan(written)) for written in self.hvac_written.values()
+        )
+        # a wave that crashed is logged and counted by the task supervisor
+        if not task.cancelled() and self.release_scheduler.result is not None:
+            logging.info(f" Releasing all HVAC done {self.release_scheduler.result}")
 
-        for request in write_requests:
-            try:
-                # Destructure the request into its components
-                address, object_id, prop_id, value = request
+    async def do_write_values_to_mecho(self):
 
-                # Perform the BACnet write property operation
-                await self.do_write_property_task(address, object_id, prop_id, value)
-                logging.info(f" Write successful for {object_id}")
+        # Trane points polled by the planner, each on its own interval
+        poll_points = {
+            "setpoint": TRANE_TEMP_SETPOINT_READ_WRITE_POINT,
+            "mode": TRANE_HVAC_MODE_READ_POINT,
+            "co2": TRANE_CO2_PPM_READ_POINT,
+        }
+        if TRANE_MOTION_READ_POINT is not None:
+            poll_points["motion"] = TRANE_MOTION_READ_POINT
+        if TRANE_ZONE_TEMP_READ_POINT is not None:
+            poll_points["zone_temp"] = TRANE_ZONE_TEMP_READ_POINT
 
-            except Exception as e:
-                logging.error(f" An unexpected error occurred on WRITE REQUEST: {e}")
+        for name in poll_points:
+            deadband, relevance = POLL_POINTS[name]
+            self.poll_planner.add_point(name, deadband, relevance)
 
-        self.hvac_needs_to_be_released = True
-        logging.info(" DR EVENT ACTIVE Room is not occupied Writes Success.")
+        mecho_written_at = None
+        mecho_written = None
 
-    async def do_write_values_to_mecho(self):
-        
         # always write to Mecho
         while True:
-            
-            logging.info(" Mecho Writes Go!")
-
-            room_is_occupied = False
-            hvac_mode_or_room_occ_has_changed = False
-
-            read_requests = [
-                # HVAC zone setpoint point
-                (
-                    TRANE_ADDRESS,
-                    TRANE_TEMP_SETPOINT_READ_WRITE_POINT,
-                    BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                    BACNET_PROPERTY_ARRAY_INDEX,
-                ),
-                # HVAC C02 point
-                (
-                    TRANE_ADDRESS,
-                    TRANE_HVAC_MODE_READ_POINT,
-                    BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                    BACNET_PROPERTY_ARRAY_INDEX,
-                ),
-                # HVAC mode point
-                (
-                    TRANE_ADDRESS,
-                    TRANE_CO2_PPM_READ_POINT,
-                    BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                    BACNET_PROPERTY_ARRAY_INDEX,
-                ),
-            ]
-
-            # unpack the 3 values from the BACnet read requests
-            hvac_setpoint_value, hvac_mode_trane, ppm = await self.do_read_property_task(
-                read_requests
-            )
 
-            logging.info(
-                " read_values: %r %r %r",
-                hvac_setpoint_value,
-                hvac_mode_trane,
-                room_is_occupied,
-            )
+            self.poll_planner.set_dr_active(self.dr_event_active)
+            due = self.poll_planner.due()
 
-            # Adding a dead band of -50 PPM around self.ppm_for_occ
-            # Check if ppm is greater than self.ppm_for_occ 
-            # (no dead band) to set room as occupied
-            if ppm > self.ppm_for_occ:
-                room_is_occupied = True
-            # If room is already occupied, check if ppm falls below 
-            # self.ppm_for_occ - self.ppm_dead_band to set it as unoccupied
-            elif self.room_is_occupied and ppm < self.ppm_for_occ - self.ppm_dead_band:
-                room_is_occupied = False
-
-            logging.info(" HVAC previous occupancy: %r", self.room_is_occupied)
-            logging.info(" HVAC current occupancy: %r", room_is_occupied)
-
-            hvac_mode_or_room_occ_has_changed = (
-                self.hvac_mode_trane != hvac_mode_trane
-                or self.room_is_occupied != room_is_occupied
-            )
-            logging.info(" HVAC occ or mode change: %r", hvac_mode_or_room_occ_has_changed)
+            read_values = {}
+            if due:
+                logging.info(f" Polling {due}")
 
-            # mecho requires an AV for occupancy
-            if room_is_occupied:
-                self.occ_to_write = 1.0
+                read_requests = [
+                    (
+                        self.trane_address,
+                        poll_points[name],
+                        BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
+                        BACNET_PROPERTY_ARRAY_INDEX,
+                    )
+                    for name in due
+                ]
+
+                # unpack the values from the BACnet read requests
+                values = await self.do_read_property_task(
+                    read_requests,
+                    request_class=RequestClass.CONTROL,
+                    # cache budgets can be longer than DR poll intervals
+                    max_age=POLL_DR_MIN_INTERVAL_SECONDS if self.dr_event_active else None,
+                )
+                now = time.monotonic()
+                for name, value in zip(due, values):
+                    if value == "error":
+                        self.poll_planner.observe_error(name, now)
+                    else:
+                        self.poll_planner.observe(name, value, now)
+                        read_values[name] = value
+
+                logging.info(" read_values: %r", read_values)
+                logging.info(f" Poll intervals: {self.poll_planner.intervals()}")
+
+            hvac_setpoint_value = read_values.get("setpoint")
+            hvac_mode_trane = read_values.get("mode")
+            ppm = read_values.get("co2")
+
+            # feed the occupancy engine, it applies the self.ppm_dead_band
+            # hysteresis below self.ppm_for_occ and only flips on real changes
+            start_hour, end_hour = OCCUPANCY_SCHEDULE_HOURS
+            self.occupancy.update_schedule(
+                OCCUPANCY_ZONE, start_hour <= datetime.now().hour < end_hour
+            )
+            if "motion" in read_values:
+                self.occupancy.update_motion(
+                    OCCUPANCY_ZONE, read_values["motion"] in ("active", 1, 1.0, True)
+                )
+            if ppm is not None:
+                self.occupancy.update_co2(OCCUPANCY_ZONE, ppm)
+            room_is_occupied = self.occupancy.is_occupied(OCCUPANCY_ZONE)
+
+            if hvac_mode_trane is not None:
+                hvac_mode_or_room_occ_has_changed = (
+                    self.hvac_mode_trane != hvac_mode_trane
+                    or self.room_is_occupied != room_is_occupied
+                )
+                self.hvac_mode_trane = hvac_mode_trane
             else:
-                self.occ_to_write = 0.0
+                hvac_mode_or_room_occ_has_changed = self.room_is_occupied != room_is_occupied
 
-            if hvac_mode_trane == 2.0:  # trane is heating
-                # for mecho window blinds, write continuously
-                hvac_mode_mecho = 1.0
-                logging.info(" Setting trane and mecho to heating")
+            if hvac_mode_or_room_occ_has_changed:
+                logging.info(" HVAC previous occupancy: %r", self.room_is_occupied)
+                logging.info(" HVAC current occupancy: %r", room_is_occupied)
+                logging.info(" HVAC occ or mode change: %r", hvac_mode_or_room_occ_has_changed)
 
-            elif hvac_mode_trane == 4.0:  # trane is cooling
-                hvac_mode_mecho = 0.0
-                logging.info(" Setting trane and mecho to cooling")
+            # the kernel adds the DR nudge to the zone's own setpoint, only
+            # track it while this app is not overriding the setpoint
+            setpoint_is_overridden = not np.all(np.isnan(self.hvac_written["setpoint"]))
+            if hvac_setpoint_value is not None and not setpoint_is_overridden:
+                self.hvac_setpoint_value = hvac_setpoint_value
 
-            else:
-                logging.info(" Unknown trane hvac mode: %r", hvac_mode_trane)
-
-            if self.dr_event_active:
-                if not self.room_setpoint_written and hvac_mode_trane == 2.0:
-                    # for Trane HVAC write, calc new setpoint and write only once
-                    hvac_setpoint_value -= self.hvac_setpoint_adj
-                    self.room_setpoint_written = True
-                    logging.info(
-                        " new RAISED hvac_setpoint_value for a COOLING mode: %r",
-                        hvac_setpoint_value,
-                    )
-
-                elif not self.room_setpoint_written and hvac_mode_trane == 4.0:
-                    # for Trane HVAC write, calc new setpoint and write only once
-                    hvac_setpoint_value += self.hvac_setpoint_adj
-                    self.room_setpoint_written = True
-                    logging.info(
-                        " new LOWERED hvac_setpoint_value for a HEATING mode: %r",
-                        hvac_setpoint_value,
-                    )
-
-            self.hvac_setpoint_value = hvac_setpoint_value
-            self.hvac_mode_trane = hvac_mode_trane
             self.room_is_occupied = room_is_occupied
-            self.hvac_mode_mecho = hvac_mode_mecho
-            self.hvac_mode_or_room_occ_has_changed = hvac_mode_or_room_occ_has_changed
-
-            logging.info(" dr_event_active %r", self.dr_event_active)
-            logging.info(" hvac_needs_to_be_released %r", self.hvac_needs_to_be_released)
-            logging.info(" room_is_occupied %r", self.room_is_occupied)
-            logging.info(" hvac_mode_or_room_occ_has_changed %r", self.hvac_mode_or_room_occ_has_changed)
-
-            write_requests = [
-                (
-                    MECHO_ADDRESS,
-                    MECHO_DR_WRITE_POINT,
-                    BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                    self.current_adr_payload(),
-                ),
-                (
-                    MECHO_ADDRESS,
-                    MECHO_OCC_WRITE_POINT,
-                    BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                    self.occ_to_write,
-                ),
-                (
-                    MECHO_ADDRESS,
-                    MECHO_HVAC_WRITE_POINT,
-                    BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
-                    self.hvac_mode_mecho,
-                ),
-            ]
-
-            for request in write_requests:
-                try:
-                    # Destructure the request into its components
-                    address, object_id, prop_id, value = request
-
-                    # Perform the BACnet write property operation
-                    await self.do_write_property_task(address, object_id, prop_id, value)
-                    logging.info(f" Write successful to Mecho for {object_id}")
-
-                except Exception as e:
-                    logging.error(
-                        f" An unexpected error occurred on Mecho WRITE REQUEST: {e}"
-                    )
 
-            logging.info(" Mecho Writes Success.")
-            await asyncio.sleep(ALGORITHM_RUN_FREQUENCY_SECONDS)
+            if read_values:
+                self.zone_history.record(
+                    0,
+                    temp=read_values.get("zone_temp"),
+                    setpoint=hvac_setpoint_value,
+                    mode=hvac_mode_trane,
+                )
+
+            targets = self.decide_zone_targets()
+            self.occ_to_write = float(targets.mecho_occ[0])
+            self.hvac_mode_mecho = float(targets.mecho_mode[0])
+
+            if hvac_mode_or_room_occ_has_changed and self.dr_event_active:
+                # react to the transition now instead of on the next event timer tick
+                await self.dispatch_hvac_targets(targets)
+
+            # for mecho window blinds, write continuously
+            mecho_targets = (float(targets.mecho_dr[0]), self.occ_to_write, self.hvac_mode_mecho)
+            now = time.monotonic()
+            mecho_is_due = (
+                mecho_written_at is None
+                or now - mecho_written_at >= ALGORITHM_RUN_FREQUENCY_SECONDS
+                or mecho_targets != mecho_written
+            )
 
+            if mecho_is_due:
+                logging.info(" Mecho Writes Go!")
+                logging.info(" dr_event_active %r", self.dr_event_active)
+                logging.info(" hvac_needs_to_be_released %r", self.hvac_needs_to_be_released)
+                logging.info(" room_is_occupied %r", self.room_is_occupied)
+
+                write_requests = [
+                    (
+                        self.mecho_address,
+                        MECHO_DR_WRITE_POINT,
+                        BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
+                        mecho_targets[0],
+                    ),
+                    (
+                        self.mecho_address,
+                        MECHO_OCC_WRITE_POINT,
+                        BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
+                        mecho_targets[1],
+                    ),
+                    (
+                        self.mecho_address,
+                        MECHO_HVAC_WRITE_POINT,
+                        BACNET_PRESENT_VALUE_PROP_IDENTIFIER,
+                        mecho_targets[2],
+                    ),
+                ]
+
+                for request in write_requests:
+                    try:
+                        # Destructure the request into its components
+                        address, object_id, prop_id, value = request
+
+                        # Perform the BACnet write property operation
+                        if await self.do_write_property_task(
+                            address, object_id, prop_id, value, request_class=RequestClass.CONTROL
+                        ):
+                            logging.info(f" Write successful to Mecho for {object_id}")
+
+                    except Exception as e:
+                        logging.error(
+                            f" An unexpected error occurred on Mecho WRITE REQUEST: {e}"
+                        )
+
+                mecho_written_at = time.monotonic()
+                mecho_written = mecho_targets
+                logging.info(" Mecho Writes Success.")
+                logging.info(f" Point cache: {self.point_cache.stats()}")
+
+            # sleep until the next point is due or the next Mecho write,
+            # a DR start or end wakes the loop early to re-plan
+            mecho_wait = ALGORITHM_RUN_FREQUENCY_SECONDS - (time.monotonic() - mecho_written_at)
+            wait = max(min(self.poll_planner.next_wakeup(), mecho_wait), 0.5)
+            try:
+                await asyncio.wait_for(self.poll_wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            self.poll_wakeup.clear()
 
-async def main():
-    args = SimpleArgumentParser().parse_args()
-    if _info:
-        logging.info("args: %r", args)
 
-    # define BACnet objects for BACnet server
+def bacnet_server_objects():
+    """
+    The app's own BACnet server objects, DR signal, meter and cloud state
+    """
     dr_signal = AnalogValueObject(
         objectIdentifier=("analogValue", 1),
         objectName="demand-response-level",
@@ -395,22 +558,21 @@ async def main():
         statusFlags=[0, 0, 0, 0],
         description="True if app can reach to cloud DR server",
     )
+    return {"dr_signal": dr_signal, "power_level": power_level, "app_status": app_status}
 
-    # instantiate the DrApplication with test_av and test_bv
-    app = DrApplication(
-        args,
-        dr_signal=dr_signal,
-        power_level=power_level,
-        app_status=app_status,
-    )
+
+async def main():
+    args = SimpleArgumentParser().parse_args()
+    if _info:
+        logging.info("args: %r", args)
+
+    # instantiate the DrApplication with the BACnet server objects
+    app = DrApplication(args, **bacnet_server_objects())
+    startup.mark("bacnet_app")
     if _info:
         logging.info("app: %r", app)
 
-    await asyncio.Future()
+    await app.tasks.run()
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        if _info:
-            logging.info("keyboard interrupt")
+    startup.run(main, use_uvloop=USE_UVLOOP)
@@ -0,0 +1,303 @@
+#!/usr/bin/python3
+"""
+Measurement and verification of DR sheds
+
+Computes customer baselines from interval meter history and the shed
+kW / kWh for each DR event, for many buildings at once. Baselines:
+
+* 10-of-10: average of the 10 most recent eligible days (weekdays
+  without a DR event) at each interval, with an optional day-of
+  adjustment scaling the baseline by the actual / baseline ratio over
+  the hours before the event, capped at +/- 20%
+* weather: per building and interval least squares fit of kW against
+  outdoor air temperature over the eligible days, evaluated at the
+  event day's temperatures
+
+Meter history is a CSV of timestamp,building,kw (local time) and
+weather a CSV of timestamp,temp. Events come from the event journal
+and event history the VEN writes (see EVENT_HISTORY_PATH).
+
+$ python mv_baseline.py meter.csv --events adr_event_history.jsonl adr_event_journal.jsonl
+$ python mv_baseline.py meter.csv --events adr_event_history.jsonl --method weather --weather oat.csv
+"""
+
+import csv
+import json
+import argparse
+import warnings
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+INTERVAL_MINUTES = 15
+BASELINE_DAYS = 10
+WEATHER_LOOKBACK_DAYS = 30
+ADJUSTMENT_HOURS = 3  # window before the event the day-of adjustment looks at
+ADJUSTMENT_GAP_HOURS = 1  # skipped right before the event, pre-cooling lands here
+ADJUSTMENT_CAP = 0.2
+
+
+class IntervalData:
+    """
+    Readings on a regular local time grid reshaped to whole days,
+    values[building, day, slot] with NaN for missing intervals
+    """
+    def __init__(self, buildings, days, values, interval_minutes=INTERVAL_MINUTES):
+        self.buildings = buildings
+        self.days = days  # datetime.date of each day row
+        self.values = values
+        self.interval_minutes = interval_minutes
+
+    @property
+    def slots_per_hour(self):
+        return 60 // self.interval_minutes
+
+    def day_index(self, date):
+        try:
+            return self.days.index(date)
+        except ValueError:
+            return None
+
+
+def to_local_naive(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+def nanmean(values, axis):
+    # all NaN slices are expected for buildings with meter gaps, they stay NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanmean(values, axis=axis)
+
+
+def grid_readings(timestamps, buildings, values, interval_minutes=INTERVAL_MINUTES):
+    """
+    Long format readings to an IntervalData grid, readings are averaged
+    into the interval they fall in
+    """
+    building_names = sorted(set(buildings))
+    building_rows = {name: row for row, name in enumerate(building_names)}
+    timestamps = [to_local_naive(timestamp) for timestamp in timestamps]
+    first_day = min(timestamps).date()
+    day_count = (max(timestamps).date() - first_day).days + 1
+    slots = 24 * 60 // interval_minutes
+
+    day = np.array([(timestamp.date() - first_day).days for timestamp in timestamps])
+    slot = np.array(
+        [(timestamp.hour * 60 + timestamp.minute) // interval_minutes for timestamp in timestamps]
+    )
+    row = np.array([building_rows[name] for name in buildings])
+    flat = np.ravel_multi_index((row, day, slot), (len(building_names), day_count, slots))
+
+    size = len(building_names) * day_count * slots
+    sums = np.bincount(flat, weights=np.asarray(values, dtype=float), minlength=size)
+    counts = np.bincount(flat, minlength=size)
+    with np.errstate(invalid="ignore"):
+        grid = (sums / counts).reshape(len(building_names), day_count, slots)
+
+    days = [first_day + timedelta(days=offset) for offset in range(day_count)]
+    return IntervalData(building_names, days, grid, interval_minutes)
+
+
+def eligible_days(data, event_day, event_dates, count, weekdays_only=True):
+    """
+    Indexes of the `count` most recent days before `event_day` that are
+    not DR event days (and are weekdays when `weekdays_only`), newest first
+    """
+    chosen = []
+    for index in range(event_day - 1, -1, -1):
+        date = data.days[index]
+        if date in event_dates or (weekdays_only and date.weekday() >= 5):
+            continue
+        chosen.append(index)
+        if len(chosen) == count:
+            break
+    return np.array(chosen, dtype=int)
+
+
+def ten_of_ten(data, baseline_days):
+    """
+    Baseline kW [building, slot], the average of the baseline days
+    """
+    return nanmean(data.values[:, baseline_days, :], axis=1)
+
+
+def day_of_adjustment(data, baseline, event_day, start_slot, cap=ADJUSTMENT_CAP):
+    """
+    Scale each building's baseline by actual / baseline over the
+    adjustment window before the event, capped at 1 +/- `cap`
+    """
+    window_end = max(start_slot - ADJUSTMENT_GAP_HOURS * data.slots_per_hour, 1)
+    window_start = max(window_end - ADJUSTMENT_HOURS * data.slots_per_hour, 0)
+    window = slice(window_start, window_end)
+
+    actual = nanmean(data.values[:, event_day, window], axis=1)
+    expected = nanmean(baseline[:, window], axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.clip(actual / expected, 1.0 - cap, 1.0 + cap)
+    ratio = np.where(np.isfinite(ratio), ratio, 1.0)
+    return baseline * ratio[:, None]
+
+
+def weather_regression(data, weather, baseline_days, event_day):
+    """
+    Baseline kW [building, slot] from kW = a + b * temp fit over the
+    baseline days, one fit per building and interval in one pass
+    """
+    temps = weather.values[0]  # [day, slot], one weather station
+    x = temps[baseline_days]  # [days, slot]
+    y = data.values[:, baseline_days, :]  # [building, days, slot]
+
+    valid = np.isfinite(y) & np.isfinite(x)[None]
+    n = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = np.where(valid, x[None], 0.0).sum(axis=1) / n
+        y_mean = np.where(valid, y, 0.0).sum(axis=1) / n
+        dx = np.where(valid, x[None] - x_mean[:, None, :], 0.0)
+        dy = np.where(valid, y - y_mean[:, None, :], 0.0)
+        slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+    slope = np.where(np.isfinite(slope), slope, 0.0)
+
+    event_temps = temps[event_day]
+    return y_mean + slope * (event_temps[None, :] - x_mean)
+
+
+def verify_events(data, events, method="10of10", adjust=True, weather=None):
+    """
+    Shed for every event and building, `events` maps event_id to a
+    dict with "start" and "end". Returns one result dict per event.
+    """
+    event_dates = {to_local_naive(event["start"]).date() for event in events.values()}
+    hours = data.interval_minutes / 60.0
+    results = []
+
+    for event_id, event in sorted(events.items(), key=lambda item: to_local_naive(item[1]["start"])):
+        start = to_local_naive(event["start"])
+        end = to_local_naive(event["end"])
+        event_day = data.day_index(start.date())
+        if event_day is None:
+            continue
+
+        start_slot = (start.hour * 60 + start.minute) // data.interval_minutes
+        # events are verified within their start day
+        if end.date() > start.date():
+            end_slot = 24 * 60 // data.interval_minutes
+        else:
+            end_slot = -(-(end.hour * 60 + end.minute) // data.interval_minutes)
+
+        if method == "weather":
+            baseline_days = eligible_days(data, event_day, event_dates, WEATHER_LOOKBACK_DAYS)
+            if baseline_days.size < 2:
+                continue
+            baseline = weather_regression(data, weather, baseline_days, event_day)
+        else:
+            baseline_days = eligible_days(data, event_day, event_dates, BASELINE_DAYS)
+            if baseline_days.size == 0:
+                continue
+            baseline = ten_of_ten(data, baseline_days)
+            if adjust:
+                baseline = day_of_adjustment(data, baseline, event_day, start_slot)
+
+        window = slice(start_slot, end_slot)
+        actual = data.values[:, event_day, window]
+        shed = baseline[:, window] - actual
+
+        results.append({
+            "event_id": event_id,
+            "start": start,
+            "end": end,
+            "baseline_days": [data.days[day] for day in baseline_days],
+            "baseline_kw": nanmean(baseline[:, window], axis=1),
+            "actual_kw": nanmean(actual, axis=1),
+            "shed_kw": nanmean(shed, axis=1),
+            "shed_kwh": np.nansum(shed, axis=1) * hours,
+        })
+
+    return results
+
+
+def load_events(paths):
+    """
+    Events from journal / event history JSON lines, cancelled events are dropped
+    """
+    events = {}
+    cancelled = set()
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "event":
+                    events[record["event_id"]] = {"start": record["start"], "end": record["end"]}
+                elif record.get("type") == "event_cancel":
+                    cancelled.add(record["event_id"])
+    return {event_id: event for event_id, event in events.items() if event_id not in cancelled}
+
+
+def load_meter_csv(path, interval_minutes=INTERVAL_MINUTES):
+    timestamps, buildings, values = [], [], []
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            timestamps.append(row["timestamp"])
+            buildings.append(row["building"])
+            values.append(float(row["kw"]))
+    return grid_readings(timestamps, buildings, values, interval_minutes)
+
+
+def load_weather_csv(path, data):
+    """
+    Outdoor air temperature gridded on the same days as the meter data
+    """
+    timestamps, temps = [], []
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            timestamps.append(row["timestamp"])
+            temps.append(float(row["temp"]))
+    weather = grid_readings(timestamps, ["weather"] * len(temps), temps, data.interval_minutes)
+
+    # line the weather days up with the meter days
+    aligned = np.full((1, len(data.days), data.values.shape[2]), np.nan)
+    for row, date in enumerate(data.days):
+        index = weather.day_index(date)
+        if index is not None:
+            aligned[0, row] = weather.values[0, index]
+    return IntervalData(["weather"], data.days, aligned, data.interval_minutes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Baseline and shed verification for DR events")
+    parser.add_argument("meter_csv", help="timestamp,building,kw interval data")
+    parser.add_argument("--events", nargs="+", required=True, help="event journal / history files")
+    parser.add_argument("--method", choices=("10of10", "weather"), default="10of10")
+    parser.add_argument("--no-adjustment", action="store_true", help="10-of-10 without day-of adjustment")
+    parser.add_argument("--weather", help="timestamp,temp outdoor air temperature")
+    parser.add_argument("--interval-minutes", type=int, default=INTERVAL_MINUTES)
+    args = parser.parse_args()
+
+    if args.method == "weather" and not args.weather:
+        parser.error("--method weather needs --weather")
+
+    data = load_meter_csv(args.meter_csv, args.interval_minutes)
+    weather = load_weather_csv(args.weather, data) if args.weather else None
+    events = load_events(args.events)
+    results = verify_events(data, events, args.method, not args.no_adjustment, weather)
+
+    print(f"{'event':<24} {'building':<16} {'baseline kW':>11} {'actual kW':>10} {'shed kW':>8} {'shed kWh':>9}")
+    for result in results:
+        for row, building in enumerate(data.buildings):
+            print(
+                f"{result['event_id']:<24} {building:<16} "
+                f"{result['baseline_kw'][row]:>11.1f} {result['actual_kw'][row]:>10.1f} "
+                f"{result['shed_kw'][row]:>8.1f} {result['shed_kwh'][row]:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
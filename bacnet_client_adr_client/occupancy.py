@@ -0,0 +1,199 @@
+import time
+import logging
+
+import numpy as np
+
+
+class OccupancyTransition:
+    """
+    Emitted only when a zone flips between occupied and unoccupied
+    """
+    def __init__(self, zone, occupied, timestamp, reason):
+        self.zone = zone
+        self.occupied = occupied
+        self.timestamp = timestamp
+        self.reason = reason
+
+    def __repr__(self):
+        state = "occupied" if self.occupied else "unoccupied"
+        return f"<OccupancyTransition {self.zone} {state} ({self.reason})>"
+
+
+class OccupancyDetector:
+    """
+    Streaming occupancy engine over CO2, motion and schedule inputs.
+
+    Each zone keeps its last `window` CO2 samples in a row of a NumPy
+    ring buffer along with running least squares sums, so the CO2 slope
+    is updated in O(1) per sample. Occupancy uses hysteresis: the room
+    goes occupied above `on_ppm` (or on a sustained CO2 rise, or motion)
+    and only goes unoccupied once CO2 is below `on_ppm - dead_band`, not
+    rising, motion has been quiet for `motion_hold` seconds and the zone
+    has held its state for `min_state_seconds`.
+    """
+    def __init__(
+        self,
+        zones,
+        on_ppm=600.0,
+        dead_band=50.0,
+        rise_ppm_per_min=15.0,
+        window=15,
+        min_state_seconds=300.0,
+        motion_hold=900.0,
+    ):
+        self.zones = {zone: row for row, zone in enumerate(zones)}
+        self.on_ppm = on_ppm
+        self.dead_band = dead_band
+        self.rise_ppm_per_min = rise_ppm_per_min
+        self.window = window
+        self.min_state_seconds = min_state_seconds
+        self.motion_hold = motion_hold
+        self.listeners = []
+
+        count = len(self.zones)
+        self._times = np.zeros((count, window))
+        self._values = np.zeros((count, window))
+        self._head = np.zeros(count, dtype=np.int64)
+        self._filled = np.zeros(count, dtype=np.int64)
+        self._updates = np.zeros(count, dtype=np.int64)
+        self._t0 = np.full(count, np.nan)
+
+        # running sums for the least squares slope, t is relative to _t0
+        self._sum_t = np.zeros(count)
+        self._sum_v = np.zeros(count)
+        self._sum_tt = np.zeros(count)
+        self._sum_tv = np.zeros(count)
+
+        self._occupied = np.zeros(count, dtype=bool)
+        self._state_since = np.zeros(count)
+        self._last_motion = np.full(count, -np.inf)
+        self._scheduled = np.zeros(count, dtype=bool)
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def is_occupied(self, zone):
+        return bool(self._occupied[self.zones[zone]])
+
+    def co2_slope(self, zone):
+        """
+        Least squares CO2 slope over the window in ppm per minute
+        """
+        row = self.zones[zone]
+        n = self._filled[row]
+        if n < 2:
+            return 0.0
+        denominator = n * self._sum_tt[row] - self._sum_t[row] ** 2
+        if denominator <= 0:
+            return 0.0
+        slope = (n * self._sum_tv[row] - self._sum_t[row] * self._sum_v[row]) / denominator
+        return float(slope * 60.0)
+
+    def latest_co2(self, zone):
+        row = self.zones[zone]
+        if not self._filled[row]:
+            return None
+        return float(self._values[row, (self._head[row] - 1) % self.window])
+
+    def update_co2(self, zone, ppm, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        row = self.zones[zone]
+
+        if np.isnan(self._t0[row]):
+            self._t0[row] = timestamp
+        t = timestamp - self._t0[row]
+        ppm = float(ppm)
+
+        head = self._head[row]
+        if self._filled[row] == self.window:
+            # drop the oldest sample from the running sums
+            old_t = self._times[row, head]
+            old_v = self._values[row, head]
+            self._sum_t[row] -= old_t
+            self._sum_v[row] -= old_v
+            self._sum_tt[row] -= old_t * old_t
+            self._sum_tv[row] -= old_t * old_v
+        else:
+            self._filled[row] += 1
+
+        self._times[row, head] = t
+        self._values[row, head] = ppm
+        self._sum_t[row] += t
+        self._sum_v[row] += ppm
+        self._sum_tt[row] += t * t
+        self._sum_tv[row] += t * ppm
+        self._head[row] = (head + 1) % self.window
+
+        self._updates[row] += 1
+        if self._updates[row] % self.window == 0:
+            self._resum(row)
+
+        return self._evaluate(zone, timestamp)
+
+    def update_motion(self, zone, active, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        row = self.zones[zone]
+        if active:
+            self._last_motion[row] = timestamp
+        return self._evaluate(zone, timestamp)
+
+    def update_schedule(self, zone, scheduled_occupied, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        self._scheduled[self.zones[zone]] = bool(scheduled_occupied)
+        return self._evaluate(zone, timestamp)
+
+    def _resum(self, row):
+        # recompute the sums from the buffer now and then so float drift never builds up
+        n = self._filled[row]
+        times = self._times[row, :n] if n < self.window else self._times[row]
+        values = self._values[row, :n] if n < self.window else self._values[row]
+        self._sum_t[row] = times.sum()
+        self._sum_v[row] = values.sum()
+        self._sum_tt[row] = (times * times).sum()
+        self._sum_tv[row] = (times * values).sum()
+
+    def _evaluate(self, zone, timestamp):
+        row = self.zones[zone]
+        ppm = self.latest_co2(zone)
+        slope = self.co2_slope(zone)
+        motion_recent = timestamp - self._last_motion[row] <= self.motion_hold
+        occupied = bool(self._occupied[row])
+
+        if not occupied:
+            reason = None
+            if motion_recent:
+                reason = "motion"
+            elif ppm is not None and ppm > self.on_ppm:
+                reason = f"co2 {ppm:.0f} ppm above {self.on_ppm:.0f}"
+            elif (
+                self._scheduled[row]
+                and ppm is not None
+                and ppm > self.on_ppm - self.dead_band
+                and slope >= self.rise_ppm_per_min
+            ):
+                # a rising room during scheduled hours is filling up
+                reason = f"co2 rising {slope:.1f} ppm/min"
+            if reason is None:
+                return None
+            return self._transition(zone, True, timestamp, reason)
+
+        if timestamp - self._state_since[row] < self.min_state_seconds:
+            return None
+        if motion_recent or ppm is None:
+            return None
+        if ppm >= self.on_ppm - self.dead_band or slope > 0.0:
+            return None
+        return self._transition(
+            zone, False, timestamp, f"co2 {ppm:.0f} ppm and falling, no motion"
+        )
+
+    def _transition(self, zone, occupied, timestamp, reason):
+        row = self.zones[zone]
+        self._occupied[row] = occupied
+        self._state_since[row] = timestamp
+        transition = OccupancyTransition(zone, occupied, timestamp, reason)
+        logging.info(f" Occupancy transition: {transition}")
+
+        for callback in self.listeners:
+            callback(transition)
+        return transition
@@ -0,0 +1,98 @@
+import time
+import asyncio
+
+
+def point_key(address, object_identifier, property_identifier, property_array_index=None):
+    return (str(address), str(object_identifier), str(property_identifier), property_array_index)
+
+
+class PointCache:
+    """
+    Shared point values in front of the BACnet reads. Concurrent reads
+    of the same point collapse into one network request (single-flight)
+    and a value younger than the point's freshness budget is served
+    without going on the wire at all.
+    """
+    def __init__(self, default_max_age=5.0, max_age_by_object=None):
+        self.default_max_age = default_max_age
+        self.max_age_by_object = {
+            str(object_identifier): max_age
+            for object_identifier, max_age in (max_age_by_object or {}).items()
+        }
+        self.values = {}  # key -> (value, read at)
+        self.in_flight = {}  # key -> future of the read on the wire
+        self.generation = {}  # key -> bumped on every invalidate
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.hit_ages = []
+
+    def max_age(self, key):
+        return self.max_age_by_object.get(key[1], self.default_max_age)
+
+    async def get(self, key, fetch, max_age=None):
+        """
+        Cached value for `key` if fresh enough, else the result of
+        `fetch()`, shared with any caller already waiting on that read
+        """
+        max_age = self.max_age(key) if max_age is None else max_age
+        cached = self.values.get(key)
+        if cached is not None:
+            age = time.monotonic() - cached[1]
+            if age <= max_age:
+                self.hits += 1
+                self._record_age(age)
+                return cached[0]
+
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        generation = self.generation.get(key, 0)
+        try:
+            value = await fetch()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as err:
+            # bacpypes3 error replies are BaseException, waiters get them as is
+            future.set_exception(err)
+            # nobody may be left to retrieve it otherwise
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+            # a write landed while this read was on the wire, do not keep it
+            if self.generation.get(key, 0) == generation:
+                self.values[key] = (value, time.monotonic())
+            return value
+        finally:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+    def invalidate(self, key):
+        """
+        Drop the cached value after a write so the next read goes to the device
+        """
+        self.values.pop(key, None)
+        self.generation[key] = self.generation.get(key, 0) + 1
+
+    def _record_age(self, age):
+        self.hit_ages.append(age)
+        if len(self.hit_ages) > 1000:
+            del self.hit_ages[:500]
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "mean_hit_age": sum(self.hit_ages) / len(self.hit_ages) if self.hit_ages else 0.0,
+            "points": len(self.values),
+        }
@@ -0,0 +1,183 @@
+"""
+OpenADR 2.0b push mode for the VEN
+
+In push mode the VEN registers with http_pull_model=False and a
+transport address, and the VTN posts events to that address as soon as
+it has them instead of waiting for the next oadrPoll. Polling is kept
+only as a low frequency health check, so event pickup latency drops
+from up to one poll interval to one request and most of the idle HTTPS
+traffic goes away.
+"""
+
+import ssl
+import asyncio
+import logging
+import functools
+from datetime import timedelta
+
+import aiohttp
+from aiohttp import web
+
+from ven_pipeline import OffloadedOpenADRClient, decode_message
+
+_log = logging.getLogger(__name__)
+
+
+def push_ssl_context(cert, key, ca_file):
+    """
+    Server side TLS context for the push endpoint that only accepts
+    clients (the VTN) with a certificate signed by `ca_file`. Raises
+    ValueError when any of the three is missing, the endpoint accepts
+    events that drive setpoint overrides and is never served without it.
+    """
+    if not (cert and key and ca_file):
+        raise ValueError("push mode needs the VEN certificate, its key and the VTN CA for mutual TLS")
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH, cafile=ca_file)
+    context.load_cert_chain(cert, key)
+    context.verify_mode = ssl.CERT_REQUIRED
+    return context
+
+
+def vtn_session(client, keepalive):
+    """
+    HTTP session for requests to the VTN with the client certificate of
+    `client` (openleadr's cert_path / key_path / ca_file) when it has
+    one, connections are kept alive for `keepalive` seconds
+    """
+    ssl_context = None
+    if getattr(client, "cert_path", None):
+        ssl_context = ssl.create_default_context(ssl.Purpose.SERVER_AUTH, cafile=client.ca_file)
+        ssl_context.load_cert_chain(client.cert_path, client.key_path, client.passphrase)
+        ssl_context.check_hostname = False
+    connector = aiohttp.TCPConnector(ssl=ssl_context, keepalive_timeout=keepalive)
+    return aiohttp.ClientSession(connector=connector, headers={"content-type": "application/xml"})
+
+
+class PushModeClient(OffloadedOpenADRClient):
+    """
+    Registers for push delivery when `push_address` is set and then
+    polls only every `health_poll_seconds` (or slower if the VTN asks
+    for it). Without `push_address` it is a plain polling client.
+
+    Requests to the VTN share one TLS context and one keep-alive
+    connection pool, so the mutual TLS handshake is paid once per
+    `keepalive` seconds of idle time rather than once per request.
+    """
+    def __init__(self, *args, push_address=None, health_poll_seconds=900, keepalive=75.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.push_address = push_address
+        self.health_poll = timedelta(seconds=health_poll_seconds)
+        self.keepalive = keepalive
+        self.polls = 0
+        self.requests = 0
+
+    async def create_party_registration(self, **kwargs):
+        if self.push_address:
+            kwargs["http_pull_model"] = False
+            kwargs["transport_address"] = self.push_address
+        result = await super().create_party_registration(**kwargs)
+        if self.push_address:
+            self.poll_frequency = max(self.poll_frequency or timedelta(0), self.health_poll)
+            _log.info(f" Registered for push delivery at {self.push_address}, "
+                      f"health poll every {self.poll_frequency}")
+        return result
+
+    async def _ensure_client_session(self):
+        if not self.client_session:
+            self.client_session = vtn_session(self, self.keepalive)
+
+    async def _poll(self):
+        self.polls += 1
+        return await super()._poll()
+
+    async def _perform_request(self, service, message):
+        self.requests += 1
+        return await super()._perform_request(service, message)
+
+    def stats(self):
+        stats = super().stats()
+        stats.update(requests=self.requests, polls=self.polls)
+        return stats
+
+
+class PushListener:
+    """
+    HTTP endpoint the VTN posts to in push mode, for the VEN clients in
+    `clients` (ven name: client). With more than one client each is
+    registered at its own address ending in its ven name, the path
+    segment before the OpenADR service picks the client.
+
+    Messages are decoded in the client's XML pool and answered with an
+    oadrResponse right away, the event itself is handed to openleadr's
+    own event handling through `spawn(coroutine)`, which then sends
+    oadrCreatedEvent to the VTN.
+    """
+    def __init__(self, clients, host, port, spawn, ssl_context=None, keepalive=75.0):
+        self.clients = clients
+        self.host = host
+        self.port = port
+        self.spawn = spawn
+        self.ssl_context = ssl_context
+        self.keepalive = keepalive
+        self.received = 0
+        self.rejected = 0
+
+    def client_for(self, path):
+        if len(self.clients) == 1:
+            return next(iter(self.clients.values()))
+        parts = path.rstrip("/").split("/")
+        return self.clients.get(parts[-2]) if len(parts) >= 2 else None
+
+    async def run(self):
+        app = web.Application()
+        app.router.add_post("/{path:.*}", self.handle)
+        runner = web.AppRunner(app, keepalive_timeout=self.keepalive, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, self.port, ssl_context=self.ssl_context)
+        await site.start()
+        scheme = "https" if self.ssl_context else "http"
+        _log.info(f" Push listener on {scheme}://{self.host}:{self.port}")
+        try:
+            await asyncio.Future()
+        finally:
+            await runner.cleanup()
+
+    async def handle(self, request):
+        content = await request.read()
+        self.received += 1
+        client = self.client_for(request.path)
+        if client is None:
+            self.rejected += 1
+            _log.warning(f" Push to {request.path} matches no VEN")
+            return web.Response(status=404)
+        try:
+            message_type, payload = await client._offload(
+                decode_message, content, client.vtn_fingerprint
+            )
+        except Exception as e:
+            self.rejected += 1
+            _log.warning(f" Push message from {request.remote} rejected: {e!r}")
+            return web.Response(status=400)
+
+        _log.info(f" Push {message_type} for {client.ven_name}")
+        if message_type == "oadrDistributeEvent":
+            self.spawn(client._on_event(payload))
+        elif message_type == "oadrRequestReregistration":
+            self.spawn(client.create_party_registration(ven_id=client.ven_id))
+        else:
+            _log.warning(f" Push {message_type} is not handled, acknowledging only")
+
+        response = await client._offload(functools.partial(
+            client._build_message,
+            "oadrResponse",
+            response={
+                "response_code": 200,
+                "response_description": "OK",
+                "request_id": payload.get("request_id"),
+            },
+            ven_id=client.ven_id,
+        ))
+        return web.Response(text=response, content_type="application/xml")
+
+    def stats(self):
+        return {"received": self.received, "rejected": self.rejected}
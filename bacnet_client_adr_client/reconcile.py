@@ -0,0 +1,205 @@
+from bacpypes3.pdu import Address
+from bacpypes3.primitivedata import ObjectIdentifier
+from bacpypes3.apdu import ErrorRejectAbortNack, PropertyReference, ErrorType
+from bacpypes3.vendor import get_vendor_info
+
+import asyncio
+import logging
+
+from event_journal import override_key
+from device_health import DeviceUnavailable
+from request_dispatcher import RequestClass
+
+
+PRIORITY_ARRAY = "priority-array"
+
+
+class OverrideLedger:
+    """
+    What this app expects to sit in each controlled point's priority
+    array. A value of None means the app released the slot and it
+    should read back as null.
+    """
+    def __init__(self):
+        self.points = {}
+
+    def set_override(self, device_address, object_identifier, property_identifier, value, priority):
+        key = override_key(device_address, object_identifier, property_identifier)
+        self.points[key] = {
+            "address": str(device_address),
+            "object_identifier": str(object_identifier),
+            "property_identifier": property_identifier,
+            "value": value,
+            "priority": priority,
+        }
+
+    def set_released(self, device_address, object_identifier, property_identifier, priority):
+        key = override_key(device_address, object_identifier, property_identifier)
+        self.points[key] = {
+            "address": str(device_address),
+            "object_identifier": str(object_identifier),
+            "property_identifier": property_identifier,
+            "value": None,
+            "priority": priority,
+        }
+
+    def confirm_released(self, key):
+        # released slots only need checking until the device agrees
+        entry = self.points.get(key)
+        if entry is not None and entry["value"] is None:
+            del self.points[key]
+
+    def by_device(self):
+        devices = {}
+        for key, entry in self.points.items():
+            devices.setdefault(entry["address"], []).append((key, entry))
+        return devices
+
+
+def priority_slot_value(priority_array, priority):
+    """
+    Return the value commanded at a priority level, None if the slot is null
+    """
+    priority_value = priority_array[priority - 1]
+    value_type = priority_value._choice
+    if value_type == "null":
+        return None
+    return getattr(priority_value, value_type, None)
+
+
+def slot_matches(expected, actual, tolerance=0.01):
+    if expected is None or actual is None:
+        return expected is None and actual is None
+    try:
+        return abs(float(expected) - float(actual)) <= tolerance
+    except (TypeError, ValueError):
+        return str(expected) == str(actual)
+
+
+class PriorityArrayReconciler:
+    """
+    Bulk reads priority-array for every point in the ledger with one
+    read property multiple per device, then issues only the release or
+    re-assert writes needed to make the devices match the ledger.
+    """
+    def __init__(self, app, ledger, write_property_task, journal=None, request=None):
+        self.app = app
+        self.request = request
+        self.ledger = ledger
+        self.write_property_task = write_property_task
+        self.journal = journal
+        self.vendor_info = get_vendor_info(0)
+
+    async def read_priority_arrays(self, address, entries):
+        """
+        Returns {ledger key: priority array} for one device, falling back
+        to single reads when the device rejects read property multiple.
+        """
+        parameter_list = []
+        keys_by_object = {}
+        for key, entry in entries:
+            object_identifier = ObjectIdentifier(entry["object_identifier"])
+            keys_by_object.setdefault(str(object_identifier), []).append(key)
+            if len(keys_by_object[str(object_identifier)]) == 1:
+                parameter_list.append(object_identifier)
+                parameter_list.append(
+                    [PropertyReference(PRIORITY_ARRAY, vendor_info=self.vendor_info)]
+                )
+
+        priority_arrays = {}
+        try:
+            response = await self._request(
+                address,
+                lambda: self.app.read_property_multiple(Address(address), parameter_list),
+            )
+        except (DeviceUnavailable, asyncio.TimeoutError) as err:
+            logging.warning(f" Skipping reconciliation of {address}: {err!r}")
+            return priority_arrays
+        except ErrorRejectAbortNack as err:
+            logging.info(f" RPM priority-array rejected by {address}, reading one by one: {err}")
+            for key, entry in entries:
+                try:
+                    priority_arrays[key] = await self._request(
+                        address,
+                        lambda: self.app.read_property(
+                            Address(address),
+                            ObjectIdentifier(entry["object_identifier"]),
+                            PRIORITY_ARRAY,
+                        ),
+                    )
+                except (ErrorRejectAbortNack, DeviceUnavailable, asyncio.TimeoutError) as err:
+                    logging.error(f" Error reading priority-array for {key}: {err!r}")
+            return priority_arrays
+
+        for object_identifier, _, _, property_value in response:
+            if isinstance(property_value, ErrorType):
+                logging.error(
+                    f" priority-array error on {object_identifier}: "
+                    f"{property_value.errorClass}, {property_value.errorCode}"
+                )
+                continue
+            for key in keys_by_object.get(str(object_identifier), []):
+                priority_arrays[key] = property_value
+
+        return priority_arrays
+
+    async def _request(self, address, request_factory):
+        if self.request is None:
+            return await request_factory()
+        return await self.request(address, request_factory, RequestClass.CONTROL)
+
+    def plan(self, entries, priority_arrays):
+        """
+        Diff the ledger against what was read back, returning the
+        (entry, value) writes needed where value "null" is a release
+        """
+        writes = []
+        for key, entry in entries:
+            priority_array = priority_arrays.get(key)
+            if priority_array is None:
+                continue
+
+            actual = priority_slot_value(priority_array, entry["priority"])
+            if slot_matches(entry["value"], actual):
+                if entry["value"] is None and self.journal is not None:
+                    # already null on the device, close it out in the journal too
+                    self.journal.record_release(
+                        entry["address"],
+                        entry["object_identifier"],
+                        entry["property_identifier"],
+                        entry["priority"],
+                    )
+                self.ledger.confirm_released(key)
+                continue
+
+            if entry["value"] is None:
+                logging.info(f" Stuck override on {key} of {actual}, releasing")
+                writes.append((entry, "null"))
+            else:
+                logging.info(
+                    f" Override on {key} is {actual} expected {entry['value']}, re-asserting"
+                )
+                writes.append((entry, entry["value"]))
+
+        return writes
+
+    async def reconcile(self):
+        """
+        One reconciliation pass across all devices in the ledger,
+        returns the number of corrective writes the devices took
+        """
+        corrections = 0
+        for address, entries in self.ledger.by_device().items():
+            priority_arrays = await self.read_priority_arrays(address, entries)
+            for entry, value in self.plan(entries, priority_arrays):
+                if await self.write_property_task(
+                    Address(entry["address"]),
+                    ObjectIdentifier(entry["object_identifier"]),
+                    entry["property_identifier"],
+                    value,
+                    entry["priority"],
+                ):
+                    corrections += 1
+
+        logging.info(f" Priority-array reconciliation issued {corrections} writes")
+        return corrections
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import logging
+
+from request_dispatcher import TokenBucket, network_of
+
+
+def release_offset(key, window, salt=""):
+    """
+    Seconds into the release window for a zone. Hashing the zone key
+    keeps the spread the same across restarts and gateways, `salt`
+    (the event id) shuffles which zones go first from event to event.
+    """
+    digest = hashlib.blake2b(f"{salt}/{key}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64 * window
+
+
+class ReleaseScheduler:
+    """
+    Spreads the post event release writes over `window` seconds so the
+    zones do not all rebound at once and the trunks never see one burst
+    of writes. Each network gets its own release write budget, kept
+    under the dispatcher's rate so polling still gets through. The wave
+    and its writes run as tasks of `spawn(work, key=...)`, the app's
+    TaskSupervisor.
+    """
+    def __init__(self, spawn, window, network_rates, default_rate, default_burst):
+        self.spawn = spawn
+        self.window = window
+        self.network_rates = network_rates
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.buckets = {}
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.dropped = 0
+        self.drop_kinds = set()  # kinds of point the running wave leaves alone
+        self.result = None  # progress of the last wave that ran to the end
+        self._task = None
+        self._logged_percent = 0
+
+    def _bucket(self, network):
+        bucket = self.buckets.get(network)
+        if bucket is None:
+            rate, burst = self.network_rates.get(network, (self.default_rate, self.default_burst))
+            bucket = TokenBucket(rate, burst)
+            self.buckets[network] = bucket
+        return bucket
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def progress(self):
+        finished = self.done + self.failed + self.dropped
+        percent = 100.0 if self.total == 0 else 100.0 * finished / self.total
+        return {
+            "total": self.total,
+            "done": self.done,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "percent": round(percent, 1),
+        }
+
+    def start(self, releases, salt=""):
+        """
+        Run a release wave in the background, `releases` is a list of
+        (zone key, device address, point kind, async callable doing one
+        release write). A wave still running is cancelled first.
+        """
+        self.cancel()
+        self.drop_kinds = set()
+        self._task = self.spawn(self.run(releases, salt), key="wave")
+        return self._task
+
+    def cancel(self):
+        # a new event is starting, its overrides must not be released
+        if self.running:
+            logging.info(f" Cancelling release wave at {self.progress()['percent']}%")
+            self._task.cancel()
+        self._task = None
+
+    def drop(self, kind):
+        """
+        Leave the points of one kind (e.g. "setpoint") to whoever writes
+        them now, the rest of the wave keeps releasing
+        """
+        if self.running and kind not in self.drop_kinds:
+            logging.info(f" Release wave leaves {kind} points alone from {self.progress()['percent']}%")
+        self.drop_kinds.add(kind)
+
+    async def run(self, releases, salt=""):
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        # the fields of a zone share its offset, order on the offset only
+        schedule = sorted(
+            (
+                (release_offset(key, self.window, salt), key, address, kind, release)
+                for key, address, kind, release in releases
+            ),
+            key=lambda item: item[0],
+        )
+        self.total = len(schedule)
+        self.done = 0
+        self.failed = 0
+        self.dropped = 0
+        self.result = None
+        self._logged_percent = 0
+        logging.info(f" Releasing {self.total} points over {self.window:.0f} seconds")
+
+        pending = set()
+        try:
+            for offset, key, address, kind, release in schedule:
+                delay = start + offset - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if kind in self.drop_kinds:
+                    self.dropped += 1
+                    continue
+                await self._bucket(network_of(address)).acquire()
+                # zone keys repeat across fields, let the supervisor number them
+                task = self.spawn(self._release(key, release))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending)
+        finally:
+            for task in pending:
+                task.cancel()
+
+        self.result = self.progress()
+        logging.info(f" Release wave finished {self.result}")
+        return self.result
+
+    async def _release(self, key, release):
+        try:
+            ok = await release()
+        except Exception as e:
+            logging.error(f" Release of {key} failed: {e}")
+            ok = False
+        if ok is False:
+            self.failed += 1
+        else:
+            self.done += 1
+
+        percent = self.progress()["percent"]
+        if percent >= self._logged_percent + 25.0 or percent == 100.0:
+            self._logged_percent = percent
+            logging.info(f" Release wave {percent}% complete ({self.done} ok, {self.failed} failed)")
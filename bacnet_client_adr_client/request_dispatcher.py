@@ -0,0 +1,225 @@
+import time
+import heapq
+import asyncio
+import logging
+import functools
+import itertools
+from enum import IntEnum
+
+
+class RequestClass(IntEnum):
+    """
+    BACnet request priority classes, lower value goes first
+    """
+    DR_OVERRIDE = 0  # shed overrides and releases
+    CONTROL = 1  # reads and writes the algorithm needs to make decisions
+    TELEMETRY = 2  # reporting and logging
+    DISCOVERY = 3  # who-is, object lists and other bulk scans
+
+
+# default seconds from submit until a request of each class is due
+CLASS_DEADLINES = {
+    RequestClass.DR_OVERRIDE: 5.0,
+    RequestClass.CONTROL: 30.0,
+    RequestClass.TELEMETRY: 120.0,
+    RequestClass.DISCOVERY: 600.0,
+}
+
+
+def network_of(address):
+    """
+    Group addresses by the trunk their traffic shares, the remote network
+    number for routed MS/TP addresses like 32:18, "ip" for the local
+    BACnet/IP network
+    """
+    address = str(address)
+    if "/" in address or "." in address:
+        return "ip"
+    if ":" in address:
+        return address.split(":", 1)[0]
+    return "local"
+
+
+class TokenBucket:
+    """
+    Requests per second budget for one network with a burst allowance
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        self._refill()
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    async def acquire(self):
+        delay = self.wait_time()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.wait_time()
+        self.tokens -= 1.0
+
+
+class _NetworkQueue:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.heaps = {request_class: [] for request_class in RequestClass}
+        self.ready = asyncio.Event()
+
+    def __len__(self):
+        return sum(len(heap) for heap in self.heaps.values())
+
+    def pop(self, now):
+        """
+        Highest class first and earliest deadline within a class, except
+        a lower class request already past its deadline goes ahead of
+        everything but DR overrides so polling and discovery never starve
+        """
+        if self.heaps[RequestClass.DR_OVERRIDE]:
+            return heapq.heappop(self.heaps[RequestClass.DR_OVERRIDE])
+
+        overdue = [
+            heap for heap in self.heaps.values() if heap and heap[0][0] <= now
+        ]
+        if overdue:
+            return heapq.heappop(min(overdue, key=lambda heap: heap[0][0]))
+
+        for request_class in RequestClass:
+            if self.heaps[request_class]:
+                return heapq.heappop(self.heaps[request_class])
+        return None
+
+
+class RequestDispatcher:
+    """
+    Central queue for all BACnet traffic. Each network gets its own
+    worker and token bucket so a busy MS/TP trunk does not hold up the
+    IP network, and within a network DR overrides always go next.
+    The workers are started through `spawn(work, key=..., restart=True)`,
+    the app's TaskSupervisor, which restarts one that crashes.
+    """
+    def __init__(self, spawn, network_rates=None, default_rate=20.0, default_burst=10, concurrency=1):
+        self.spawn = spawn
+        self.network_rates = dict(network_rates or {})
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.concurrency = concurrency
+        self.networks = {}
+        self._sequence = itertools.count()
+        self.waits = {request_class: [] for request_class in RequestClass}
+
+    def _queue(self, network):
+        if network not in self.networks:
+            rate, burst = self.network_rates.get(
+                network, (self.default_rate, self.default_burst)
+            )
+            queue = _NetworkQueue(TokenBucket(rate, burst))
+            self.networks[network] = queue
+            for worker in range(self.concurrency):
+                self.spawn(
+                    functools.partial(self._worker, network, queue),
+                    key=f"{network}/{worker}",
+                    restart=True,
+                )
+        return self.networks[network]
+
+    async def submit(self, address, request_factory, request_class=RequestClass.CONTROL, deadline=None):
+        """
+        Queue one request and wait for its result, `request_factory`
+        returns the coroutine to run once the request is dispatched.
+        Raises asyncio.TimeoutError when there is no result one class
+        deadline past the request's deadline.
+        """
+        now = time.monotonic()
+        if deadline is None:
+            deadline = now + CLASS_DEADLINES[request_class]
+        timeout = max(deadline - now, 0.0) + CLASS_DEADLINES[request_class]
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queue(network_of(address))
+        heapq.heappush(
+            queue.heaps[request_class],
+            (deadline, next(self._sequence), request_class, now, request_factory, future),
+        )
+        queue.ready.set()
+        return await asyncio.wait_for(future, timeout)
+
+    async def _worker(self, network, queue):
+        while True:
+            try:
+                await self._dispatch_next(network, queue)
+            except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                raise
+            except BaseException as err:
+                # never let one request take the network's worker down
+                logging.error(f" Dispatcher worker on network {network} failed: {err!r}")
+
+    async def _dispatch_next(self, network, queue):
+        while True:
+            await queue.ready.wait()
+            if not len(queue):
+                queue.ready.clear()
+                continue
+
+            await queue.bucket.acquire()
+            entry = queue.pop(time.monotonic())
+            if entry is None:
+                continue
+
+            deadline, _, request_class, submitted, request_factory, future = entry
+            if future.cancelled():
+                continue
+
+            started = time.monotonic()
+            self._record_wait(request_class, started - submitted)
+            if started > deadline:
+                logging.warning(
+                    f" {request_class.name} request on network {network} "
+                    f"dispatched {started - deadline:.1f}s past its deadline"
+                )
+
+            try:
+                result = await request_factory()
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except BaseException as err:
+                # bacpypes3 error, reject and abort replies are BaseException
+                if not future.done():
+                    future.set_exception(err)
+                if isinstance(err, (KeyboardInterrupt, SystemExit)):
+                    raise
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    def _record_wait(self, request_class, wait):
+        waits = self.waits[request_class]
+        waits.append(wait)
+        if len(waits) > 1000:
+            del waits[:500]
+
+    def stats(self):
+        """
+        Queue depth per network and queue wait per request class
+        """
+        return {
+            "queued": {network: len(queue) for network, queue in self.networks.items()},
+            "wait_seconds": {
+                request_class.name: {
+                    "max": max(waits) if waits else 0.0,
+                    "mean": sum(waits) / len(waits) if waits else 0.0,
+                }
+                for request_class, waits in self.waits.items()
+            },
+        }
@@ -0,0 +1,270 @@
+"""
+Sharded gateway runtime across CPU cores
+
+$ python shard_runtime.py
+
+A coordinator process owns the VEN clients and the event store and runs
+no BACnet of its own. Each entry in SHARDS is a worker process with its
+own bacpypes3 application bound to its own address / port, its own
+Trane and Mecho devices, and its own journal. Workers follow the
+coordinator's event store over a local Unix socket (one JSON snapshot
+per line, on every change and every SHARD_STATE_INTERVAL_SECONDS as a
+heartbeat) and schedule, precool, shed and release on their own. A
+worker that crashes is restarted by the coordinator with backoff and
+recovers its overrides from its journal, the other shards and the VEN
+keep running.
+"""
+
+from bootstrap import startup
+
+import os
+import json
+import asyncio
+import logging
+import functools
+import multiprocessing
+from datetime import datetime, timezone
+
+from bacpypes3.pdu import Address
+from bacpypes3.argparse import SimpleArgumentParser
+
+from constants import *
+from utils import Utils
+from event_merge import LOWEST_RANK
+from main import DrApplication, bacnet_server_objects
+
+startup.mark("imports")
+
+
+def encode_events(events):
+    return {
+        event_id: {
+            "start": event["start"].isoformat(),
+            "end": event["end"].isoformat(),
+            "payload": event["payload"],
+        }
+        for event_id, event in events.items()
+    }
+
+
+def decode_events(events):
+    return {
+        event_id: {
+            "start": datetime.fromisoformat(event["start"]),
+            "end": datetime.fromisoformat(event["end"]),
+            "payload": event["payload"],
+        }
+        for event_id, event in events.items()
+    }
+
+
+def same_event(a, b):
+    return (a["start"], a["end"], a["payload"]) == (b["start"], b["end"], b["payload"])
+
+
+class ShardCoordinator(Utils):
+    """
+    Owns the VENs and the event store, publishes it to the shard
+    workers and keeps one worker process per shard running
+    """
+    def __init__(self, shards, socket_path, max_buffer=1 << 20):
+        super().__init__(journal_path=SHARD_COORDINATOR_JOURNAL_PATH)
+        self.shards = shards
+        self.socket_path = socket_path
+        self.max_buffer = max_buffer
+        self.subscribers = set()
+        self.exits = {}
+
+        # the socket is up before any event can arrive or any worker connects
+        self.tasks.spawn("dr_state_server", self.serve_dr_state, restart=True)
+        self.tasks.spawn("ven", self.start_ven)
+        self.tasks.spawn("dr_state", self.publish_loop, restart=True)
+        for shard in shards:
+            self.tasks.spawn(
+                "shard", functools.partial(self.run_shard, shard), key=shard["name"], restart=True
+            )
+
+    async def schedule_event_tasks(self, event_id):
+        # the workers schedule the event, the coordinator only tells them
+        self.publish()
+
+    def cancel_event(self, event_id):
+        super().cancel_event(event_id)
+        self.publish()
+
+    async def serve_dr_state(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self.on_subscriber, path=self.socket_path)
+        logging.info(f" DR state socket on {self.socket_path}")
+        async with server:
+            await server.serve_forever()
+
+    async def on_subscriber(self, reader, writer):
+        self.subscribers.add(writer)
+        self.publish()
+        try:
+            # workers never send, EOF means the worker went away
+            await reader.read()
+        finally:
+            self.subscribers.discard(writer)
+            writer.close()
+
+    def publish(self):
+        line = json.dumps({
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "events": encode_events(self.active_events),
+        }).encode("utf-8") + b"\n"
+        for writer in list(self.subscribers):
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > self.max_buffer:
+                # a stuck worker is dropped, it reconnects and gets a fresh snapshot
+                self.subscribers.discard(writer)
+                writer.close()
+                continue
+            writer.write(line)
+
+    async def publish_loop(self):
+        while True:
+            await asyncio.sleep(SHARD_STATE_INTERVAL_SECONDS)
+            now = datetime.now(timezone.utc)
+            for event_id in [i for i, event in self.active_events.items() if event["end"] <= now]:
+                event = self.active_events.pop(event_id)
+                self.journal.record_event_end(event_id, event)
+                logging.info(f"Event {event_id} has ended.")
+
+            # the coordinator's own view, reported to the VTN
+            active = [event for event in self.active_events.values() if event["start"] <= now]
+            self.dr_event_active = bool(active)
+            if active:
+                self.current_server_payload = min(active, key=lambda event: event.get("rank", LOWEST_RANK))["payload"]
+            else:
+                self.current_server_payload = DEFAULT_PAYLOAD_SIGNAL
+            self.publish()
+
+    async def run_shard(self, shard):
+        name = shard["name"]
+        process = multiprocessing.get_context("spawn").Process(
+            target=run_shard_worker,
+            args=(shard, self.socket_path),
+            name=f"shard-{name}",
+            daemon=True,
+        )
+        process.start()
+        logging.info(f" Shard {name} started as pid {process.pid}")
+        try:
+            await asyncio.to_thread(process.join)
+        finally:
+            if process.is_alive():
+                process.terminate()
+                await asyncio.to_thread(process.join, 5.0)
+        self.exits[name] = process.exitcode
+        raise RuntimeError(f"shard {name} exited with code {process.exitcode}")
+
+    def shard_stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "live": len(self.tasks.tasks.get("shard", {})),
+            "exits": dict(self.exits),
+        }
+
+    async def collect_report_value(self):
+        logging.info(f" Shards: {self.shard_stats()}")
+        return await super().collect_report_value()
+
+
+class ShardWorker(DrApplication):
+    """
+    One shard's BACnet application and devices, runs no VEN and mirrors
+    the coordinator's event store into its own scheduler and journal
+    """
+    def __init__(self, args, shard, socket_path, **objects):
+        self.shard_name = shard["name"]
+        self.socket_path = socket_path
+        super().__init__(
+            args,
+            ven=False,
+            journal_path=SHARD_JOURNAL_PATH.format(name=shard["name"]),
+            history_path=None,
+            trane_address=Address(shard["trane_address"]),
+            mecho_address=Address(shard["mecho_address"]),
+            dr_state_path=f"{DR_STATE_SEGMENT_PATH}.{shard['name']}" if DR_STATE_SEGMENT_PATH else None,
+            **objects,
+        )
+
+    async def start_ven(self):
+        # recover this shard's events and overrides, then follow the coordinator
+        await self.recover_from_journal()
+        startup.mark("journal_recovered")
+        self.tasks.spawn("dr_state", self.follow_coordinator, restart=True)
+        startup.ready(STARTUP_BUDGET_SECONDS)
+
+    async def follow_coordinator(self):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=1 << 20)
+        logging.info(f" Shard {self.shard_name} following {self.socket_path}")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self.apply_dr_state(json.loads(line))
+        finally:
+            writer.close()
+        raise ConnectionError("coordinator closed the DR state socket")
+
+    async def apply_dr_state(self, state):
+        now = datetime.now(timezone.utc)
+        events = {
+            event_id: event
+            for event_id, event in decode_events(state["events"]).items()
+            if event["end"] > now
+        }
+
+        for event_id in list(self.active_events):
+            event = self.active_events[event_id]
+            if event_id in events or event["end"] <= now:
+                # an ended event finishes and releases on its own
+                continue
+            in_progress = event["start"] <= now
+            self.cancel_event(event_id)
+            if in_progress:
+                self.dr_event_active = False
+                self.current_server_payload = DEFAULT_PAYLOAD_SIGNAL
+                self.poll_wakeup.set()
+                await self.do_release_all_hvac(event_id)
+
+        for event_id, event in events.items():
+            held = self.active_events.get(event_id)
+            if held is not None and same_event(held, event):
+                continue
+            self.active_events[event_id] = event
+            self.journal.record_event(event_id, event["start"], event["end"], event["payload"])
+            await self.schedule_event_tasks(event_id)
+
+
+async def shard_main(shard, socket_path):
+    args = SimpleArgumentParser().parse_args([
+        "--name", shard["name"],
+        "--instance", str(shard["instance"]),
+        "--address", shard["address"],
+    ])
+    worker = ShardWorker(args, shard, socket_path, **bacnet_server_objects())
+    startup.mark("bacnet_app")
+    await worker.tasks.run()
+
+
+def run_shard_worker(shard, socket_path):
+    """
+    Process entry of one shard worker, pinned to `cpu` when set
+    """
+    if shard.get("cpu") is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {shard["cpu"]})
+    startup.run(functools.partial(shard_main, shard, socket_path), use_uvloop=USE_UVLOOP)
+
+
+async def main():
+    coordinator = ShardCoordinator(SHARDS, SHARD_STATE_SOCKET)
+    await coordinator.tasks.run()
+
+
+if __name__ == "__main__":
+    startup.run(main, use_uvloop=USE_UVLOOP)
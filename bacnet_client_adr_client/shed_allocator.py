@@ -0,0 +1,128 @@
+import numpy as np
+
+from decision_kernel import TRANE_MODE_HEATING, TRANE_MODE_COOLING
+
+
+# how the ADR signal_payload is read
+SHED_PAYLOAD_SIMPLE = "simple"  # OpenADR SIMPLE level 0 to 3
+SHED_PAYLOAD_KW = "kw"  # requested reduction in kW
+
+
+class ShedPlan:
+    """
+    Setpoint shed picked for every zone, one element per zone.
+    `setpoint_adj` is what decide() nudges each setpoint by, NaN for
+    zones the plan leaves alone so their setpoint override is released.
+    """
+    def __init__(self, target_kw, steps, setpoint_adj, shed_kw, comfort_cost):
+        self.target_kw = target_kw
+        self.steps = steps
+        self.setpoint_adj = setpoint_adj
+        self.shed_kw = shed_kw
+        self.comfort_cost = comfort_cost
+
+    @property
+    def planned_kw(self):
+        return float(self.shed_kw.sum())
+
+    @property
+    def target_met(self):
+        return self.planned_kw >= self.target_kw
+
+
+def setpoint_ladders(kw_per_degree, comfort_weight, step_degrees, max_steps):
+    """
+    Per zone ladders of setpoint steps as [zone, step] arrays of the kW
+    each step sheds and the comfort it costs. Comfort cost grows with the
+    square of the offset so every further step costs more than the last.
+    """
+    kw_per_degree = np.asarray(kw_per_degree, dtype=float)
+    comfort_weight = np.broadcast_to(np.asarray(comfort_weight, dtype=float), kw_per_degree.shape)
+
+    step = np.arange(1, max_steps + 1, dtype=float)
+    step_kw = np.repeat((kw_per_degree * step_degrees)[:, None], max_steps, axis=1)
+    # (k * d)^2 - ((k - 1) * d)^2
+    step_cost = comfort_weight[:, None] * step_degrees ** 2 * (2.0 * step - 1.0)[None, :]
+    return step_kw, step_cost
+
+
+def shed_target_kw(payload, potential_kw, payload_mode, level_fractions):
+    """
+    kW to shed for an ADR payload, a SIMPLE level asks for a fraction
+    of what the zones could shed at most
+    """
+    if payload_mode == SHED_PAYLOAD_KW:
+        return max(0.0, float(payload))
+    level = int(round(float(payload)))
+    level = min(max(level, 0), max(level_fractions))
+    return level_fractions.get(level, 0.0) * potential_kw
+
+
+def allocate_shed(target_kw, step_kw, step_cost, available, step_degrees):
+    """
+    Cheapest set of setpoint steps that sheds at least `target_kw`.
+
+    This is the LP relaxation of the knapsack (take steps in order of
+    comfort cost per kW) solved with one sort over every step of every
+    zone instead of a heap, then rounded up to whole steps. Ladders are
+    treated as convex, a step's cost per kW is never below the one
+    before it, so each zone's picked steps are a prefix of its ladder.
+    """
+    step_kw = np.asarray(step_kw, dtype=float)
+    step_cost = np.asarray(step_cost, dtype=float)
+    available = np.asarray(available, dtype=bool)
+    zone_count, max_steps = step_kw.shape
+
+    usable = available[:, None] & (step_kw > 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(usable, step_cost / step_kw, np.inf)
+    ratio = np.maximum.accumulate(ratio, axis=1)
+
+    steps = np.zeros(zone_count, dtype=int)
+    if target_kw > 0.0 and usable.any():
+        flat_ratio = ratio.ravel()
+        step_index = np.tile(np.arange(max_steps), zone_count)
+        order = np.lexsort((step_index, flat_ratio))
+        order = order[np.isfinite(flat_ratio[order])]
+
+        cumulative_kw = np.cumsum(step_kw.ravel()[order])
+        take = min(int(np.searchsorted(cumulative_kw, target_kw)) + 1, order.size)
+        picked_zones = order[:take] // max_steps
+        steps = np.bincount(picked_zones, minlength=zone_count)
+
+    taken = np.arange(max_steps)[None, :] < steps[:, None]
+    shed_kw = np.where(taken, step_kw, 0.0).sum(axis=1)
+    comfort_cost = np.where(taken, step_cost, 0.0).sum(axis=1)
+    setpoint_adj = np.where(steps > 0, steps * step_degrees, np.nan)
+
+    return ShedPlan(float(target_kw), steps, setpoint_adj, shed_kw, comfort_cost)
+
+
+def plan_setpoint_shed(
+    payload,
+    mode,
+    occupied,
+    dr_active,
+    kw_per_degree,
+    comfort_weight,
+    step_degrees,
+    max_steps,
+    payload_mode,
+    level_fractions,
+):
+    """
+    Shed plan for the zones decide() would nudge, occupied zones that
+    are heating or cooling during an event
+    """
+    mode = np.asarray(mode, dtype=float)
+    occupied = np.asarray(occupied, dtype=bool)
+    available = (
+        np.broadcast_to(np.asarray(dr_active, dtype=bool), mode.shape)
+        & occupied
+        & ((mode == TRANE_MODE_HEATING) | (mode == TRANE_MODE_COOLING))
+    )
+
+    step_kw, step_cost = setpoint_ladders(kw_per_degree, comfort_weight, step_degrees, max_steps)
+    potential_kw = float(np.where(available[:, None], step_kw, 0.0).sum())
+    target_kw = shed_target_kw(payload, potential_kw, payload_mode, level_fractions)
+    return allocate_shed(target_kw, step_kw, step_cost, available, step_degrees)
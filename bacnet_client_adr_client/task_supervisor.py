@@ -0,0 +1,151 @@
+import sys
+import asyncio
+import inspect
+import logging
+import itertools
+
+_log = logging.getLogger(__name__)
+
+
+def _close_unstarted(work):
+    # a superseded coroutine that never ran would warn about never being awaited
+    if inspect.iscoroutine(work) and inspect.getcoroutinestate(work) == inspect.CORO_CREATED:
+        work.close()
+
+
+def task_memory(task):
+    """
+    Rough bytes held by a task, the task and the chain of coroutines it
+    is suspended in with their frame locals (shallow sizes only)
+    """
+    size = sys.getsizeof(task)
+    coro = task.get_coro()
+    while coro is not None:
+        size += sys.getsizeof(coro)
+        frame = getattr(coro, "cr_frame", None)
+        if frame is not None:
+            size += sys.getsizeof(frame)
+            size += sum(sys.getsizeof(value) for value in frame.f_locals.values())
+        coro = getattr(coro, "cr_await", None)
+        if not asyncio.iscoroutine(coro):
+            break
+    return size
+
+
+class TaskSupervisor:
+    """
+    Owns every background task of the app inside one asyncio.TaskGroup,
+    tracked by role and key (e.g. an event id). Spawning a task under a
+    key that is still live cancels the one it supersedes. A crashed
+    task is logged and, for long running loops spawned with
+    `restart=True`, started again with exponential backoff instead of
+    dying silently or taking the whole group down with it.
+
+    Tasks spawned before run() is awaited are held and started with it.
+    """
+    def __init__(self, restart_min=1.0, restart_max=60.0, healthy_seconds=60.0):
+        self.restart_min = restart_min
+        self.restart_max = restart_max
+        self.healthy_seconds = healthy_seconds
+        self.tasks = {}  # role -> {key: task}
+        self.crashes = {}
+        self.restarts = {}
+        self._group = None
+        self._pending = []
+        self._ids = itertools.count()
+
+    async def run(self):
+        """
+        Run the task group until the app is stopped, never returns
+        """
+        async with asyncio.TaskGroup() as group:
+            self._group = group
+            pending, self._pending = self._pending, []
+            for role, key, work, restart in pending:
+                self._start(role, key, work, restart)
+            await asyncio.Future()
+
+    def spawn(self, role, work, key=None, restart=False):
+        """
+        Start `work` under `role`, a coroutine function (needed for
+        restart) or a coroutine. Returns the task, None when it is held
+        until run() starts.
+        """
+        if restart and not callable(work):
+            raise ValueError("restart needs a coroutine function, not a coroutine")
+        if key is None:
+            key = next(self._ids)
+        if self._group is None:
+            for item in self._pending:
+                if (item[0], item[1]) == (role, key):
+                    _close_unstarted(item[2])
+            self._pending = [item for item in self._pending if (item[0], item[1]) != (role, key)]
+            self._pending.append((role, key, work, restart))
+            return None
+        return self._start(role, key, work, restart)
+
+    def _start(self, role, key, work, restart):
+        self.cancel(role, key)
+        task = self._group.create_task(
+            self._supervise(role, key, work, restart), name=f"{role}:{key}"
+        )
+        self.tasks.setdefault(role, {})[key] = task
+        task.add_done_callback(lambda done: self._forget(role, key, done, work))
+        return task
+
+    def _forget(self, role, key, task, work):
+        # cancelled before its first step, `work` never got to run
+        _close_unstarted(work)
+        tasks = self.tasks.get(role, {})
+        if tasks.get(key) is task:
+            del tasks[key]
+
+    def cancel(self, role, key=None):
+        """
+        Cancel one task of a role, or every task of the role without a key
+        """
+        tasks = self.tasks.get(role, {})
+        keys = list(tasks) if key is None else [key]
+        for task_key in keys:
+            task = tasks.get(task_key)
+            if task is not None and not task.done():
+                task.cancel()
+
+    async def _supervise(self, role, key, work, restart):
+        loop = asyncio.get_running_loop()
+        delay = self.restart_min
+        while True:
+            started = loop.time()
+            try:
+                await (work() if callable(work) else work)
+                return
+            except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+                raise
+            except BaseException as e:
+                # bacpypes3 error replies are BaseException, still a crash
+                self.crashes[role] = self.crashes.get(role, 0) + 1
+                _log.error(f" Task {role}:{key} crashed: {e!r}")
+                if not restart:
+                    return
+
+            if loop.time() - started >= self.healthy_seconds:
+                delay = self.restart_min
+            _log.info(f" Restarting {role}:{key} in {delay:.1f} seconds")
+            await asyncio.sleep(delay)
+            self.restarts[role] = self.restarts.get(role, 0) + 1
+            delay = min(delay * 2.0, self.restart_max)
+
+    def stats(self):
+        """
+        {role: live tasks, crashes, restarts, estimated bytes held}
+        """
+        roles = set(self.tasks) | set(self.crashes)
+        return {
+            role: {
+                "live": len(self.tasks.get(role, {})),
+                "crashes": self.crashes.get(role, 0),
+                "restarts": self.restarts.get(role, 0),
+                "memory_bytes": sum(task_memory(task) for task in self.tasks.get(role, {}).values()),
+            }
+            for role in sorted(roles)
+        }
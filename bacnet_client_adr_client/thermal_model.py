@@ -0,0 +1,269 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from decision_kernel import TRANE_MODE_HEATING, TRANE_MODE_COOLING
+
+
+# zone history channels the model is fit from
+HISTORY_CHANNELS = ("temp", "setpoint", "mode", "outdoor")
+
+
+class ZoneHistory:
+    """
+    Recent zone temperature, setpoint, hvac mode and (optional) outdoor
+    temperature readings per zone, each channel kept as it was polled
+    and put on a common time grid only when a model is fit
+    """
+    def __init__(self, zone_count, max_samples=20_000):
+        self.zone_count = zone_count
+        self.samples = [
+            {channel: deque(maxlen=max_samples) for channel in HISTORY_CHANNELS}
+            for _ in range(zone_count)
+        ]
+
+    def record(self, zone, timestamp=None, **values):
+        timestamp = time.time() if timestamp is None else timestamp
+        for channel, value in values.items():
+            if value is None:
+                continue
+            try:
+                self.samples[zone][channel].append((timestamp, float(value)))
+            except (TypeError, ValueError):
+                continue
+
+    def latest(self, channel):
+        return np.array([
+            zone[channel][-1][1] if zone[channel] else np.nan for zone in self.samples
+        ])
+
+    def grid(self, step_seconds, window_seconds, end=None, max_gap_steps=3):
+        """
+        [zone, step] arrays of every channel on a regular grid ending at
+        `end`, the last reading at or before each step carried forward,
+        NaN where no reading is younger than `max_gap_steps` steps
+        """
+        end = time.time() if end is None else end
+        steps = int(window_seconds // step_seconds)
+        times = end - step_seconds * np.arange(steps - 1, -1, -1)
+
+        grids = {}
+        for channel in HISTORY_CHANNELS:
+            grid = np.full((self.zone_count, steps), np.nan)
+            for zone, samples in enumerate(self.samples):
+                if not samples[channel]:
+                    continue
+                observed = np.array(samples[channel])
+                index = np.searchsorted(observed[:, 0], times, side="right") - 1
+                found = index >= 0
+                age = np.where(found, times - observed[np.maximum(index, 0), 0], np.inf)
+                fresh = found & (age <= max_gap_steps * step_seconds)
+                grid[zone] = np.where(fresh, observed[np.maximum(index, 0), 1], np.nan)
+            grids[channel] = grid
+        return times, grids
+
+
+def hvac_drive(temp, setpoint, mode):
+    """
+    How hard the zone's HVAC is pulling toward its setpoint, degrees
+    below the setpoint when heating and above it when cooling. The HVAC
+    idles (zero drive) once the zone is on the right side of setpoint,
+    which is where a precooled zone rides out a DR setback.
+    """
+    error = setpoint - temp
+    return np.where(
+        mode == TRANE_MODE_HEATING,
+        np.maximum(error, 0.0),
+        np.where(mode == TRANE_MODE_COOLING, np.minimum(error, 0.0), 0.0),
+    )
+
+
+class ThermalModels:
+    """
+    First order RC model per zone, per time step:
+
+        T[k+1] - T[k] = k_hvac * drive[k] + k_env * (T_out[k] - T[k]) + drift
+
+    `drift` is the internal and solar gain (and outdoor load when no
+    outdoor temperature is logged). `usable` zones had enough samples
+    and fit a stable, physically sensible model.
+    """
+    def __init__(self, step_seconds, k_hvac, k_env, drift, rmse, samples, usable):
+        self.step_seconds = step_seconds
+        self.k_hvac = k_hvac
+        self.k_env = k_env
+        self.drift = drift
+        self.rmse = rmse
+        self.samples = samples
+        self.usable = usable
+
+    @property
+    def hvac_time_constant(self):
+        # seconds for the HVAC to close 63% of a setpoint error
+        with np.errstate(divide="ignore"):
+            return self.step_seconds / self.k_hvac
+
+    def step(self, temp, setpoint, mode, outdoor=None):
+        """
+        One time step for arrays whose first axis is the zone, returns
+        (next temperature, HVAC drive in degrees)
+        """
+        shape = (-1,) + (1,) * (np.ndim(temp) - 1)
+        drive = hvac_drive(temp, setpoint, mode)
+        change = self.k_hvac.reshape(shape) * drive + self.drift.reshape(shape)
+        if outdoor is not None:
+            change = change + self.k_env.reshape(shape) * (outdoor - temp)
+        return temp + change, drive
+
+
+def fit_rc_models(temp, setpoint, mode, step_seconds, outdoor=None, min_samples=48, ridge=1e-6):
+    """
+    Fit every zone's RC model at once from [zone, step] history arrays,
+    one batched least squares solve over stacked normal equations
+    """
+    temp = np.asarray(temp, dtype=float)
+    setpoint = np.asarray(setpoint, dtype=float)
+    mode = np.asarray(mode, dtype=float)
+
+    change = temp[:, 1:] - temp[:, :-1]
+    drive = hvac_drive(temp[:, :-1], setpoint[:, :-1], mode[:, :-1])
+    columns = [drive, np.ones_like(drive)]
+    if outdoor is not None:
+        outdoor = np.asarray(outdoor, dtype=float)
+        columns.append(outdoor[:, :-1] - temp[:, :-1])
+    features = np.stack(columns, axis=2)  # [zone, sample, feature]
+
+    valid = np.isfinite(change) & np.all(np.isfinite(features), axis=2)
+    features = np.where(valid[:, :, None], features, 0.0)
+    change = np.where(valid, change, 0.0)
+
+    feature_count = features.shape[2]
+    gram = np.einsum("znf,zng->zfg", features, features) + ridge * np.eye(feature_count)
+    moment = np.einsum("znf,zn->zf", features, change)
+    theta = np.linalg.solve(gram, moment[:, :, None])[:, :, 0]
+
+    residual = np.where(valid, change - np.einsum("znf,zf->zn", features, theta), 0.0)
+    samples = valid.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rmse = np.sqrt((residual ** 2).sum(axis=1) / samples)
+
+    k_hvac = theta[:, 0]
+    drift = theta[:, 1]
+    k_env = theta[:, 2] if outdoor is not None else np.zeros_like(k_hvac)
+    usable = (
+        (samples >= min_samples)
+        & (k_hvac > 0.0) & (k_hvac <= 1.0)
+        & (k_env >= 0.0) & (k_env < 1.0)
+    )
+    # unusable zones simulate as if they had no thermal response at all
+    k_hvac = np.where(usable, k_hvac, 0.0)
+    k_env = np.where(usable, k_env, 0.0)
+    drift = np.where(usable, drift, 0.0)
+    return ThermalModels(step_seconds, k_hvac, k_env, drift, rmse, samples, usable)
+
+
+class PrecoolPlan:
+    """
+    Per zone pre-event setpoint offset and how long before the event
+    start it is held. Offsets are negative when precooling and positive
+    when preheating, zero lead means no pre-conditioning for that zone.
+    """
+    def __init__(self, event_start, lead_seconds, offset, base_setpoint, predicted_savings):
+        self.event_start = event_start
+        self.lead_seconds = lead_seconds
+        self.offset = offset
+        self.base_setpoint = base_setpoint
+        self.predicted_savings = predicted_savings
+
+    @property
+    def start(self):
+        return self.event_start - float(np.max(self.lead_seconds, initial=0.0))
+
+    def setpoint_at(self, now):
+        """
+        Setpoint trajectory value for every zone at `now`, NaN for zones
+        that are not pre-conditioning at that moment
+        """
+        before_start = self.event_start - now
+        active = (self.lead_seconds > 0) & (before_start > 0) & (before_start <= self.lead_seconds)
+        return np.where(active, self.base_setpoint + self.offset, np.nan)
+
+
+def plan_precool(
+    models,
+    event_start,
+    event_seconds,
+    current_temp,
+    base_setpoint,
+    mode,
+    event_adj,
+    max_offset,
+    offset_step,
+    lead_options,
+    peak_weight,
+    offpeak_weight,
+    now=None,
+    outdoor=None,
+):
+    """
+    Pick each zone's pre-event setpoint offset and lead time. Every
+    (lead, offset) candidate is simulated for every zone at once over
+    the lead and the event, costing HVAC drive at `offpeak_weight`
+    before the event and `peak_weight` during it, then the cheapest
+    candidate per zone wins. Ties keep the smaller lead and offset.
+    """
+    now = time.time() if now is None else now
+    step = models.step_seconds
+    mode = np.asarray(mode, dtype=float)
+    base_setpoint = np.asarray(base_setpoint, dtype=float)
+    event_adj = np.broadcast_to(np.asarray(event_adj, dtype=float), mode.shape)
+    event_adj = np.where(np.isfinite(event_adj), event_adj, 0.0)
+
+    heating = mode == TRANE_MODE_HEATING
+    cooling = mode == TRANE_MODE_COOLING
+    # precool pushes the setpoint down, preheat up, a DR setback the other way
+    direction = np.where(cooling, -1.0, np.where(heating, 1.0, 0.0))
+
+    leads = np.asarray(lead_options, dtype=float)
+    offsets = np.arange(0.0, max_offset + offset_step / 2.0, offset_step)
+    lead_grid, offset_grid = [grid.ravel() for grid in np.meshgrid(leads, offsets, indexing="ij")]
+
+    max_lead_steps = int(np.ceil(leads.max() / step)) if leads.size else 0
+    lead_steps = np.ceil(lead_grid / step).astype(int)
+    event_steps = max(1, int(np.ceil(event_seconds / step)))
+    # simulation starts at whichever is later, now or the longest lead
+    sim_start = max(now, event_start - max_lead_steps * step)
+    pre_steps = max(0, int(np.ceil((event_start - sim_start) / step)))
+
+    zone_count = mode.size
+    candidate_count = lead_grid.size
+    temp = np.broadcast_to(
+        np.asarray(current_temp, dtype=float)[:, None], (zone_count, candidate_count)
+    ).copy()
+    temp = np.where(np.isfinite(temp), temp, base_setpoint[:, None])
+    cost = np.zeros((zone_count, candidate_count))
+
+    pre_setpoint = base_setpoint[:, None] + direction[:, None] * offset_grid[None, :]
+    event_setpoint = base_setpoint - direction * event_adj
+    for k in range(pre_steps + event_steps):
+        if k < pre_steps:
+            steps_before = pre_steps - k
+            precooling = steps_before <= lead_steps
+            setpoint = np.where(precooling[None, :], pre_setpoint, base_setpoint[:, None])
+            weight = offpeak_weight
+        else:
+            setpoint = np.broadcast_to(event_setpoint[:, None], temp.shape)
+            weight = peak_weight
+        temp, drive = models.step(temp, setpoint, mode[:, None], outdoor)
+        cost += weight * models.k_hvac[:, None] * np.abs(drive)
+
+    # candidate 0 is no lead and no offset, argmin keeps it on ties
+    best = np.argmin(cost, axis=1)
+    savings = cost[:, 0] - cost[np.arange(zone_count), best]
+    eligible = models.usable & (direction != 0.0)
+
+    lead_seconds = np.where(eligible, lead_grid[best], 0.0)
+    offset = np.where(eligible, direction * offset_grid[best], 0.0)
+    lead_seconds = np.where(offset == 0.0, 0.0, lead_seconds)
+    return PrecoolPlan(event_start, lead_seconds, offset, base_setpoint, np.where(eligible, savings, 0.0))
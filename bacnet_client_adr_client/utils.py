@@ -5,22 +5,29 @@ from bacpypes3.apdu import ErrorRejectAbortNack
 from bacpypes3.local.analog import AnalogValueObject
 
 import re
+import time
 import asyncio
 import logging
+import functools
 from datetime import timedelta, datetime, timezone
 import asyncio
 from enum import Enum
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from openleadr import OpenADRClient, enable_default_logging
 
+from bootstrap import startup
 from constants import *
+from event_journal import EventJournal
+from reconcile import OverrideLedger
+from device_health import DeviceHealth, DeviceUnavailable
+from request_dispatcher import RequestClass, RequestDispatcher
+from point_cache import PointCache, point_key
+from release_scheduler import ReleaseScheduler
+from task_supervisor import TaskSupervisor
+from loop_lag import LoopLagMonitor
+from event_merge import LOWEST_RANK, event_rank, is_piece_of, merge_event
 
 
 _info = 1
 
-# Enable logging for openleadr
-enable_default_logging()
-
 # Configure the root logger
 logging.basicConfig(level=logging.INFO)
 logging.getLogger('apscheduler').setLevel(logging.ERROR)
@@ -37,37 +44,214 @@ class CommandableAnalogValueObject(Commandable, AnalogValueObject):
 
 
 class Utils:
-    def __init__(self):
+    def __init__(self, ven=True, journal_path=EVENT_JOURNAL_PATH, history_path=EVENT_HISTORY_PATH):
         self.current_server_payload = 0
         self.dr_event_active = False
         self.current_server_payload = DEFAULT_PAYLOAD_SIGNAL
         self.last_algorithm_run_time = None
         self.active_events = {}
-        self.client = OpenADRClient(ven_name=VEN_NAME, vtn_url=VTN_URL)
-        self.client.add_report(
-            callback=self.collect_report_value,
-            resource_id="main_meter",
-            measurement="power",
-            sampling_rate=timedelta(seconds=10),
+        # every background task, by role and event id
+        self.tasks = TaskSupervisor(
+            restart_min=TASK_RESTART_MIN_SECONDS,
+            restart_max=TASK_RESTART_MAX_SECONDS,
+        )
+        # the VEN is built once the journal is replayed, a shard worker
+        # follows the coordinator's events and runs no VEN
+        self.ven = ven
+        self.ven_host = None
+        self.push_listener = None
+        self.loop_lag = LoopLagMonitor(
+            interval=LOOP_LAG_SAMPLE_SECONDS, warn_ms=LOOP_LAG_WARN_MS
+        )
+        self._scheduler = None
+        self.journal = EventJournal(
+            journal_path,
+            fsync_batch=EVENT_JOURNAL_FSYNC_BATCH,
+            fsync_interval=EVENT_JOURNAL_FSYNC_INTERVAL_SECONDS,
+            history_path=history_path,
+        )
+        self.override_ledger = OverrideLedger()
+        self.device_health = DeviceHealth(
+            initial_timeout=BACNET_INITIAL_TIMEOUT_SECONDS,
+            min_timeout=BACNET_MIN_TIMEOUT_SECONDS,
+            max_timeout=BACNET_MAX_TIMEOUT_SECONDS,
+            failure_threshold=BACNET_BREAKER_FAILURE_THRESHOLD,
+            open_seconds=BACNET_BREAKER_OPEN_SECONDS,
+            max_open_seconds=BACNET_BREAKER_MAX_OPEN_SECONDS,
+        )
+        self.dispatcher = RequestDispatcher(
+            functools.partial(self.tasks.spawn, "dispatcher"),
+            BACNET_NETWORK_RATES,
+            default_rate=BACNET_DEFAULT_NETWORK_RATE,
+            default_burst=BACNET_DEFAULT_NETWORK_BURST,
+        )
+        # spreads the post event releases so zones do not rebound together
+        self.release_scheduler = ReleaseScheduler(
+            functools.partial(self.tasks.spawn, "release"),
+            RELEASE_WINDOW_SECONDS,
+            RELEASE_NETWORK_RATES,
+            default_rate=RELEASE_DEFAULT_NETWORK_RATE,
+            default_burst=RELEASE_DEFAULT_NETWORK_BURST,
+        )
+        # set on a DR start or end so polling loops re-plan right away
+        self.poll_wakeup = asyncio.Event()
+        self.point_cache = PointCache(
+            default_max_age=POINT_CACHE_DEFAULT_MAX_AGE_SECONDS,
+            max_age_by_object=POINT_CACHE_MAX_AGE_SECONDS,
         )
-        self.client.add_handler("on_event", self.handle_event)
-        self.scheduler = AsyncIOScheduler()
-        self.scheduler.start()
         
         
+    @property
+    def scheduler(self):
+        # APScheduler is only imported once the first event is scheduled
+        if self._scheduler is None:
+            self._scheduler = startup.load("apscheduler.schedulers.asyncio").AsyncIOScheduler()
+            self._scheduler.start()
+        return self._scheduler
+
+
+    def build_ven(self):
+        """
+        Import the VEN stack (openleadr, XML signing, aiohttp) and build
+        one VEN per program, with the push listener in push mode
+        """
+        startup.load("openleadr").enable_default_logging()
+        startup.load("ven_pipeline")
+        push_listener = startup.load("push_listener")
+        ven_host = startup.load("ven_host")
+
+        # push mode is mutual TLS or nothing, fail before any VEN registers
+        push_ssl_context = None
+        if PUSH_MODE_ENABLED:
+            push_ssl_context = push_listener.push_ssl_context(VEN_CERT_PATH, VEN_KEY_PATH, VTN_CA_PATH)
+
+        # XML build, signing, validation and parsing run in a shared worker
+        # pool, in push mode the VTN posts events and polling is only a health check
+        self.ven_host = ven_host.VenHost(
+            VEN_PROGRAMS,
+            self.handle_event,
+            self.collect_report_value,
+            cert=VEN_CERT_PATH,
+            key=VEN_KEY_PATH,
+            ca_file=VTN_CA_PATH,
+            workers=VEN_XML_WORKERS,
+            max_pending=VEN_XML_MAX_PENDING,
+            push_address=PUSH_TRANSPORT_ADDRESS if PUSH_MODE_ENABLED else None,
+            health_poll_seconds=PUSH_HEALTH_POLL_SECONDS,
+            keepalive=VEN_TLS_KEEPALIVE_SECONDS,
+        )
+        if PUSH_MODE_ENABLED:
+            self.push_listener = push_listener.PushListener(
+                self.ven_host.clients,
+                PUSH_LISTEN_HOST,
+                PUSH_LISTEN_PORT,
+                spawn=functools.partial(self.tasks.spawn, "ven_push"),
+                ssl_context=push_ssl_context,
+                keepalive=VEN_TLS_KEEPALIVE_SECONDS,
+            )
+
+
     def is_any_event_scheduled(self):
         """
         Check if there are any events scheduled in the active_events dictionary.
         Returns True if there are events, False otherwise.
         """
         return bool(self.active_events)
+
+
+    async def start_ven(self):
+        """
+        Replay the event journal before talking to the VTN so
+        future events are re-armed and stuck overrides released.
+        The VEN stack is only imported after that, a restart mid
+        event re-arms it without waiting on openleadr.
+        """
+        await self.recover_from_journal()
+        startup.mark("journal_recovered")
+        if not self.ven:
+            return
+        self.build_ven()
+        startup.mark("ven_loaded")
+        if self.push_listener is not None:
+            # listening before registration, the VTN may push right after it
+            self.tasks.spawn("push_listener", self.push_listener.run, restart=True)
+        await self.ven_host.run()
+        startup.ready(STARTUP_BUDGET_SECONDS)
+
+
+    async def recover_from_journal(self):
+        start = time.perf_counter()
+        state = self.journal.replay()
+        now = datetime.now(timezone.utc)
+
+        for event_id, event in state.events.items():
+            if event["end"] <= now:
+                logging.info(f" Journal event {event_id} already ended, dropping it")
+                continue
+            self.active_events[event_id] = event
+            await self.schedule_event_tasks(event_id)
+            logging.info(f" Re-armed event {event_id} from journal")
+
+        event_in_progress = any(
+            event["start"] <= now < event["end"] for event in self.active_events.values()
+        )
+
+        for override in state.overrides.values():
+            if event_in_progress:
+                # the re-armed event keeps the overrides, release them when it ends
+                self.override_ledger.set_override(
+                    override["address"],
+                    override["object_identifier"],
+                    override["property_identifier"],
+                    override["value"],
+                    override["priority"],
+                )
+            else:
+                self.override_ledger.set_released(
+                    override["address"],
+                    override["object_identifier"],
+                    override["property_identifier"],
+                    override["priority"],
+                )
+
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        logging.info(
+            f" Journal replay of {state.records} records took {elapsed_ms:.1f} ms"
+        )
+
+        if state.overrides:
+            # only the slots that do not match the journal get written
+            logging.info(f" Reconciling {len(state.overrides)} overrides from journal")
+            await self.override_reconciler.reconcile()
+            state.overrides = self.journal.replay().overrides
+            self.hvac_needs_to_be_released = bool(state.overrides)
+
+        self.journal.compact(self.active_events, state.overrides)
+
+
+    async def reconcile_overrides_loop(self):
+        """
+        Periodically confirm each point's priority array
+        matches the override ledger and fix only what drifted
+        """
+        while True:
+            await asyncio.sleep(OVERRIDE_RECONCILE_INTERVAL_SECONDS)
+            try:
+                await self.override_reconciler.reconcile()
+            except Exception as e:
+                logging.error(f" Error while reconciling overrides: {e}")
         
 
     async def handle_event_duration(self, start_delay, event_duration, event_id, payload):
+        # the report callback may prune the event once its end has passed,
+        # before this loop wakes up, keep it for the M&V history
+        event = self.active_events.get(event_id)
         try:
             logging.info(f"Starting event {event_id} with payload {payload}.")
+            self.release_scheduler.cancel()
             self.dr_event_active = True
             self.current_server_payload = payload
+            self.poll_wakeup.set()
 
             start_time = datetime.now(timezone.utc)
             logging.info(f"Event {event_id}: Loop start time: {start_time.isoformat()}")
@@ -83,9 +267,11 @@ class Utils:
 
             self.dr_event_active = False
             self.current_server_payload = DEFAULT_PAYLOAD_SIGNAL
+            self.poll_wakeup.set()
             logging.info(f"Event {event_id} has ended.")
-            await self.algorithm()  # Post-event cleanup to release overrides
-            self.active_events.pop(event_id, None)
+            await self.do_release_all_hvac(event_id)  # Post-event staggered release of overrides
+            event = self.active_events.pop(event_id, None) or event
+            self.journal.record_event_end(event_id, event)
             
 
         except asyncio.CancelledError:
@@ -108,24 +294,58 @@ class Utils:
     async def schedule_event_tasks(self, event_id):
         event = self.active_events[event_id]
 
+        # an event already in progress (restart mid event) starts right away
+        # for what is left of it, a past run_date would be dropped as a misfire
+        run_date = max(event["start"], datetime.now(timezone.utc))
+
         # Schedule the event handling directly at the start time
         self.scheduler.add_job(
-            self.handle_event_duration, 
+            self.spawn_event_job,
             'date', 
-            run_date=event["start"], 
-            args=[0, (event["end"] - event["start"]).total_seconds(), event_id, event["payload"]],
-            id=f"{event_id}_start"
+            run_date=run_date, 
+            args=[
+                "event",
+                event_id,
+                self.handle_event_duration,
+                0,
+                (event["end"] - run_date).total_seconds(),
+                event_id,
+                event["payload"],
+            ],
+            id=f"{event_id}_start",
+            replace_existing=True,
         )
 
+        # plan and hold the precool / preheat setpoints ahead of the start
+        if event["start"] > datetime.now(timezone.utc) and TRANE_ZONE_TEMP_READ_POINT is not None:
+            lead = timedelta(seconds=max(PRECOOL_LEAD_OPTIONS_SECONDS) + THERMAL_STEP_SECONDS)
+            self.scheduler.add_job(
+                self.spawn_event_job,
+                'date',
+                run_date=max(event["start"] - lead, datetime.now(timezone.utc)),
+                args=["precool", event_id, self.precool_for_event, event_id],
+                id=f"{event_id}_precool",
+                replace_existing=True,
+            )
+
+
+    async def spawn_event_job(self, role, event_id, job, *args):
+        # the scheduler only fires the timer, the event work itself is a
+        # supervised task keyed on the event so a re-armed event replaces it
+        self.tasks.spawn(role, job(*args), key=event_id)
+
             
-    async def handle_event(self, event):
+    async def handle_event(self, event, program=None, priority=0):
         logging.info(f" Received event: {event}")
-        await self.process_adr_event(event)
+        event_id = event["event_descriptor"]["event_id"]
+        if program is not None:
+            # event ids are only unique per VTN
+            event_id = f"{program}:{event_id}"
+        await self.process_adr_event(event, event_id, event_rank(priority, event))
         return 'optIn'
 
 
-    async def process_adr_event(self, event):
-        event_id = event["event_descriptor"]["event_id"]  # Unique event identifier
+    async def process_adr_event(self, event, event_id, rank):
         current_time = datetime.now(timezone.utc)  # Get the current UTC time as timezone-aware
 
         for signal in event["event_signals"]:
@@ -139,24 +359,73 @@ class Utils:
                     logging.info(f"Passing on {event_id} as it is in the past")
                     continue
 
-                # Check for overlap with existing events
-                if any(self.event_overlaps(start_time, end_time, existing_event) for existing_event in self.active_events.values()):
+                # Events of every program share the store, where they overlap
+                # the better rank keeps the time and the other is trimmed
+                pieces, trimmed = merge_event(self.active_events, start_time, end_time, rank, event_id)
+                if not pieces:
                     logging.info(f"Skipping overlapping event: {event_id}")
                     continue
 
-                # Store the new event and schedule it
-                self.active_events[event_id] = {
-                    "start": start_time,
-                    "end": end_time,
-                    "payload": interval["signal_payload"],
-                }
-                await self.schedule_event_tasks(event_id)
+                for other_id, left in trimmed.items():
+                    await self.trim_event(other_id, left)
+
+                payload = interval["signal_payload"]
+                for piece_start, piece_end in pieces:
+                    if self.holds_piece(event_id, piece_start, piece_end, payload):
+                        # redelivered (a restart empties openleadr's received events), already armed
+                        logging.info(f"Event {event_id} from {piece_start} already scheduled")
+                        continue
+                    await self.store_event(
+                        self.free_event_id(event_id), piece_start, piece_end, payload, rank
+                    )
+
+
+    def holds_piece(self, event_id, start_time, end_time, payload):
+        return any(
+            is_piece_of(held_id, event_id)
+            and (event["start"], event["end"], event["payload"]) == (start_time, end_time, payload)
+            for held_id, event in self.active_events.items()
+        )
+
+
+    def free_event_id(self, event_id):
+        # later intervals and pieces of an event are stored next to it
+        piece_id, n = event_id, 1
+        while piece_id in self.active_events:
+            piece_id, n = f"{event_id}/{n}", n + 1
+        return piece_id
+
 
+    async def store_event(self, event_id, start_time, end_time, payload, rank):
+        self.active_events[event_id] = {
+            "start": start_time,
+            "end": end_time,
+            "payload": payload,
+            "rank": rank,
+        }
+        self.journal.record_event(event_id, start_time, end_time, payload, rank)
+        await self.schedule_event_tasks(event_id)
+
+
+    async def trim_event(self, event_id, pieces):
+        """
+        Cut an event down to `pieces` around a higher priority one,
+        pieces already over are dropped
+        """
+        event = self.active_events[event_id]
+        now = datetime.now(timezone.utc)
+        pieces = [piece for piece in pieces if piece[1] > now]
+        logging.info(f" Event {event_id} trimmed by a higher priority event to {len(pieces)} pieces")
+        if not pieces:
+            self.cancel_event(event_id)
+            return
 
-    def event_overlaps(self, new_start, new_end, existing_event):
-        existing_start = existing_event['start']
-        existing_end = existing_event['end']
-        return new_start < existing_end and new_end > existing_start
+        # the first piece keeps the id, a running event is re-armed with its new end
+        (start_time, end_time), rest = pieces[0], pieces[1:]
+        rank = event.get("rank", LOWEST_RANK)
+        await self.store_event(event_id, start_time, end_time, event["payload"], rank)
+        for start_time, end_time in rest:
+            await self.store_event(self.free_event_id(event_id), start_time, end_time, event["payload"], rank)
 
 
     def cancel_event(self, event_id):
@@ -174,8 +443,17 @@ class Utils:
             if end_job:
                 end_job.remove()
 
+            precool_job = self.scheduler.get_job(f"{event_id}_precool")
+            if precool_job:
+                precool_job.remove()
+
+            # and the event work already running for it
+            self.tasks.cancel("event", event_id)
+            self.tasks.cancel("precool", event_id)
+
             # Remove the event from active_events
             del self.active_events[event_id]
+            self.journal.record_event_cancel(event_id)
             logging.info(f"Event {event_id} cancelled and removed from active events.")
         else:
             logging.warning(f"Attempted to cancel non-existent event: {event_id}")
@@ -196,6 +474,10 @@ class Utils:
         logging.info(f" DR Event Status: {self.dr_event_active}")
         logging.info(f" Current Payload Value: {current_payload_val}")
         logging.info(f" Current UTC Time: {formatted_time}")
+        logging.info(f" Background tasks: {self.tasks.stats()}")
+        logging.info(f" Event loop lag: {self.loop_lag.stats()}, VENs: {self.ven_host.stats()}")
+        if self.push_listener is not None:
+            logging.info(f" VEN push listener: {self.push_listener.stats()}")
         
         if self.is_any_event_scheduled():
             logging.info(" --- FUTURE SCHEDULED ADR EVENTS ---")
@@ -241,6 +523,26 @@ class Utils:
 
             self.dr_signal.presentValue = self.share_data_to_bacnet_server()
             self.app_status.presentValue = "active"
+            if self.dr_state is not None:
+                self.publish_dr_state()
+
+
+    def publish_dr_state(self):
+        # the same state the BACnet server shows, for local processes
+        try:
+            payload = float(self.current_server_payload)
+        except (TypeError, ValueError):
+            payload = float("nan")
+        now = datetime.now(timezone.utc)
+        upcoming = [event for event in self.active_events.values() if event["end"] > now]
+        next_event = min(upcoming, key=lambda event: event["start"]) if upcoming else None
+        self.dr_state.publish(
+            payload,
+            self.dr_event_active,
+            next_event["start"] if next_event else None,
+            next_event["end"] if next_event else None,
+            self.hvac_written,
+        )
 
 
     def share_data_to_bacnet_server(self):
@@ -265,6 +567,18 @@ class Utils:
         return property_identifier, property_array_index
 
 
+    async def bacnet_request(self, address, request_factory, request_class=RequestClass.CONTROL):
+        """
+        Every BACnet request goes through the dispatcher queue for its
+        network, the device timeout only starts once it is dispatched
+        """
+        return await self.dispatcher.submit(
+            address,
+            lambda: self.device_health.call(address, request_factory),
+            request_class,
+        )
+
+
     async def do_write_property_task(
         self,
         device_address,
@@ -272,6 +586,7 @@ class Utils:
         property_identifier,
         value,
         priority=BACNET_WRITE_PRIORITY,
+        request_class=RequestClass.DR_OVERRIDE,
     ):
         if _info:
             logging.info(" device_address: %r", device_address)
@@ -306,32 +621,71 @@ class Utils:
                 priority,
             )
 
-        if value == "null":
+        # the ledger holds the intent, a failed write gets fixed by reconciliation
+        is_release = value == "null"
+        if is_release:
             if priority is None:
                 raise ValueError(" null only for overrides")
             value = Null(())
+            self.override_ledger.set_released(
+                device_address, object_identifier, property_identifier, priority
+            )
+        else:
+            self.journal.record_override(
+                device_address, object_identifier, property_identifier, value, priority
+            )
+            self.override_ledger.set_override(
+                device_address, object_identifier, property_identifier, value, priority
+            )
 
         try:
-            response = await self.app.write_property(
+            response = await self.bacnet_request(
                 device_address,
-                object_identifier,
-                property_identifier,
-                value,
-                property_array_index,
-                priority,
+                lambda: self.app.write_property(
+                    device_address,
+                    object_identifier,
+                    property_identifier,
+                    value,
+                    property_array_index,
+                    priority,
+                ),
+                request_class,
             )
             if _info:
                 logging.info(" response: %r", response)
             if _info:
                 logging.info(" Write property successful")
+            if is_release:
+                self.journal.record_release(
+                    device_address, object_identifier, property_identifier, priority
+                )
+            return True
         except ErrorRejectAbortNack as err:
             if _info:
                 logging.info("    - exception: %r", err)
             else:
-                logging.error(" Write property failed: ", err)
+                logging.error(f" Write property failed: {err}")
+        except DeviceUnavailable as err:
+            # ledger keeps the intent, reconciliation writes it once the device is back
+            logging.warning(f" Write skipped: {err}")
+        except asyncio.TimeoutError:
+            logging.error(f" Write property timed out on {device_address}")
+        finally:
+            # whatever the device holds now, a cached read of it is stale
+            self.point_cache.invalidate(
+                point_key(
+                    device_address, object_identifier, property_identifier, property_array_index
+                )
+            )
+        # the device did not take it
+        return False
 
 
-    async def do_read_property_task(self, requests):
+    async def do_read_property_task(self, requests, request_class=RequestClass.CONTROL, max_age=None):
+        """
+        Reads go through the shared point cache, `max_age` overrides
+        the per point freshness budget in POINT_CACHE_MAX_AGE_SECONDS
+        """
         read_values = []
 
         logging.info(" READ_REQUESTS GO!!!")
@@ -342,8 +696,16 @@ class Utils:
                 address, object_id, prop_id, array_index = request
 
                 # Perform the BACnet read property operation
-                value = await self.app.read_property(
-                    address, object_id, prop_id, array_index
+                value = await self.point_cache.get(
+                    point_key(address, object_id, prop_id, array_index),
+                    lambda: self.bacnet_request(
+                        address,
+                        lambda: self.app.read_property(
+                            address, object_id, prop_id, array_index
+                        ),
+                        request_class,
+                    ),
+                    max_age,
                 )
                 logging.info(f" Read value for {object_id}: {value}")
 
@@ -355,6 +717,14 @@ class Utils:
                 # Insert "error" in place of the failed read value
                 read_values.append("error")
 
+            except DeviceUnavailable as err:
+                logging.warning(f" Read skipped: {err}")
+                read_values.append("error")
+
+            except asyncio.TimeoutError:
+                logging.error(f" READ REQUEST timed out on {address} {object_id}")
+                read_values.append("error")
+
             except Exception as e:
                 logging.error(f" An unexpected error occurred on READ REQUEST: {e}")
                 # Insert "error" in place of the failed read value
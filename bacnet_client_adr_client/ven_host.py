@@ -0,0 +1,85 @@
+"""
+Several VEN identities in one gateway process
+
+A site enrolled in several programs, or with several utilities, needs
+one VEN per program. VenHost runs them all in this process on the one
+event loop. They share the BACnet application and the event store, one
+keep-alive HTTP connection pool to the VTNs and one XML worker pool,
+instead of each running a full Python process with its own bacpypes3
+stack.
+
+Events of every program go into the one event store, merged by
+priority, see event_merge.py.
+"""
+
+import asyncio
+import logging
+from datetime import timedelta
+
+from push_listener import PushModeClient, vtn_session
+
+_log = logging.getLogger(__name__)
+
+
+class VenHost:
+    """
+    The VEN clients of the gateway, one per program in `programs`
+    (dicts with ven_name, vtn_url and priority, lower wins). Every event
+    is passed to `on_event(event, program=..., priority=...)`, where
+    program is the ven name when more than one program is hosted and
+    None otherwise, so a single VEN keeps its plain event ids.
+    """
+    def __init__(self, programs, on_event, report_callback, push_address=None, keepalive=75.0, **client_kwargs):
+        self.keepalive = keepalive
+        self.clients = {}
+        self.priorities = {}
+        self.session = None
+        namespaced = len(programs) > 1
+        first = None
+        for program in programs:
+            name = program["ven_name"]
+            kwargs = dict(client_kwargs)
+            if first is not None:
+                kwargs.update(executor=first.executor, slots=first._slots)
+            if push_address and namespaced:
+                kwargs["push_address"] = f"{push_address}/{name}"
+            else:
+                kwargs["push_address"] = push_address
+            client = PushModeClient(ven_name=name, vtn_url=program["vtn_url"], keepalive=keepalive, **kwargs)
+            client.add_report(
+                callback=report_callback,
+                resource_id="main_meter",
+                measurement="power",
+                sampling_rate=timedelta(seconds=10),
+            )
+            priority = program.get("priority", 0)
+            client.add_handler(
+                "on_event", self._event_handler(on_event, name if namespaced else None, priority)
+            )
+            self.clients[name] = client
+            self.priorities[name] = priority
+            first = first or client
+
+    @staticmethod
+    def _event_handler(on_event, program, priority):
+        async def handle(event):
+            return await on_event(event, program=program, priority=priority)
+        return handle
+
+    async def run(self):
+        """
+        Register every VEN with its VTN over one shared connection pool
+        """
+        if self.session is None:
+            self.session = vtn_session(next(iter(self.clients.values())), self.keepalive)
+            for client in self.clients.values():
+                client.client_session = self.session
+        results = await asyncio.gather(
+            *(client.run() for client in self.clients.values()), return_exceptions=True
+        )
+        for name, result in zip(self.clients, results):
+            if isinstance(result, Exception):
+                _log.error(f" VEN {name} failed to start: {result!r}")
+
+    def stats(self):
+        return {name: client.stats() for name, client in self.clients.items()}
@@ -0,0 +1,134 @@
+import time
+import asyncio
+import logging
+import functools
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import aiohttp
+from lxml.etree import XMLSyntaxError
+from signxml.exceptions import InvalidSignature
+from openleadr import OpenADRClient, errors
+from openleadr.messaging import parse_message, validate_xml_schema, validate_xml_signature
+
+_log = logging.getLogger(__name__)
+
+
+class DeferredMessage:
+    """
+    Stands in for a serialized (and signed) OpenADR message until the
+    request is sent, so building it can run off the event loop
+    """
+    def __init__(self, builder, args, kwargs):
+        self.builder = builder
+        self.args = args
+        self.kwargs = kwargs
+
+    def build(self):
+        return self.builder(*self.args, **self.kwargs)
+
+
+def decode_message(content, vtn_fingerprint):
+    """
+    Schema validation, signature check and parsing of a VTN response,
+    runs in the worker pool
+    """
+    tree = validate_xml_schema(content)
+    if vtn_fingerprint:
+        validate_xml_signature(tree, cert_fingerprint=vtn_fingerprint)
+    return parse_message(content)
+
+
+class OffloadedOpenADRClient(OpenADRClient):
+    """
+    openleadr VEN client that builds, signs, validates and parses its
+    XML in a worker pool instead of on the event loop that also runs
+    the BACnet timers. At most `max_pending` messages are in the pool
+    or waiting for it, later ones wait their turn on the loop. Several
+    clients can share one pool by passing the first one's `executor`
+    and `_slots` semaphore.
+
+    Overrides openleadr 0.5's _create_message / _perform_request pair,
+    every outgoing message is created by the first and sent by the second.
+    """
+    def __init__(self, *args, workers=2, max_pending=4, use_processes=False, executor=None, slots=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if executor is not None:
+            # shared with the other VEN clients of the process
+            self.executor = executor
+        elif use_processes:
+            # openleadr's message builder is a partial of module level code, so it pickles
+            self.executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="openadr-xml")
+        self._slots = slots if slots is not None else asyncio.Semaphore(max_pending)
+        self._build_message = self._create_message
+        self._create_message = self._defer_message
+        self.offloaded = 0
+        self.offload_seconds = 0.0
+
+    def _defer_message(self, *args, **kwargs):
+        return DeferredMessage(self._build_message, args, kwargs)
+
+    async def _offload(self, func, *args):
+        async with self._slots:
+            start = time.perf_counter()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.executor, functools.partial(func, *args)
+                )
+            finally:
+                self.offloaded += 1
+                self.offload_seconds += time.perf_counter() - start
+
+    async def _perform_request(self, service, message):
+        if isinstance(message, DeferredMessage):
+            message = await self._offload(message.build)
+
+        await self._ensure_client_session()
+        _log.debug(f"Client is sending {message}")
+        url = f"{self.vtn_url}/{service}"
+        try:
+            async with self.client_session.post(url, data=message) as req:
+                content = await req.read()
+                if req.status != HTTPStatus.OK:
+                    _log.warning(f"Non-OK status {req.status} when performing a request to {url}")
+                    return None, {}
+        except aiohttp.client_exceptions.ClientConnectorError as err:
+            _log.error(f"Could not connect to server with URL {self.vtn_url}: {err}")
+            return None, {}
+        except Exception as err:
+            _log.error(f"Request error {err.__class__.__name__}: {err}")
+            return None, {}
+
+        if len(content) == 0:
+            return None, {}
+
+        try:
+            message_type, message_payload = await self._offload(
+                decode_message, content, self.vtn_fingerprint
+            )
+        except XMLSyntaxError as err:
+            _log.warning(f"Incoming message did not pass XML schema validation: {err}")
+            return None, {}
+        except errors.FingerprintMismatch as err:
+            _log.warning(err)
+            return None, {}
+        except InvalidSignature:
+            _log.warning("Incoming message had invalid signature, ignoring.")
+            return None, {}
+        except Exception as err:
+            _log.error(f"The incoming message could not be parsed or validated: {err}")
+            return None, {}
+
+        response = message_payload.get("response", {})
+        if "response_code" in response and response["response_code"] != 200:
+            _log.warning(
+                "We got a non-OK OpenADR response from the server: "
+                f"{response['response_code']}: {response.get('response_description')}"
+            )
+        return message_type, message_payload
+
+    def stats(self):
+        mean_ms = 1000.0 * self.offload_seconds / self.offloaded if self.offloaded else 0.0
+        return {"offloaded": self.offloaded, "mean_ms": round(mean_ms, 2)}
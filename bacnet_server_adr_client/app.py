@@ -1,9 +1,9 @@
+from bootstrap import startup
+
 import asyncio
 import re
 from datetime import timedelta, datetime, timezone
 
-from openleadr import OpenADRClient, enable_default_logging
-
 from bacpypes3.debugging import bacpypes_debugging, ModuleLogger
 from bacpypes3.argparse import SimpleArgumentParser
 from bacpypes3.app import Application
@@ -13,7 +13,12 @@ from bacpypes3.local.cmd import Commandable
 
 from enum import Enum
 
-import yaml
+from task_supervisor import TaskSupervisor
+
+# timed, the config is needed right away
+yaml = startup.load("yaml")
+
+startup.mark("imports")
 
 # Load YAML configuration
 with open('config.yaml', 'r') as file:
@@ -23,11 +28,12 @@ VEN_NAME = config['ven_name']
 VTN_URL = config['vtn_url']
 NORMAL_OPERATIONS = config['normal_operations']
 
+# event loop and startup, see bootstrap.py
+USE_UVLOOP = config.get('use_uvloop', True)
+STARTUP_BUDGET = config.get('startup_budget_seconds', 5.0)
 
-# $ python adr_client.py --name Slipstream --instance 3056672 --debug
 
-# Enable OpenLEADR logging
-enable_default_logging()
+# $ python adr_client.py --name Slipstream --instance 3056672 --debug
 
 # 'property[index]' matching
 property_index_re = re.compile(r"^([A-Za-z-]+)(?:\[([0-9]+)\])?$")
@@ -74,17 +80,28 @@ class SampleApplication:
         self.event_payload_value = None
         self.adr_duration = None
         
-        self.client = OpenADRClient(ven_name=VEN_NAME, vtn_url=VTN_URL)
+        # built in start_ven, openleadr is only imported once BACnet is up
+        self.client = None
+
+        # every background task, by role and event id, crashed loops restart
+        self.tasks = TaskSupervisor()
+        self.tasks.spawn("bacnet_server", self.update_bacnet_server_values, restart=True)
+        self.tasks.spawn("meter", self.grab_meter_value_from_bacnet_server, restart=True)
+        self.tasks.spawn("ven", self.start_ven)
+
+    async def start_ven(self):
+        openleadr = startup.load("openleadr")
+        # Enable OpenLEADR logging
+        openleadr.enable_default_logging()
+        self.client = openleadr.OpenADRClient(ven_name=VEN_NAME, vtn_url=VTN_URL)
         self.client.add_report(callback=self.collect_report_value,
                                 resource_id="main_meter",
                                 measurement="power",
                                sampling_rate=timedelta(seconds=10))
         self.client.add_handler('on_event', self.handle_event)
-
-        # Create a task to update the values
-        asyncio.create_task(self.update_bacnet_server_values())
-        asyncio.create_task(self.grab_meter_value_from_bacnet_server())
-        asyncio.create_task(self.client.run())
+        startup.mark("ven_loaded")
+        await self.client.run()
+        startup.ready(STARTUP_BUDGET)
 
     async def get_dr_signal(self):
         return self.current_server_payload
@@ -113,6 +130,7 @@ class SampleApplication:
         bacnet_val = await self.get_bacnet_dr_signal_pv()
         _log.debug(f"DR Sig is: {dr_sig_val}")
         _log.debug(f"BACnet API is: {bacnet_val}")
+        _log.debug(f"Background tasks: {self.tasks.stats()}")
         return self.building_meter
 
     async def update_bacnet_server_values(self):
@@ -131,9 +149,10 @@ class SampleApplication:
         intervals = event["event_signals"]
         _log.debug(f"Event intervals: {intervals}")
 
-        for interval in intervals:
+        event_id = event["event_descriptor"]["event_id"]
+        for signal_index, interval in enumerate(intervals):
             self.process_adr_event(interval)
-            asyncio.create_task(self.event_checkr())
+            self.event_checkr(event_id, signal_index)
         return "optIn"
     
     async def event_do(self, delay, item):
@@ -151,7 +170,7 @@ class SampleApplication:
                 self.adr_duration
             ) = self.adr_event_ends = self.event_payload_value = None
 
-    async def event_checkr(self):
+    def event_checkr(self, event_id, signal_index=0):
         now_utc = datetime.now(timezone.utc)
         _log.debug(f"EVENT CHECKR Current time (UTC): {now_utc}")
         _log.debug(f"EVENT CHECKR ADR event start time (UTC): {self.adr_start}")
@@ -164,14 +183,20 @@ class SampleApplication:
         _log.debug(f"Time until start: {until_start_time_seconds}")
         _log.debug(f"Time until end: {until_end_time_seconds}")
 
-        # sleeps and then on wake up changes BACnet API to DR event signal
-        asyncio.create_task(
-            self.event_do(until_start_time_seconds, EventActions.GO.value)
+        # sleeps and then on wake up changes BACnet API to DR event signal,
+        # a redelivered event replaces its timers instead of adding more,
+        # keyed per signal so an event's signals do not replace each other
+        self.tasks.spawn(
+            "event_timer",
+            self.event_do(until_start_time_seconds, EventActions.GO.value),
+            key=(event_id, signal_index, EventActions.GO.value),
         )
 
         # sleeps and then on wake up changes BACnet API to back to normal ops
-        asyncio.create_task(
-            self.event_do(until_end_time_seconds, EventActions.STOP.value)
+        self.tasks.spawn(
+            "event_timer",
+            self.event_do(until_end_time_seconds, EventActions.STOP.value),
+            key=(event_id, signal_index, EventActions.STOP.value),
         )
 
 
@@ -233,15 +258,12 @@ async def main():
         power_level=power_level,
         app_status=app_status,
     )
+    startup.mark("bacnet_app")
     if _debug:
         _log.debug("app: %r", app)
 
-    await asyncio.Future()
+    await app.tasks.run()
 
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        if _debug:
-            _log.debug("keyboard interrupt")
\ No newline at end of file
+    startup.run(main, use_uvloop=USE_UVLOOP)
\ No newline at end of file
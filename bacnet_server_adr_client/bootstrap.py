@@ -0,0 +1,109 @@
+"""
+Process bootstrap: event loop, deferred imports and startup timing
+
+Import this module first so the clock starts before the heavy imports:
+
+    from bootstrap import startup
+    ...
+    startup.mark("imports")
+    ...
+    if __name__ == "__main__":
+        startup.run(main, use_uvloop=True)
+
+Modules only some code paths need are imported with startup.load() on
+first use, which also times them. Once the app is up, startup.ready()
+logs where the time went, so a restart (worst case mid DR event) can be
+held under a budget. `python -X importtime` gives the full import tree
+when the breakdown points at the eager imports.
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import importlib
+
+_log = logging.getLogger(__name__)
+
+
+class Startup:
+    """
+    Phases marked by the app since this module was imported, the
+    modules imported through load() and the event loop in use
+    """
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []  # (phase, seconds since start)
+        self.imports = {}  # module: seconds to import
+        self.loop_name = "asyncio"
+        self.reported = False
+
+    def load(self, name):
+        """
+        Import `name` the first time it is needed, timed
+        """
+        module = sys.modules.get(name)
+        if module is not None:
+            return module
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        self.imports[name] = time.perf_counter() - start
+        return module
+
+    def mark(self, phase):
+        self.phases.append((phase, time.perf_counter() - self.started))
+
+    def install_loop(self, use_uvloop):
+        if not use_uvloop:
+            return
+        try:
+            uvloop = self.load("uvloop")
+        except ImportError:
+            _log.info(" uvloop is not installed, running on the asyncio event loop")
+            return
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        self.loop_name = "uvloop"
+
+    def run(self, main, use_uvloop=False):
+        """
+        asyncio.run(main()) on uvloop when asked for and installed
+        """
+        self.install_loop(use_uvloop)
+        self.mark("bootstrap")
+        try:
+            asyncio.run(main())
+        except KeyboardInterrupt:
+            _log.info(" keyboard interrupt")
+
+    def ready(self, budget=None):
+        """
+        Log the startup breakdown once, a warning when it took longer
+        than `budget` seconds
+        """
+        if self.reported:
+            return
+        self.reported = True
+        self.mark("ready")
+
+        previous = 0.0
+        steps = []
+        for phase, at in self.phases:
+            steps.append(f"{phase} +{(at - previous) * 1000.0:.0f} ms")
+            previous = at
+        total = self.phases[-1][1]
+        _log.info(f" Startup on {self.loop_name} took {total * 1000.0:.0f} ms: {', '.join(steps)}")
+        if self.imports:
+            slowest = sorted(self.imports.items(), key=lambda item: item[1], reverse=True)
+            _log.info(" Deferred imports: " + ", ".join(f"{name} {seconds * 1000.0:.0f} ms" for name, seconds in slowest))
+        if budget is not None and total > budget:
+            _log.warning(f" Startup took {total:.2f} s, over the {budget:.2f} s budget")
+
+    def stats(self):
+        return {
+            "loop": self.loop_name,
+            "phases_ms": {phase: round(at * 1000.0, 1) for phase, at in self.phases},
+            "imports_ms": {name: round(seconds * 1000.0, 1) for name, seconds in self.imports.items()},
+        }
+
+
+startup = Startup()
@@ -1,8 +1,10 @@
 #!/usr/bin/python3
 
+from bootstrap import startup
+
+import time
 import asyncio
 import re
-from enum import Enum
 from datetime import datetime,timedelta,timezone
 
 from bacpypes3.debugging import bacpypes_debugging, ModuleLogger
@@ -22,27 +24,22 @@ from bacpypes3.apdu import (
     ErrorType,
 )
 
-from openleadr import OpenADRClient, enable_default_logging
+from shadow import ShadowTransport
+from poll_planner import PollPlanner
+from event_registry import EventRegistry
+from task_supervisor import TaskSupervisor
+
+startup.mark("imports")
 
 # $ source drenv/bin/activate
 
 # $ python app.py --name Slipstream --instance 3056672 --debug
 
-class EventActions(Enum):
-    """
-    Timer mechaninism for when an event ends or starts
-    """
-    GO = 'go'
-    STOP = 'stop'
-    
 class CommandableAnalogValueObject(Commandable, AnalogValueObject):
     """
     used if writing utility meter value back to server
     """
 
-# Enable OpenLEADR logging
-enable_default_logging()
-
 _debug = 0
 _log = ModuleLogger(globals())
 
@@ -57,9 +54,38 @@ VEN_TO_VTN_CHECK_IN_INTERVAL= 10
 
 NORMAL_OPERATIONS = 0.0
 BACNET_SERVER_UPDATE_INTERVAL = 2.0
-BACNET_REQ_INTERVAL = 60.0
+BACNET_REQ_INTERVAL = 60.0 # decision and Mecho write cycle when no polled value changes
+
 WRITE_PRIORITY = 10
-APPLY_BACNET_WRITES = False # make BACnet writes to devices
+APPLY_BACNET_WRITES = False # make BACnet writes to devices, else run in shadow mode
+
+# adaptive poll intervals, each point is read about as often as it takes to move by its deadband
+POLL_MIN_INTERVAL = 15.0
+POLL_MAX_INTERVAL = 300.0
+POLL_DR_INTERVAL_SCALE = 0.25 # DR relevant points poll this much faster during an event
+POLL_DR_MIN_INTERVAL = 5.0
+
+# crashed background loops restart with backoff between these
+TASK_RESTART_MIN = 1.0
+TASK_RESTART_MAX = 60.0
+
+# event loop and startup, see bootstrap.py
+USE_UVLOOP = True # when installed, else the asyncio loop
+STARTUP_BUDGET = 5.0 # seconds, a warning is logged when a (re)start takes longer
+# point name: (object identifier on the trane vav, deadband, DR relevance 0.0 to 1.0)
+POLL_POINTS = {
+    "setpoint": ("analog-value,27", 0.5, 1.0),
+    "mode": ("multi-state-value,5", 1.0, 0.5),
+    "co2": ("analog-input,8", 25.0, 1.0),
+}
+
+# shadow mode, writes are recorded to a time-stamped plan instead of sent
+SHADOW_PLAN_PATH = "shadow_plan.jsonl"
+SHADOW_PLAN_MAX_BYTES = 10 * 1024 * 1024 # rolled over to shadow_plan.jsonl.1 past this size
+SHADOW_DEVICE_LATENCY = {
+    "32:18": 0.25, # MS/TP trane vav behind the router
+    "10.7.6.161/24:47820": 0.02, # mecho on BACnet/IP
+}
 READ_REQUESTS = [
     {
         "device_address": "32:18",
@@ -165,6 +191,18 @@ class SampleApplication:
         # embed an application
         self.app = Application.from_args(args)
 
+        # every BACnet request goes through this transport, in shadow mode
+        # reads still hit the building but writes only land in the plan
+        if APPLY_BACNET_WRITES:
+            self.bacnet = self.app
+        else:
+            self.bacnet = ShadowTransport(
+                device_latency=SHADOW_DEVICE_LATENCY,
+                passthrough=self.app,
+                plan_path=SHADOW_PLAN_PATH,
+                plan_max_bytes=SHADOW_PLAN_MAX_BYTES,
+            )
+
         # extract the kwargs that are special to this application
         self.dr_signal = dr_signal
         self.app.add_object(dr_signal)
@@ -198,12 +236,17 @@ class SampleApplication:
         self.adr_duration = None
         self.event_overrides_applied = False
 
-        self.client = OpenADRClient(ven_name=VEN_NAME, vtn_url=DR_SERVER_URL)
-        self.client.add_report(callback=self.collect_report_value,
-                                resource_id="main_meter",
-                                measurement="power",
-                               sampling_rate=timedelta(seconds=VEN_TO_VTN_CHECK_IN_INTERVAL))
-        self.client.add_handler('on_event', self.handle_event)
+        # every background task, by role and event id
+        self.tasks = TaskSupervisor(restart_min=TASK_RESTART_MIN, restart_max=TASK_RESTART_MAX)
+
+        # one task per live event interval, VTN redeliveries are skipped
+        self.events = EventRegistry(
+            self.run_event_interval,
+            lambda coroutine, key: self.tasks.spawn("event", coroutine, key=key),
+        )
+
+        # built in start_ven, openleadr is only imported once BACnet is up
+        self.client = None
         '''
         MODS NEEDED ABOVE HERE
         '''
@@ -212,19 +255,43 @@ class SampleApplication:
         # 0 = heating and 1 = cooling
         self.hvac_mode = 0
         self.ppm_for_occ = 550.0
+        self.ppm_dead_band = 50.0
         self.room_is_occupied = False
         self.occ_to_write = 0.0
 
-        # create a task to update the values
-        asyncio.create_task(self.update_bacnet_server_values())
-        asyncio.create_task(self.read_property_task())
+        # per point poll intervals from how fast each point has been changing
+        self.poll_planner = PollPlanner(
+            min_interval=POLL_MIN_INTERVAL,
+            max_interval=POLL_MAX_INTERVAL,
+            dr_scale=POLL_DR_INTERVAL_SCALE,
+            dr_min_interval=POLL_DR_MIN_INTERVAL,
+        )
+        for name, (_, deadband, relevance) in POLL_POINTS.items():
+            self.poll_planner.add_point(name, deadband, relevance)
+
+        # long running loops, restarted with backoff if they crash
+        self.tasks.spawn("bacnet_server", self.update_bacnet_server_values, restart=True)
+        self.tasks.spawn("poller", self.read_property_task, restart=True)
         
         if USE_OPEN_ADR:
             # Create a lock for the server check to ensure it's not running concurrently
             #self.server_check_lock = asyncio.Lock()
-            asyncio.create_task(self.client.run())
+            self.tasks.spawn("ven", self.start_ven)
             
             
+    async def start_ven(self):
+        openleadr = startup.load("openleadr")
+        openleadr.enable_default_logging()
+        self.client = openleadr.OpenADRClient(ven_name=VEN_NAME, vtn_url=DR_SERVER_URL)
+        self.client.add_report(callback=self.collect_report_value,
+                                resource_id="main_meter",
+                                measurement="power",
+                               sampling_rate=timedelta(seconds=VEN_TO_VTN_CHECK_IN_INTERVAL))
+        self.client.add_handler('on_event', self.handle_event)
+        startup.mark("ven_loaded")
+        await self.client.run()
+        startup.ready(STARTUP_BUDGET)
+
     async def collect_report_value(self):
         dr_sig_val = await self.get_dr_signal()
         bacnet_dr_sig = await self.get_bacnet_dr_signal_pv() 
@@ -239,18 +306,12 @@ class SampleApplication:
         _log.info(f"DR Overrides Status is: {dr_overrides_status}")
         _log.info(f"BACnet Apply Error Status is: {bacnet_apply_err_status}")
         _log.info(f"APPLY_BACNET_WRITES: {APPLY_BACNET_WRITES}")
+        _log.info(f"Background tasks: {self.tasks.stats()}")
         return meter_reading
 
     async def handle_event(self, event):
         _log.info(f"handle_event: \n {event}")
-        
-        intervals = event["event_signals"]
-        _log.info(f"Event intervals: \n {intervals}")
-
-        for interval in intervals:
-            await self.process_adr_event(interval)
-            asyncio.create_task(self.event_checkr())
-            
+        await self.process_adr_event(event)
         _log.info(f"Opting in for the events")
         return "optIn"
     
@@ -321,14 +382,6 @@ class SampleApplication:
         await self.set_adr_event_ends(None)
         await self.set_event_payload_value(None)
         
-    async def load_shed_event_do(self, delay, item):
-        await asyncio.sleep(delay)
-
-        if item == EventActions.GO.value:
-            await self.handle_load_shed_event_go()
-        elif item == EventActions.STOP.value:
-            await self.handle_load_shed_event_stop()
-            
     async def handle_load_shed_event_stop(self):
         _log.info("LOAD SHED EVENT STOP!")
 
@@ -337,58 +390,52 @@ class SampleApplication:
         await self.set_dr_event_active(False)
         await self.reset_adr_attributes()
             
-    async def handle_load_shed_event_go(self):
+    async def handle_load_shed_event_go(self, interval):
+        if self.dr_event_active and self.adr_event_ends == interval["end"]:
+            return
         _log.info("LOAD SHED EVENT GO!")
 
+        await self.set_adr_start(interval["start"])
+        await self.set_adr_event_ends(interval["end"])
+        await self.set_adr_duration(interval["end"] - interval["start"])
+        await self.set_event_payload_value(interval["payload"])
+
         # make changes to the BACnet API
         await self.set_dr_signal(self.event_payload_value)
         await self.set_dr_event_active(True)
 
-    async def event_checkr(self):
-        now_utc = datetime.now(timezone.utc)
-        event_type = await self.get_event_payload_value()
-        
-        _log.info(f"event_checkr event signal: {event_type}")
-        _log.info(f"event_checkr event signal type: {type(event_type)}")
-
-        until_start_time_seconds = (await self.get_adr_start() - now_utc).total_seconds()
-        until_end_time_seconds = (await self.get_adr_event_ends() - now_utc).total_seconds()
+    async def run_event_interval(self, event_id, interval):
+        """
+        The one task of an event interval, sleeps to the start, GO,
+        sleeps to the end, STOP unless the next interval already began.
+        Cancelled when the VTN modifies or cancels the interval.
+        """
+        if interval["payload"] != 1.0: # 1.0 is load shed
+            _log.error(f"Unknown event signal: {interval['payload']}")
+            return
 
-        _log.info(f"Current time: {now_utc}")
-        _log.info(f"Event start: {await self.get_adr_start()}")
-        _log.info(f"Time until start: {until_start_time_seconds}")
-        _log.info(f"Time until end: {until_end_time_seconds}")
+        now_utc = datetime.now(timezone.utc)
+        _log.info(f"Event {event_id} start: {interval['start']} end: {interval['end']}")
+        _log.info(f"Time until start: {(interval['start'] - now_utc).total_seconds()}")
 
-        if event_type == 1.0: # 1.0 is load shed
+        await asyncio.sleep(max(0.0, (interval["start"] - now_utc).total_seconds()))
+        await self.handle_load_shed_event_go(interval)
 
-            # sleeps and then on wake up changes BACnet API to DR event signal
-            asyncio.create_task(
-                self.load_shed_event_do(until_start_time_seconds, EventActions.GO.value)
-            )
+        await asyncio.sleep(max(0.0, (interval["end"] - datetime.now(timezone.utc)).total_seconds()))
+        following = self.events.active_interval()
+        if following is None or following[1]["payload"] != 1.0:
+            await self.handle_load_shed_event_stop()
 
-            # sleeps and then on wake up changes BACnet API to back to normal ops
-            asyncio.create_task(
-                self.load_shed_event_do(until_end_time_seconds, EventActions.STOP.value)
-            )
-            
-        else:
-            _log.error(f"Unknown event signal: {event_type}")
+    async def process_adr_event(self, event):
+        result = self.events.ingest(event)
+        self.events.prune()
+        _log.info(f"Event ingest {result}, {self.events.task_count()} interval tasks, "
+                  f"{self.events.skipped} redeliveries skipped")
 
-    async def process_adr_event(self, signal):
-        _log.info(f"Processing signal: {signal}")
-        interval = signal["intervals"][0]
-        
-        await self.set_adr_start(interval["dtstart"])
-        _log.info(f"ADR start time: {await self.get_adr_start()}")
-        
-        await self.set_event_payload_value(interval["signal_payload"])
-        _log.info(f"Event payload value: {await self.get_event_payload_value()}")
-        
-        await self.set_adr_duration(interval["duration"])
-        _log.info(f"ADR duration: {await self.get_adr_duration()}")
-        
-        await self.set_adr_event_ends(await self.get_adr_start() + await self.get_adr_duration())
-        _log.info(f"ADR event ends: {await self.get_adr_event_ends()}")
+        # a modified or cancelled event can take away the interval running now
+        active = self.events.active_interval()
+        if self.dr_event_active and (active is None or active[1]["payload"] != 1.0):
+            await self.handle_load_shed_event_stop()
 
 
     async def update_bacnet_server_values(self):
@@ -452,7 +499,7 @@ class SampleApplication:
             value = Null(())
         
         try:
-            response = await self.app.write_property(
+            response = await self.bacnet.write_property(
                 device_address,
                 object_identifier,
                 property_identifier,
@@ -475,76 +522,71 @@ class SampleApplication:
         hvac_address = Address("32:18")
         mecho_address = Address("10.7.6.161/24:47820")
         
+        # last polled value of each point, only the points that are due get re-read
+        polled = {}
+        cycle_at = None
+
         while True:
-            await asyncio.sleep(BACNET_REQ_INTERVAL)
+            wait = self.poll_planner.next_wakeup()
+            if cycle_at is not None:
+                wait = min(wait, BACNET_REQ_INTERVAL - (time.monotonic() - cycle_at))
+            await asyncio.sleep(max(wait, 0.5))
             
             _dr_event_active = await self.get_dr_event_active()
+            self.poll_planner.set_dr_active(_dr_event_active)
+            due = self.poll_planner.due()
+
+            if not APPLY_BACNET_WRITES:
+                self.bacnet.begin_plan(
+                    f"{datetime.now(timezone.utc).isoformat()} dr_event_active={_dr_event_active}"
+                )
             
             # Create a list to store read values
             read_values = []
+            values_changed = False
             
-            _log.info(" READ_REQUESTS GO!!!")
+            _log.info(" READ_REQUESTS GO!!! %r", due)
 
             try:
-                # Read the setpoint value.
-                setpoint_identifier = ObjectIdentifier("analog-value,27")
-                
-                if _debug:
-                    SampleApplication._debug(
-                        "do_read %r %r %r",
+                for name in due:
+                    object_identifier = ObjectIdentifier(POLL_POINTS[name][0])
+
+                    if _debug:
+                        SampleApplication._debug(
+                            "do_read %r %r %r",
+                            hvac_address,
+                            object_identifier,
+                            "present-value",
+                        )
+
+                    value = await self.bacnet.read_property(
                         hvac_address,
-                        setpoint_identifier,
+                        object_identifier,
                         "present-value",
                     )
-                    
-                hvac_setpoint_value = await self.app.read_property(
-                    hvac_address,
-                    setpoint_identifier,
-                    "present-value",
-                )
-                
-                _log.info("    - hvac_setpoint_value: %r", hvac_setpoint_value)
+
+                    _log.info("    - %s: %r", name, value)
+                    values_changed = values_changed or value != polled.get(name)
+                    polled[name] = value
+                    self.poll_planner.observe(name, value)
+
+                _log.info("    - poll intervals: %r", self.poll_planner.intervals())
+
+                hvac_setpoint_value = polled["setpoint"]
                 read_values.append(hvac_setpoint_value)
 
-                # Read the vav hvac mode.
-                mode_identifier = ObjectIdentifier("multi-state-value,5")
-                
-                if _debug:
-                    SampleApplication._debug(
-                        "do_read %r %r %r",
-                        hvac_address,
-                        mode_identifier,
-                        "present-value",
-                    )
-                    
-                hvac_mode_value = await self.app.read_property(
-                    hvac_address,
-                    mode_identifier,
-                    "present-value"
-                )
-                
-                _log.info("    - hvac_mode_value: %r", hvac_mode_value)
+                hvac_mode_value = polled["mode"]
                 read_values.append(hvac_mode_value)
 
-                # Read the occ value which is C02
-                occupancy_identifier = ObjectIdentifier("analog-input,8")
-                
-                if _debug:
-                    SampleApplication._debug(
-                        "do_read %r %r %r",
-                        hvac_address,
-                        occupancy_identifier,
-                        "present-value",
-                    )
-                    
-                ppm = await self.app.read_property(
-                    hvac_address,
-                    occupancy_identifier,
-                    "present-value",
-                )
+                # Occ value is C02
+                ppm = polled["co2"]
                 
+                # hysteresis, occupied above self.ppm_for_occ and only
+                # unoccupied again once below it by self.ppm_dead_band
                 if ppm > self.ppm_for_occ:
                     self.room_is_occupied = True
+                elif self.room_is_occupied and ppm < self.ppm_for_occ - self.ppm_dead_band:
+                    self.room_is_occupied = False
                     
                 _log.info("    - ppm: %r", ppm)
                 _log.info("    - self.room_is_occupied: %r", self.room_is_occupied)
@@ -554,16 +596,22 @@ class SampleApplication:
                 _log.info("    - read_values: %r %r %r", hvac_setpoint_value, hvac_mode_value, self.room_is_occupied)
                 
             except ErrorRejectAbortNack as err:
+                # flag it and retry next cycle, a returning poller is not restarted
                 _log.error(f"Error while processing READ REQUESTS: {err}")
                 await self.set_bacnet_dr_app_error_status_pv(True)
-                should_continue = False
-                return
+                continue
 
             except Exception as e:
                 _log.error(f"An unexpected error occurred on READ REQUESTS: {e}")
                 await self.set_bacnet_dr_app_error_status_pv(True)
-                should_continue = False
-                return
+                continue
+
+            # only run the decision and writes when a polled value moved,
+            # otherwise once every BACNET_REQ_INTERVAL like before
+            cycle_is_due = cycle_at is None or time.monotonic() - cycle_at >= BACNET_REQ_INTERVAL
+            if not values_changed and not cycle_is_due:
+                continue
+            cycle_at = time.monotonic()
     
             if should_continue:
 
@@ -604,122 +652,120 @@ class SampleApplication:
 
                 _log.info(" READ LOOP FINISHED")
                 
-                if APPLY_BACNET_WRITES:
+                try:
+                    # Write last server payload to the "demand response" point.
+                    # to Mecho window blind system AnalogValue
+                    await self.write_property_task(
+                        mecho_address,
+                        "analog-value,99",
+                        "present-value",
+                        self.current_server_payload,
+                    )
                     
+                    # Write self.occ_to_write to the "heating or cooling" point.
+                    # to Mecho window blind system AnalogValue
+                    await self.write_property_task(
+                        mecho_address,
+                        "analog-value,98",
+                        "present-value",
+                        self.occ_to_write,
+                    )
+                            
+                    # Write self.hvac_mode to the "heating or cooling" point.
+                    # to Mecho window blind system AnalogValue
+                    await self.write_property_task(
+                        mecho_address,
+                        "analog-value,97",
+                        "present-value",
+                        self.hvac_mode,
+                    )
+                    
+                except ErrorRejectAbortNack as err:
+                    _log.error(f"Error while processing Mecho Writes: {err}")
+                    await self.set_bacnet_dr_app_error_status_pv(True)
+
+                except Exception as e:
+                    _log.error(f"An unexpected error occurred on Mecho Writes: {e}")
+                    await self.set_bacnet_dr_app_error_status_pv(True)
+
+                # if demand response adjust hvac setpoint only if rm is occupied
+                if _dr_event_active and self.room_is_occupied:
                     try:
-                        # Write last server payload to the "demand response" point.
-                        # to Mecho window blind system AnalogValue
+                        _log.info(" DR EVENT ACTIVE Room is occupied")
+                        
+                        # write new hvac temp setpoint
                         await self.write_property_task(
-                            mecho_address,
-                            "analog-value,99",
+                            hvac_address,
+                            "analog-value,27",
                             "present-value",
-                            self.current_server_payload,
+                            hvac_setpoint_value,
                         )
-                        
-                        # Write self.occ_to_write to the "heating or cooling" point.
-                        # to Mecho window blind system AnalogValue
+                                
+                        # release air flow
                         await self.write_property_task(
-                            mecho_address,
-                            "analog-value,98",
+                            hvac_address,
+                            "analog-value,13",
                             "present-value",
-                            self.occ_to_write,
+                            "null"  # bacnet release
                         )
                                 
-                        # Write self.hvac_mode to the "heating or cooling" point.
-                        # to Mecho window blind system AnalogValue
+                        # release chilled beam valve
                         await self.write_property_task(
-                            mecho_address,
-                            "analog-value,97",
+                            hvac_address,
+                            "analog-output,2",
                             "present-value",
-                            self.hvac_mode,
+                            "null"  # bacnet release
                         )
-                        
+                                
+                        self.hvac_needs_to_be_released = True
+
                     except ErrorRejectAbortNack as err:
-                        _log.error(f"Error while processing Mecho Writes: {err}")
+                        _log.error(f"Error while processing WRITE REQUESTS: {err}")
                         await self.set_bacnet_dr_app_error_status_pv(True)
 
                     except Exception as e:
-                        _log.error(f"An unexpected error occurred on Mecho Writes: {e}")
+                        _log.error(f"An unexpected error occurred on WRITE REQUESTS: {e}")
                         await self.set_bacnet_dr_app_error_status_pv(True)
-
-                    # if demand response adjust hvac setpoint only if rm is occupied
-                    if _dr_event_active and self.room_is_occupied:
-                        try:
-                            _log.info(" DR EVENT ACTIVE Room is occupied")
-                            
-                            # write new hvac temp setpoint
-                            await self.write_property_task(
-                                hvac_address,
-                                "analog-value,27",
-                                "present-value",
-                                hvac_setpoint_value,
-                            )
-                                    
-                            # release air flow
-                            await self.write_property_task(
-                                hvac_address,
-                                "analog-value,13",
-                                "present-value",
-                                "null"  # bacnet release
-                            )
-                                    
-                            # release chilled beam valve
-                            await self.write_property_task(
-                                hvac_address,
-                                "analog-output,2",
-                                "present-value",
-                                "null"  # bacnet release
-                            )
-                                    
-                            self.hvac_needs_to_be_released = True
-
-                        except ErrorRejectAbortNack as err:
-                            _log.error(f"Error while processing WRITE REQUESTS: {err}")
-                            await self.set_bacnet_dr_app_error_status_pv(True)
-
-                        except Exception as e:
-                            _log.error(f"An unexpected error occurred on WRITE REQUESTS: {e}")
-                            await self.set_bacnet_dr_app_error_status_pv(True)
+                
+                # if demand resp and not occupied close air damper and chilled beam valve
+                if _dr_event_active and not self.room_is_occupied:
+                    _log.info(" DR EVENT ACTIVE Room is not occupied")
                     
-                    # if demand resp and not occupied close air damper and chilled beam valve
-                    if _dr_event_active and not self.room_is_occupied:
-                        _log.info(" DR EVENT ACTIVE Room is not occupied")
+                    try:
+                        # release HVAC setpoint
+                        await self.write_property_task(
+                            hvac_address,
+                            "analog-value,27",
+                            "present-value",
+                            "null"  # bacnet release
+                        )
+
+                        # close air valve
+                        await self.write_property_task(
+                            hvac_address,
+                            "analog-value,13",
+                            "present-value",
+                            0,
+                        )
+
+                        # close chilled beam valve
+                        await self.write_property_task(
+                            hvac_address,
+                            "analog-output,2",
+                            "present-value",
+                            0,
+                        )
                         
-                        try:
-                            # release HVAC setpoint
-                            await self.write_property_task(
-                                hvac_address,
-                                "analog-value,27",
-                                "present-value",
-                                "null"  # bacnet release
-                            )
-
-                            # close air valve
-                            await self.write_property_task(
-                                hvac_address,
-                                "analog-value,13",
-                                "present-value",
-                                0,
-                            )
-
-                            # close chilled beam valve
-                            await self.write_property_task(
-                                hvac_address,
-                                "analog-output,2",
-                                "present-value",
-                                0,
-                            )
-                            
-                            self.hvac_needs_to_be_released = True
+                        self.hvac_needs_to_be_released = True
 
-                        except ErrorRejectAbortNack as err:
-                            _log.error(f"Error while processing WRITE REQUESTS: {err}")
-                            await self.set_bacnet_dr_app_error_status_pv(True)
+                    except ErrorRejectAbortNack as err:
+                        _log.error(f"Error while processing WRITE REQUESTS: {err}")
+                        await self.set_bacnet_dr_app_error_status_pv(True)
 
-                        except Exception as e:
-                            _log.error(f"An unexpected error occurred on WRITE REQUESTS: {e}")
-                            await self.set_bacnet_dr_app_error_status_pv(True)
-                            
+                    except Exception as e:
+                        _log.error(f"An unexpected error occurred on WRITE REQUESTS: {e}")
+                        await self.set_bacnet_dr_app_error_status_pv(True)
+                        
                 # if no demand response release all HVAC one last time
                 if not _dr_event_active and self.hvac_needs_to_be_released:
 
@@ -767,6 +813,10 @@ class SampleApplication:
                         _log.error(f"An unexpected error occurred on WRITE REQUESTS: {e}")
                         await self.set_bacnet_dr_app_error_status_pv(True)
 
+                if not APPLY_BACNET_WRITES:
+                    # log and save what this cycle would have written
+                    self.bacnet.end_plan()
+
 
 async def main():
     args = SimpleArgumentParser().parse_args()
@@ -817,15 +867,14 @@ async def main():
         app_status=app_status,
         dr_event_app_error=dr_event_app_error
     )
+    startup.mark("bacnet_app")
+    if not USE_OPEN_ADR:
+        startup.ready(STARTUP_BUDGET)
     if _debug:
         _log.debug("app: %r", app)
 
-    await asyncio.Future()
+    await app.tasks.run()
 
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        if _debug:
-            _log.debug("keyboard interrupt")
+    startup.run(main, use_uvloop=USE_UVLOOP)
@@ -0,0 +1,173 @@
+"""
+Idempotent OpenADR event ingestion
+
+VTNs resend the same event on every poll and send modified events with
+a bumped modification number. Each delivery is fingerprinted (event id,
+modification number, intervals) so an unchanged redelivery is skipped
+with one dict lookup, and a modified event only replaces the intervals
+whose start, duration or payload actually changed. Every live interval
+owns exactly one task, so the task count stays flat no matter how
+often the VTN resends.
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+_log = logging.getLogger(__name__)
+
+
+def interval_fingerprint(interval):
+    return hashlib.sha1(
+        f"{interval['start'].isoformat()}|{interval['end'].isoformat()}|{interval['payload']!r}".encode("utf-8")
+    ).hexdigest()
+
+
+def event_intervals(event):
+    """
+    {interval key: interval} of an openleadr event dict, keyed by signal
+    and interval uid so a modification lines up with what it replaces
+    """
+    intervals = {}
+    for signal_index, signal in enumerate(event.get("event_signals", [])):
+        signal_id = signal.get("signal_id", signal_index)
+        for interval_index, interval in enumerate(signal.get("intervals", [])):
+            uid = interval.get("uid", interval_index)
+            start = interval["dtstart"]
+            intervals[(signal_id, uid)] = {
+                "start": start,
+                "end": start + interval["duration"],
+                "payload": interval["signal_payload"],
+            }
+    return intervals
+
+
+def event_fingerprint(event_id, modification_number, intervals):
+    digest = hashlib.sha1(f"{event_id}|{modification_number}".encode("utf-8"))
+    for key in sorted(intervals, key=repr):
+        digest.update(f"|{key!r}:{interval_fingerprint(intervals[key])}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EventRecord:
+    def __init__(self, event_id, modification_number):
+        self.event_id = event_id
+        self.modification_number = modification_number
+        self.fingerprint = None
+        self.intervals = {}  # key -> (interval fingerprint, interval, task)
+
+
+class EventRegistry:
+    """
+    Live events by id, each interval with the one task that runs it.
+    `run_interval(event_id, interval)` is the coroutine function
+    scheduled for a new or changed interval, `create_task(coroutine,
+    key)` starts it.
+    """
+    def __init__(self, run_interval, create_task, finished_size=256):
+        self.run_interval = run_interval
+        self.create_task = create_task
+        self.events = {}
+        # fingerprints of finished events the VTN may still be resending
+        self.finished = OrderedDict()
+        self.finished_size = finished_size
+        self.skipped = 0
+
+    def ingest(self, event):
+        """
+        Apply one event delivery, returns "new", "modified", "unchanged",
+        "stale" (older modification than the one held) or "cancelled"
+        """
+        descriptor = event["event_descriptor"]
+        event_id = descriptor["event_id"]
+        modification_number = descriptor.get("modification_number", 0) or 0
+
+        if descriptor.get("event_status") == "cancelled":
+            self.cancel(event_id)
+            return "cancelled"
+
+        record = self.events.get(event_id)
+        if record is not None and modification_number < record.modification_number:
+            self.skipped += 1
+            return "stale"
+
+        intervals = event_intervals(event)
+        fingerprint = event_fingerprint(event_id, modification_number, intervals)
+        if record is not None and record.fingerprint == fingerprint:
+            self.skipped += 1
+            return "unchanged"
+        if record is None and self.finished.get(event_id) == fingerprint:
+            self.skipped += 1
+            return "unchanged"
+
+        result = "new" if record is None else "modified"
+        if record is None:
+            record = EventRecord(event_id, modification_number)
+            self.events[event_id] = record
+        record.modification_number = modification_number
+        record.fingerprint = fingerprint
+
+        now = datetime.now(timezone.utc)
+        for key in list(record.intervals):
+            if key not in intervals:
+                self._cancel_interval(record, key)
+
+        for key, interval in intervals.items():
+            interval_hash = interval_fingerprint(interval)
+            held = record.intervals.get(key)
+            if held is not None and held[0] == interval_hash:
+                continue
+            if held is not None:
+                self._cancel_interval(record, key)
+            if interval["end"] <= now:
+                _log.info(f"Passing on interval {key} of {event_id} as it is in the past")
+                continue
+            task = self.create_task(self.run_interval(event_id, interval), (event_id, key))
+            record.intervals[key] = (interval_hash, interval, task)
+
+        _log.info(f"Event {event_id} modification {modification_number} {result}, "
+                  f"{len(record.intervals)} intervals scheduled")
+        return result
+
+    def _cancel_interval(self, record, key):
+        _, _, task = record.intervals.pop(key)
+        if not task.done():
+            task.cancel()
+
+    def cancel(self, event_id):
+        record = self.events.pop(event_id, None)
+        if record is None:
+            return
+        for key in list(record.intervals):
+            self._cancel_interval(record, key)
+        _log.info(f"Event {event_id} cancelled")
+
+    def active_interval(self, now=None):
+        """
+        (event id, interval) covering `now`, None outside every event
+        """
+        now = datetime.now(timezone.utc) if now is None else now
+        for event_id, record in self.events.items():
+            for _, interval, _ in record.intervals.values():
+                if interval["start"] <= now < interval["end"]:
+                    return event_id, interval
+        return None
+
+    def prune(self):
+        """
+        Forget events whose every interval has finished
+        """
+        for event_id in list(self.events):
+            record = self.events[event_id]
+            if all(task.done() for _, _, task in record.intervals.values()):
+                del self.events[event_id]
+                self.finished[event_id] = record.fingerprint
+                self.finished.move_to_end(event_id)
+                while len(self.finished) > self.finished_size:
+                    self.finished.popitem(last=False)
+
+    def task_count(self):
+        return sum(
+            not task.done() for record in self.events.values() for _, _, task in record.intervals.values()
+        )
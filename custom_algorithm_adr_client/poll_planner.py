@@ -0,0 +1,125 @@
+import time
+
+
+class PolledPoint:
+    """
+    Poll state of one point. `deadband` is the smallest change in
+    value worth reacting to, `relevance` from 0.0 to 1.0 is how much
+    the point matters to the DR decision.
+    """
+    def __init__(self, name, deadband, relevance, interval):
+        self.name = name
+        self.deadband = deadband
+        self.relevance = relevance
+        self.interval = interval
+        self.rate = None  # EWMA of |change| per second
+        self.last_value = None
+        self.last_time = None
+        self.next_due = 0.0
+
+
+class PollPlanner:
+    """
+    Gives each point its own poll interval from how fast it has been
+    changing: roughly the time it takes the point to move by its
+    deadband, kept within [min_interval, max_interval]. During a DR
+    event intervals shrink by `dr_scale` weighted by each point's
+    relevance, down to `dr_min_interval`, so a fast CO2 sensor gets
+    read often while a setpoint that never moves drifts out to the
+    max interval.
+    """
+    def __init__(
+        self,
+        min_interval=15.0,
+        max_interval=300.0,
+        dr_scale=0.25,
+        dr_min_interval=5.0,
+        smoothing=0.3,
+    ):
+        self.min_interval = min_interval
+        self.dr_min_interval = min(dr_min_interval, min_interval)
+        self.max_interval = max_interval
+        self.dr_scale = dr_scale
+        self.smoothing = smoothing
+        self.dr_active = False
+        self.points = {}
+
+    def add_point(self, name, deadband=1.0, relevance=1.0):
+        # nothing known yet, poll right away and then at the min interval
+        self.points[name] = PolledPoint(name, deadband, relevance, self.min_interval)
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return [name for name, point in self.points.items() if point.next_due <= now]
+
+    def next_wakeup(self, now=None):
+        """
+        Seconds until the next point is due
+        """
+        now = time.monotonic() if now is None else now
+        if not self.points:
+            return self.max_interval
+        return max(0.0, min(point.next_due for point in self.points.values()) - now)
+
+    def observe(self, name, value, now=None):
+        """
+        Feed back a polled value, updates the point's rate and schedules its next poll
+        """
+        now = time.monotonic() if now is None else now
+        point = self.points[name]
+
+        if point.last_time is not None and now > point.last_time:
+            change = _change(point.last_value, value, point.deadband)
+            rate = change / (now - point.last_time)
+            if point.rate is None:
+                point.rate = rate
+            else:
+                point.rate = self.smoothing * rate + (1.0 - self.smoothing) * point.rate
+
+        point.last_value = value
+        point.last_time = now
+        point.interval = self._interval(point)
+        point.next_due = now + point.interval
+
+    def observe_error(self, name, now=None):
+        # failed read, try again soon but keep the learned rate
+        now = time.monotonic() if now is None else now
+        self.points[name].next_due = now + self.min_interval
+
+    def set_dr_active(self, dr_active, now=None):
+        """
+        Re-plan every point on a DR start or end, pulling polls
+        forward when a DR start shortens their interval
+        """
+        if dr_active == self.dr_active:
+            return
+        now = time.monotonic() if now is None else now
+        self.dr_active = dr_active
+        for point in self.points.values():
+            point.interval = self._interval(point)
+            if point.last_time is not None:
+                point.next_due = min(point.next_due, max(now, point.last_time + point.interval))
+
+    def _interval(self, point):
+        if point.rate is None:
+            interval = self.min_interval
+        elif point.rate <= 0.0:
+            interval = self.max_interval
+        else:
+            interval = point.deadband / point.rate
+        floor = self.min_interval
+        if self.dr_active:
+            interval *= self.dr_scale ** point.relevance
+            floor = self.dr_min_interval
+        return min(max(interval, floor), self.max_interval)
+
+    def intervals(self):
+        return {name: round(point.interval, 1) for name, point in self.points.items()}
+
+
+def _change(previous, value, deadband):
+    try:
+        return abs(float(value) - float(previous))
+    except (TypeError, ValueError):
+        # modes and other enumerated values, any change counts as a full deadband
+        return deadband if str(value) != str(previous) else 0.0
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+"""
+Shadow execution for BACnet reads and writes
+
+Stands in for the bacpypes3 Application read_property / write_property
+calls so a DR cycle can be run without touching the building. Every
+request is recorded in a time-stamped plan and timed on a virtual
+clock using a per-device latency model, so the plan runs at full speed
+but reports how long the real shed would take on the wire.
+
+Replay a recorded plan against other latencies:
+$ python shadow.py shadow_plan.jsonl --latency 32:18=0.35 --latency 10.7.6.161/24:47820=0.02
+"""
+
+import os
+import json
+import time
+import argparse
+import logging
+
+_log = logging.getLogger(__name__)
+
+DEFAULT_DEVICE_LATENCY = 0.05  # seconds per confirmed request
+DEFAULT_PLAN_MAX_BYTES = 10 * 1024 * 1024
+
+
+class DeviceLatencyModel:
+    """
+    One outstanding request per device at a time, like an MS/TP
+    device waiting on the token, so requests to a busy device queue
+    behind the one it is already serving.
+    """
+    def __init__(self, device_latency=None, default_latency=DEFAULT_DEVICE_LATENCY):
+        self.device_latency = dict(device_latency or {})
+        self.default_latency = default_latency
+        self.device_free_at = {}
+
+    def latency(self, address):
+        return self.device_latency.get(str(address), self.default_latency)
+
+    def schedule(self, address, issued_at):
+        address = str(address)
+        started = max(issued_at, self.device_free_at.get(address, 0.0))
+        completed = started + self.latency(address)
+        self.device_free_at[address] = completed
+        return started, completed
+
+    def reset(self):
+        self.device_free_at = {}
+
+
+class ShadowTransport:
+    """
+    Recording transport with the same read_property / write_property
+    signature as the bacpypes3 Application it stands in for.
+
+    Reads go to `passthrough` (the real application) when given so the
+    algorithm still sees live values, otherwise they are served from
+    `building_model`. Writes never leave the gateway, they only update
+    the building model and land in the plan.
+    """
+    def __init__(
+        self,
+        device_latency=None,
+        default_latency=DEFAULT_DEVICE_LATENCY,
+        building_model=None,
+        passthrough=None,
+        plan_path=None,
+        plan_max_bytes=DEFAULT_PLAN_MAX_BYTES,
+    ):
+        self.latency_model = DeviceLatencyModel(device_latency, default_latency)
+        self.building_model = building_model if building_model is not None else {}
+        self.passthrough = passthrough
+        self.plan_path = plan_path
+        # the plan file is rolled over to plan_path + ".1" past this size
+        self.plan_max_bytes = plan_max_bytes
+        self.label = None
+        self.plan = []
+        self.clock = 0.0
+
+    def begin_plan(self, label):
+        self.label = label
+        self.plan = []
+        self.clock = 0.0
+        self.latency_model.reset()
+
+    def _record(self, kind, address, object_identifier, property_identifier, value=None, priority=None):
+        started, completed = self.latency_model.schedule(address, self.clock)
+        # the caller awaits each request, so its virtual clock moves to completion
+        self.clock = completed
+        self.plan.append(
+            {
+                "seq": len(self.plan),
+                "wall_time": time.time(),
+                "kind": kind,
+                "address": str(address),
+                "object_identifier": str(object_identifier),
+                "property_identifier": str(property_identifier),
+                "value": value,
+                "priority": priority,
+                "started": started,
+                "completed": completed,
+            }
+        )
+
+    async def read_property(self, address, object_identifier, property_identifier, property_array_index=None):
+        key = (str(address), str(object_identifier), str(property_identifier))
+        if self.passthrough is not None:
+            value = await self.passthrough.read_property(
+                address, object_identifier, property_identifier, property_array_index
+            )
+            self.building_model[key] = value
+        else:
+            value = self.building_model.get(key, 0.0)
+        self._record("read", address, object_identifier, property_identifier, value=_plain(value))
+        return value
+
+    async def write_property(
+        self,
+        address,
+        object_identifier,
+        property_identifier,
+        value,
+        property_array_index=None,
+        priority=None,
+    ):
+        key = (str(address), str(object_identifier), str(property_identifier))
+        value = _plain(value)
+        if value == "null":
+            self.building_model.pop(key, None)
+        else:
+            self.building_model[key] = value
+        self._record(
+            "write", address, object_identifier, property_identifier, value=value, priority=priority
+        )
+
+    def end_plan(self):
+        summary = summarize(self.label, self.plan)
+        _log.info(
+            f"Shadow plan {self.label}: {summary['reads']} reads {summary['writes']} writes, "
+            f"writes complete at {summary['shed_completion_seconds']:.2f}s, "
+            f"all requests at {summary['completion_seconds']:.2f}s"
+        )
+        if self.plan_path:
+            self._rotate_plan_file()
+            with open(self.plan_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps({"summary": summary, "plan": self.plan}) + "\n")
+        return summary
+
+    def _rotate_plan_file(self):
+        # shadow mode is the default, a plan per cycle must not fill the disk
+        if not self.plan_max_bytes:
+            return
+        try:
+            size = os.path.getsize(self.plan_path)
+        except OSError:
+            return
+        if size >= self.plan_max_bytes:
+            os.replace(self.plan_path, f"{self.plan_path}.1")
+
+
+def _plain(value):
+    # bacpypes3 Null / primitive data to something JSON friendly
+    if value is None or isinstance(value, (int, float, str, bool)):
+        return value
+    if type(value).__name__ == "Null":
+        return "null"
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def summarize(label, plan):
+    writes = [request for request in plan if request["kind"] == "write"]
+    per_device = {}
+    for request in plan:
+        device = per_device.setdefault(request["address"], {"requests": 0, "busy_seconds": 0.0})
+        device["requests"] += 1
+        device["busy_seconds"] += request["completed"] - request["started"]
+
+    return {
+        "label": label,
+        "reads": len(plan) - len(writes),
+        "writes": len(writes),
+        "shed_completion_seconds": max((request["completed"] for request in writes), default=0.0),
+        "completion_seconds": max((request["completed"] for request in plan), default=0.0),
+        "per_device": per_device,
+    }
+
+
+def replay_plan(plan, device_latency=None, default_latency=DEFAULT_DEVICE_LATENCY, building_model=None):
+    """
+    Re-time a recorded plan against another latency model and apply its
+    writes to a building model, returning (summary, building_model)
+    """
+    transport = ShadowTransport(device_latency, default_latency, building_model=building_model)
+    transport.begin_plan("replay")
+    for request in plan:
+        transport._record(
+            request["kind"],
+            request["address"],
+            request["object_identifier"],
+            request["property_identifier"],
+            value=request["value"],
+            priority=request["priority"],
+        )
+        if request["kind"] == "write":
+            key = (request["address"], request["object_identifier"], request["property_identifier"])
+            if request["value"] == "null":
+                transport.building_model.pop(key, None)
+            else:
+                transport.building_model[key] = request["value"]
+
+    return summarize("replay", transport.plan), transport.building_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded shadow plans")
+    parser.add_argument("plan_path")
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        help="per device latency as address=seconds, can be repeated",
+    )
+    parser.add_argument("--default-latency", type=float, default=DEFAULT_DEVICE_LATENCY)
+    args = parser.parse_args()
+
+    device_latency = {}
+    for item in args.latency:
+        address, seconds = item.rsplit("=", 1)
+        device_latency[address] = float(seconds)
+
+    with open(args.plan_path, "r", encoding="utf-8") as file:
+        for line in file:
+            recorded = json.loads(line)
+            summary, _ = replay_plan(recorded["plan"], device_latency, args.default_latency)
+            print(
+                f"{recorded['summary']['label']}: {summary['writes']} writes, "
+                f"shed complete in {summary['shed_completion_seconds']:.2f}s "
+                f"(recorded {recorded['summary']['shed_completion_seconds']:.2f}s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,29 @@
+import os
+
 from bacpypes3.pdu import Address
 from bacpypes3.primitivedata import ObjectIdentifier
 
 DR_SERVER_URL = "https://bensflaskapp.oncloud.com/payload/current"
+DR_SERVER_RANGE_URL = "https://bensflaskapp.oncloud.com/payload/range"
+DR_SERVER_REVISION_URL = "https://bensflaskapp.oncloud.com/payload/revision"
 USE_DR_SERVER = True
-CLOUD_DR_SERVER_CHECK_SECONDS = 10
+# building id on the cloud server, picks this building's DR program, None for the default program
+DR_BUILDING_ID = None
+
+# day-ahead schedule cached on the gateway and run from its own clock,
+# the cloud is only polled for schedule revisions
+SCHEDULE_CACHE_PATH = "dr_schedule_cache.json"
+SCHEDULE_PREFETCH_HOURS = 36
+SCHEDULE_REFETCH_MARGIN_HOURS = 12
+SCHEDULE_REVISION_CHECK_SECONDS = 60
+DR_EVENT_ALGORITHM_INTERVAL = 60.0
+
+# batched telemetry posted to the cloud server, needs DR_BUILDING_ID set
+TELEMETRY_URL = "https://bensflaskapp.oncloud.com/telemetry/batch"
+DR_SERVER_LOGIN_URL = "https://bensflaskapp.oncloud.com/login"
+DR_SERVER_USERNAME = os.getenv("DR_SERVER_USERNAME", "")
+DR_SERVER_PASSWORD = os.getenv("DR_SERVER_PASSWORD", "")
+TELEMETRY_UPLOAD_SECONDS = 60
 
 BACNET_SERVER_API_UPDATE_INTERVAL = 2.0
 ALGORITHM_READ_REQ_INTERVAL = 60.0
@@ -47,6 +47,9 @@ class DrApplication(Utils):
 
         # create a task to update the values
         asyncio.create_task(self.cloud_server_check_in())
+        asyncio.create_task(self.execute_cached_schedule())
+        if DR_BUILDING_ID is not None:
+            asyncio.create_task(self.telemetry_upload_loop())
         asyncio.create_task(self.update_bacnet_server_values())
 
     async def algorithm(self):
@@ -93,6 +96,11 @@ class DrApplication(Utils):
             room_is_occupied,
         )
 
+        # errors are skipped by the batcher
+        self.telemetry.record("zone_setpoint", hvac_setpoint_value)
+        self.telemetry.record("hvac_mode", hvac_mode_trane)
+        self.telemetry.record("zone_co2_ppm", ppm)
+
         # Adding a dead band of -50 PPM around self.ppm_for_occ
         # Check if ppm is greater than self.ppm_for_occ 
         # (no dead band) to set room as occupied
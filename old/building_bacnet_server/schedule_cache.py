@@ -0,0 +1,83 @@
+import os
+import json
+import bisect
+import logging
+from datetime import datetime
+
+
+class ScheduleCache:
+    """
+    Local copy of the cloud DR block schedule from /payload/range.
+    Saved to disk so the gateway keeps following the schedule through
+    cloud outages and restarts.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.revision = None
+        self.starts = []
+        self.ends = []
+        self.payloads = []
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self._set_document(json.load(file))
+            logging.info(
+                f" Loaded cached DR schedule revision {self.revision} "
+                f"with {len(self.payloads)} blocks"
+            )
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f" Ignoring unreadable DR schedule cache: {e}")
+
+    def update(self, document):
+        """
+        Replace the cached schedule with a /payload/range response
+        """
+        self._set_document(document)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(document, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _set_document(self, document):
+        blocks = sorted(
+            (
+                datetime.fromisoformat(block["start"]).timestamp(),
+                datetime.fromisoformat(block["end"]).timestamp(),
+                block["payload"],
+            )
+            for block in document["blocks"]
+        )
+        self.starts = [block[0] for block in blocks]
+        self.ends = [block[1] for block in blocks]
+        self.payloads = [block[2] for block in blocks]
+        self.revision = document.get("revision")
+
+    def coverage_end(self):
+        return self.ends[-1] if self.ends else None
+
+    def payload_at(self, timestamp):
+        """
+        Payload of the block covering `timestamp`, None when the
+        schedule does not cover it
+        """
+        index = bisect.bisect_right(self.starts, timestamp) - 1
+        if index < 0 or timestamp >= self.ends[index]:
+            return None
+        return self.payloads[index]
+
+    def next_transition(self, timestamp):
+        """
+        Time of the next block boundary after `timestamp`, None past the end of the schedule
+        """
+        index = bisect.bisect_right(self.starts, timestamp)
+        if index > 0 and timestamp < self.ends[index - 1]:
+            return self.ends[index - 1]
+        if index < len(self.starts):
+            return self.starts[index]
+        return None
@@ -0,0 +1,68 @@
+import gzip
+import json
+import time
+
+import numpy as np
+
+
+def encode_point(timestamps, values, scale):
+    # same delta encoding the cloud server's telemetry_store.py decodes
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    quantized = np.round(np.asarray(values, dtype=np.float64) / scale).astype(np.int64)
+    return {
+        "t0": int(timestamps[0]),
+        "dt": np.diff(timestamps).tolist(),
+        "v0": int(quantized[0]),
+        "dv": np.diff(quantized).tolist(),
+        "scale": scale,
+    }
+
+
+class TelemetryBatcher:
+    """
+    Buffers readings per point and hands them out as one gzip'd delta
+    encoded batch for /telemetry/batch. A batch that fails to post is
+    put back so readings survive short cloud outages, up to
+    `max_readings` per point.
+    """
+    def __init__(self, building, scale=0.01, max_readings=10_000):
+        self.building = building
+        self.scale = scale
+        self.max_readings = max_readings
+        self.points = {}  # point -> ([timestamps], [values])
+
+    def record(self, point, value, timestamp=None):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return
+        timestamp = int(time.time()) if timestamp is None else int(timestamp)
+        timestamps, values = self.points.setdefault(point, ([], []))
+        timestamps.append(timestamp)
+        values.append(value)
+        if len(timestamps) > self.max_readings:
+            del timestamps[0], values[0]
+
+    def take_batch(self):
+        """
+        (gzip'd body, taken readings) or (None, None) when there is
+        nothing to send, hand the readings to restore() if the post fails
+        """
+        if not self.points:
+            return None, None
+        taken, self.points = self.points, {}
+        batch = {
+            "building": self.building,
+            "points": {
+                point: encode_point(timestamps, values, self.scale)
+                for point, (timestamps, values) in taken.items()
+            },
+        }
+        return gzip.compress(json.dumps(batch).encode("utf-8")), taken
+
+    def restore(self, taken):
+        for point, (timestamps, values) in taken.items():
+            newer_timestamps, newer_values = self.points.get(point, ([], []))
+            timestamps = (timestamps + newer_timestamps)[-self.max_readings:]
+            values = (values + newer_values)[-self.max_readings:]
+            self.points[point] = (timestamps, values)
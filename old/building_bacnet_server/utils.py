@@ -8,12 +8,15 @@ from bacpypes3.local.analog import AnalogValueObject
 from bacpypes3.local.binary import BinaryValueObject
 
 from constants import *
+from schedule_cache import ScheduleCache
+from telemetry_batcher import TelemetryBatcher
 
 import re
 import aiohttp
 import asyncio
 import time
 import logging
+from datetime import datetime, timedelta, timezone
 
 logger = logging.getLogger(__name__)
 _debug = 0
@@ -31,59 +34,34 @@ class Utils:
         self.current_server_payload = 0
         self.last_server_payload = 0
         self.last_dr_event_check = time.time()
+        self.schedule_cache = ScheduleCache(SCHEDULE_CACHE_PATH)
+        self.schedule_updated = asyncio.Event()
+        self.telemetry = TelemetryBatcher(DR_BUILDING_ID)
+        self.telemetry_token = None
 
     async def cloud_server_check_in(self):
         """
-        This method continuously checks in with a cloud server to receive
-        DR signals and updates the application's state accordingly every 10 seconds.
+        Keeps the local DR schedule in sync with the cloud server. Only
+        the small revision document is polled, the block schedule is
+        fetched again when the revision changed or the cached schedule
+        is running out. A cloud outage just leaves the cached schedule running.
         """
         while True:
             try:
                 async with aiohttp.ClientSession() as session:
-                    async with session.get(DR_SERVER_URL) as response:
+                    async with session.get(DR_SERVER_REVISION_URL) as response:
                         if response.status == 200:
                             server_data = await response.json()
+                            revision = server_data.get("revision")
 
-                            self.current_server_payload = server_data.get("payload", 0)
-                            logging.info(
-                                f" Received cloud DR server response at {time.ctime()}: {self.current_server_payload}"
+                            coverage_end = self.schedule_cache.coverage_end()
+                            running_out = (
+                                coverage_end is None
+                                or coverage_end - time.time() < SCHEDULE_REFETCH_MARGIN_HOURS * 3600
                             )
 
-                            if self.last_server_payload != self.current_server_payload:
-                                logging.info(f" DR EVENT SIGNAL CHANGE")
-
-                                if self.current_server_payload == 1:
-                                    logging.info(f" SETTING DR EVENT TRUE")
-                                    self.dr_event_active = True
-                                    await self.algorithm()
-
-                                elif self.current_server_payload == 0:
-                                    logging.info(f" SETTING DR EVENT FALSE")
-                                    self.dr_event_active = False
-
-                                    # only run this if it was an actual dr event
-                                    # else pass if some other signal was tested
-                                    if self.last_server_payload == 1:
-                                        logging.info(f" SHOULD BE RUNNING DR RELEASES!")
-                                        await self.algorithm()
-
-                                else:  # default to false if the payload value is incorrect
-                                    self.dr_event_active = False
-                                    logging.info(
-                                        f" UNKOWN DR SIGNAL of {self.current_server_payload}"
-                                    )
-
-                                self.last_server_payload = self.current_server_payload
-
-                            # New logic for running every 60 seconds
-                            elif self.dr_event_active and (
-                                time.time() - self.last_dr_event_check >= 60
-                            ):
-                                logging.info(
-                                    f" DR Event active, running task as per 60-second interval"
-                                )
-                                await self.algorithm()
-                                self.last_dr_event_check = time.time()
+                            if revision != self.schedule_cache.revision or running_out:
+                                await self.fetch_cloud_schedule(session)
 
                         else:
                             logging.warning(
@@ -91,15 +69,157 @@ class Utils:
                             )
 
             except aiohttp.ClientError as e:
-                # Handle network errors and retry after a delay
-                logging.error(f" Error while fetching Cloud DR server response: {e}")
-                await asyncio.sleep(10)  # Adjust the delay as needed
+                logging.error(
+                    f" Error while checking Cloud DR server schedule, running from cache: {e}"
+                )
             except Exception as e:
                 logging.error(
-                    f" Other error while fetching Cloud DR server response: {e}"
+                    f" Other error while checking Cloud DR server schedule: {e}"
+                )
+
+            await asyncio.sleep(SCHEDULE_REVISION_CHECK_SECONDS)
+
+    async def fetch_cloud_schedule(self, session):
+        now = datetime.now(timezone.utc)
+        params = {
+            "start": now.isoformat(),
+            "end": (now + timedelta(hours=SCHEDULE_PREFETCH_HOURS)).isoformat(),
+        }
+        if DR_BUILDING_ID is not None:
+            params["building"] = DR_BUILDING_ID
+        async with session.get(DR_SERVER_RANGE_URL, params=params) as response:
+            if response.status != 200:
+                logging.warning(
+                    f" Cloud DR Server schedule returned status code {response.status}"
+                )
+                return
+
+            document = await response.json()
+            self.schedule_cache.update(document)
+            logging.info(
+                f" Cached DR schedule revision {self.schedule_cache.revision} "
+                f"with {len(document['blocks'])} blocks at {time.ctime()}"
+            )
+            self.schedule_updated.set()
+
+    async def execute_cached_schedule(self):
+        """
+        Follows the cached schedule on the gateway's own clock, waking at
+        block boundaries, when a new schedule lands, and every 60 seconds
+        while a DR event is active to run the algorithm again.
+        """
+        while True:
+            now = time.time()
+            payload = self.schedule_cache.payload_at(now)
+            if payload is None:
+                # not covered by the cached schedule, normal operations
+                payload = 0
+            await self.handle_server_payload(payload)
+
+            wake_at = self.schedule_cache.next_transition(now)
+            wait = DR_EVENT_ALGORITHM_INTERVAL if wake_at is None else wake_at - now
+            if self.dr_event_active:
+                wait = min(
+                    wait,
+                    DR_EVENT_ALGORITHM_INTERVAL - (time.time() - self.last_dr_event_check),
+                )
+
+            try:
+                await asyncio.wait_for(self.schedule_updated.wait(), max(wait, 0.1))
+            except asyncio.TimeoutError:
+                pass
+            self.schedule_updated.clear()
+
+    async def handle_server_payload(self, payload):
+        self.current_server_payload = payload
+
+        if self.last_server_payload != self.current_server_payload:
+            logging.info(
+                f" DR EVENT SIGNAL CHANGE at {time.ctime()}: {self.current_server_payload}"
+            )
+
+            if self.current_server_payload == 1:
+                logging.info(f" SETTING DR EVENT TRUE")
+                self.dr_event_active = True
+                await self.algorithm()
+                self.last_dr_event_check = time.time()
+
+            elif self.current_server_payload == 0:
+                logging.info(f" SETTING DR EVENT FALSE")
+                self.dr_event_active = False
+
+                # only run this if it was an actual dr event
+                # else pass if some other signal was tested
+                if self.last_server_payload == 1:
+                    logging.info(f" SHOULD BE RUNNING DR RELEASES!")
+                    await self.algorithm()
+
+            else:  # default to false if the payload value is incorrect
+                self.dr_event_active = False
+                logging.info(
+                    f" UNKOWN DR SIGNAL of {self.current_server_payload}"
                 )
 
-            await asyncio.sleep(CLOUD_DR_SERVER_CHECK_SECONDS)
+            self.last_server_payload = self.current_server_payload
+
+        # New logic for running every 60 seconds
+        elif self.dr_event_active and (
+            time.time() - self.last_dr_event_check >= DR_EVENT_ALGORITHM_INTERVAL
+        ):
+            logging.info(
+                f" DR Event active, running task as per 60-second interval"
+            )
+            await self.algorithm()
+            self.last_dr_event_check = time.time()
+
+    async def telemetry_upload_loop(self):
+        """
+        Posts the buffered readings to the cloud as one compressed batch
+        every TELEMETRY_UPLOAD_SECONDS, a failed post keeps them for the next try
+        """
+        while True:
+            await asyncio.sleep(TELEMETRY_UPLOAD_SECONDS)
+
+            self.telemetry.record("dr_payload", self.current_server_payload)
+            self.telemetry.record("power_level", self.power_level.presentValue)
+
+            body, taken = self.telemetry.take_batch()
+            if body is None:
+                continue
+
+            try:
+                async with aiohttp.ClientSession() as session:
+                    if self.telemetry_token is None:
+                        self.telemetry_token = await self.cloud_login(session)
+
+                    headers = {
+                        "Authorization": f"Bearer {self.telemetry_token}",
+                        "Content-Type": "application/json",
+                        "Content-Encoding": "gzip",
+                    }
+                    async with session.post(TELEMETRY_URL, data=body, headers=headers) as response:
+                        if response.status == 200:
+                            logging.info(f" Posted {len(body)} byte telemetry batch")
+                            continue
+                        if response.status == 401:
+                            # token expired, log in again on the next try
+                            self.telemetry_token = None
+                        logging.warning(
+                            f" Cloud DR Server telemetry returned status code {response.status}"
+                        )
+
+            except aiohttp.ClientError as e:
+                logging.error(f" Error while posting telemetry: {e}")
+            except Exception as e:
+                logging.error(f" Other error while posting telemetry: {e}")
+
+            self.telemetry.restore(taken)
+
+    async def cloud_login(self, session):
+        credentials = {"username": DR_SERVER_USERNAME, "password": DR_SERVER_PASSWORD}
+        async with session.post(DR_SERVER_LOGIN_URL, json=credentials) as response:
+            response.raise_for_status()
+            return (await response.json())["access_token"]
 
     async def share_data_to_bacnet_server(self):
         # BACnet server processes
@@ -0,0 +1,79 @@
+"""
+Benchmark for the multi-program schedule index
+
+$ python bench_schedule_index.py
+$ python bench_schedule_index.py --buildings 10000 --programs 300 --days 7
+"""
+
+import time
+import argparse
+
+import numpy as np
+
+from schedule_index import ScheduleIndex, BLOCK_SECONDS
+
+
+def build_index(building_count, program_count, days, rng):
+    index = ScheduleIndex()
+    t0 = int(time.time()) // BLOCK_SECONDS * BLOCK_SECONDS
+    block_count = days * 24 * 3600 // BLOCK_SECONDS
+    starts = t0 + np.arange(block_count) * BLOCK_SECONDS
+
+    start = time.perf_counter()
+    for program in range(program_count):
+        # a few hours of shed on some afternoons
+        payloads = (rng.random(block_count) > 0.9).astype(float)
+        index.set_program_schedule(f"program-{program}", dict(zip(starts.tolist(), payloads.tolist())))
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buildings = [f"building-{building}" for building in range(building_count)]
+    groups_per_program = 2
+    for group, chunk in enumerate(np.array_split(buildings, program_count * groups_per_program)):
+        index.assign_group(f"group-{group}", f"program-{group // groups_per_program}", chunk.tolist())
+    group_seconds = time.perf_counter() - start
+
+    return index, buildings, t0, load_seconds, group_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Schedule index benchmark")
+    parser.add_argument("--buildings", type=int, default=10_000)
+    parser.add_argument("--programs", type=int, default=300)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index, buildings, t0, load_seconds, group_seconds = build_index(
+        args.buildings, args.programs, args.days, rng
+    )
+    state = index.state
+    print(
+        f"{args.buildings} buildings, {args.programs} programs, "
+        f"{state.payloads.shape[1]} blocks, {state.payloads.nbytes / 1e6:.1f} MB of payloads"
+    )
+    print(f"load programs {load_seconds * 1e3:.1f} ms, assign groups {group_seconds * 1e3:.1f} ms")
+
+    now = t0 + 3600
+    picks = rng.integers(0, len(buildings), size=args.lookups)
+    start = time.perf_counter()
+    for pick in picks.tolist():
+        index.building_payload(buildings[pick], now)
+    per_lookup = (time.perf_counter() - start) / args.lookups
+    print(f"single building lookup {per_lookup * 1e6:.2f} us")
+
+    repeats = 20
+    start = time.perf_counter()
+    for _ in range(repeats):
+        index.bulk_payloads(now)
+    print(f"bulk lookup of all buildings {(time.perf_counter() - start) / repeats * 1e3:.2f} ms")
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        index.bulk_payloads(now, group="group-0")
+    print(f"bulk lookup of one group {(time.perf_counter() - start) / repeats * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import json
+import math
+import time
+import logging
+import threading
+from datetime import datetime
+
+from schedule_index import BLOCK_SECONDS, floor_block, payload_value
+
+logger = logging.getLogger(__name__)
+
+
+class PayloadDocument:
+    def __init__(self, body, etag):
+        self.body = body  # serialized JSON response bytes
+        self.etag = etag  # unquoted
+
+
+class BlockDocuments:
+    """
+    /payload/current responses of every program for one time block and index revision
+    """
+    def __init__(self, block_start, revision, documents):
+        self.block_start = block_start
+        self.block_end = block_start + BLOCK_SECONDS
+        self.revision = revision
+        self.documents = documents
+
+
+class PayloadDocuments:
+    """
+    Precomputed /payload/current response bytes per program. The answer
+    only changes at quarter hour block boundaries or when a schedule is
+    uploaded, so the documents are built once per block and swapped in
+    as a whole, leaving requests with a dict lookup and a time compare.
+    """
+    def __init__(self, index, tz):
+        self.index = index
+        self.tz = tz
+        self.current = None
+        self._lock = threading.Lock()
+
+    def build(self, block_start, revision):
+        state = self.index.state
+        block = state.block(block_start)
+        block_time = datetime.fromtimestamp(block_start, self.tz)
+        rounded_time_iso = f"timeblock is {block_time.isoformat()}"
+
+        documents = {}
+        for program in state.program_names:
+            value = state.payloads[state.programs[program], block] if block >= 0 else math.nan
+            documents[program] = self._document(program, value, rounded_time_iso, block_start, revision)
+        return BlockDocuments(block_start, revision, documents)
+
+    def _document(self, program, value, rounded_time_iso, block_start, revision):
+        found = not math.isnan(value)
+        body = json.dumps({
+            "status": "success",
+            "info": rounded_time_iso if found else "timeblock is not found",
+            "server_time_corrected": rounded_time_iso,
+            "timezone": str(self.tz),
+            "program": program,
+            "payload": payload_value(value),
+        }).encode("utf-8")
+        return PayloadDocument(body, f"{revision}-{block_start}-{program}")
+
+    def refresh(self, now=None):
+        """
+        Rebuild the documents for the block covering `now` and swap them in
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            block_start = floor_block(now)
+            revision = self.index.revision
+            current = self.current
+            if current is None or current.block_start != block_start or current.revision != revision:
+                current = self.build(block_start, revision)
+                self.current = current
+            return current
+
+    def get(self, program, now=None):
+        """
+        (document, seconds until it changes) for a program at `now`
+        """
+        now = time.time() if now is None else now
+        current = self.current
+        if current is None or now >= current.block_end or current.revision != self.index.revision:
+            current = self.refresh(now)
+
+        document = current.documents.get(program)
+        if document is None:
+            # program nobody uploaded a schedule for, normal operations
+            rounded_time_iso = (
+                f"timeblock is {datetime.fromtimestamp(current.block_start, self.tz).isoformat()}"
+            )
+            document = self._document(
+                program, math.nan, rounded_time_iso, current.block_start, current.revision
+            )
+        return document, max(0, int(current.block_end - now))
+
+    def start_refresher(self):
+        """
+        Daemon thread that swaps in the next block's documents right at
+        each block boundary so no request has to build them
+        """
+        def run():
+            while True:
+                time.sleep(max(0.0, floor_block(time.time()) + BLOCK_SECONDS - time.time()))
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.error(f"Error refreshing payload documents: {e}")
+
+        thread = threading.Thread(target=run, name="payload-documents", daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,252 @@
+import math
+import secrets
+import threading
+
+import numpy as np
+
+BLOCK_SECONDS = 15 * 60
+DEFAULT_PROGRAM = "default"
+DEFAULT_GROUP = "default"
+
+
+def floor_block(timestamp):
+    return int(timestamp // BLOCK_SECONDS) * BLOCK_SECONDS
+
+
+def payload_value(value):
+    """
+    Stored payload back to JSON, a block no program set is normal operations 0
+    """
+    if math.isnan(value):
+        return 0
+    return int(value) if float(value).is_integer() else float(value)
+
+
+class IndexState:
+    """
+    One immutable version of the index. Writers build a new state and
+    swap it in, so readers never see a half applied update.
+    """
+    def __init__(self, t0, payloads, programs, groups, group_program, buildings, building_group, revision):
+        self.t0 = t0  # epoch seconds of block 0 on the shared time axis
+        self.payloads = payloads  # [program, block], NaN where a program set nothing
+        self.programs = programs  # program name -> row
+        self.groups = groups  # building group name -> row
+        self.group_program = group_program  # group row -> program row
+        self.buildings = buildings  # building id -> row
+        self.building_group = building_group  # building row -> group row
+        self.revision = revision
+        self.program_names = sorted(programs, key=programs.get)
+
+    def block(self, timestamp):
+        if self.t0 is None:
+            return -1
+        block = int((timestamp - self.t0) // BLOCK_SECONDS)
+        return block if 0 <= block < self.payloads.shape[1] else -1
+
+
+class ScheduleIndex:
+    """
+    Columnar DR schedules for many programs on one shared quarter hour
+    time axis. A building resolves to a program through its building
+    group, so its current payload is a dict lookup and a few array
+    indexes no matter how many buildings or programs there are.
+    Buildings that were never assigned a group follow the default program.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()  # serializes writers, readers never lock
+        # the counter starts over on restart, the nonce keeps a revision
+        # a gateway cached before it from matching one issued after it
+        self.boot = secrets.token_hex(4)
+        self.state = IndexState(
+            t0=None,
+            payloads=np.full((1, 0), np.nan),
+            programs={DEFAULT_PROGRAM: 0},
+            groups={DEFAULT_GROUP: 0},
+            group_program=np.zeros(1, dtype=np.int32),
+            buildings={},
+            building_group=np.zeros(0, dtype=np.int32),
+            revision=0,
+        )
+
+    @property
+    def revision(self):
+        """
+        "<boot nonce>-<uploads since boot>", unique across restarts
+        """
+        return f"{self.boot}-{self.state.revision}"
+
+    def _replace(self, state, bump=True, **changes):
+        fields = dict(state.__dict__)
+        del fields["program_names"]
+        fields.update(changes)
+        if bump:
+            fields["revision"] = state.revision + 1
+        self.state = IndexState(**fields)
+
+    def set_program_schedule(self, program, schedule):
+        """
+        Replace a program's schedule, `schedule` maps epoch seconds of
+        each quarter hour block start to its payload
+        """
+        with self._lock:
+            state = self.state
+            programs = dict(state.programs)
+            if program not in programs:
+                programs[program] = len(programs)
+            row = programs[program]
+
+            starts = np.array([floor_block(ts) for ts in schedule], dtype=np.int64)
+            values = np.array(list(schedule.values()), dtype=np.float64)
+
+            # grow the shared axis so it covers this program and all the others
+            t0 = state.t0
+            blocks = state.payloads.shape[1]
+            if starts.size:
+                first = int(starts.min())
+                last = int(starts.max()) + BLOCK_SECONDS
+                old_end = t0 + blocks * BLOCK_SECONDS if t0 is not None else last
+                new_t0 = first if t0 is None else min(t0, first)
+                blocks = (max(old_end, last) - new_t0) // BLOCK_SECONDS
+            else:
+                new_t0 = t0
+
+            payloads = np.full((len(programs), blocks), np.nan)
+            if t0 is not None and state.payloads.shape[1]:
+                offset = (t0 - new_t0) // BLOCK_SECONDS
+                old_rows = state.payloads.shape[0]
+                payloads[:old_rows, offset:offset + state.payloads.shape[1]] = state.payloads
+            payloads[row] = np.nan
+            if starts.size:
+                payloads[row, (starts - new_t0) // BLOCK_SECONDS] = values
+
+            self._replace(state, t0=new_t0, payloads=payloads, programs=programs)
+
+    def assign_group(self, group, program, buildings):
+        """
+        Point a building group at a program and move `buildings` into it
+        """
+        with self._lock:
+            state = self.state
+            programs = dict(state.programs)
+            if program not in programs:
+                programs[program] = len(programs)
+            payloads = state.payloads
+            if payloads.shape[0] < len(programs):
+                payloads = np.vstack(
+                    [payloads, np.full((len(programs) - payloads.shape[0], payloads.shape[1]), np.nan)]
+                )
+
+            groups = dict(state.groups)
+            group_program = state.group_program
+            if group not in groups:
+                groups[group] = len(groups)
+                group_program = np.append(group_program, np.int32(0))
+            else:
+                group_program = group_program.copy()
+            group_program[groups[group]] = programs[program]
+
+            building_rows = dict(state.buildings)
+            new = [building for building in buildings if building not in building_rows]
+            for building in new:
+                building_rows[building] = len(building_rows)
+            building_group = np.concatenate(
+                [state.building_group, np.zeros(len(new), dtype=np.int32)]
+            )
+            building_group[[building_rows[building] for building in buildings]] = groups[group]
+
+            self._replace(
+                state,
+                payloads=payloads,
+                programs=programs,
+                groups=groups,
+                group_program=group_program,
+                buildings=building_rows,
+                building_group=building_group,
+            )
+
+    def trim_before(self, timestamp):
+        """
+        Drop blocks that ended before `timestamp`. Only history goes, so
+        the revision is kept and gateways do not refetch their schedule.
+        """
+        with self._lock:
+            state = self.state
+            block = state.block(timestamp)
+            if block <= 0:
+                return
+            self._replace(
+                state,
+                bump=False,
+                t0=state.t0 + block * BLOCK_SECONDS,
+                payloads=state.payloads[:, block:].copy(),
+            )
+
+    def program_of(self, building, state=None):
+        state = self.state if state is None else state
+        row = state.buildings.get(building)
+        group = 0 if row is None else state.building_group[row]
+        return int(state.group_program[group])
+
+    def building_program(self, building):
+        state = self.state
+        return state.program_names[self.program_of(building, state)]
+
+    def building_payload(self, building, timestamp):
+        """
+        (payload, program name) in effect for a building at `timestamp`
+        """
+        state = self.state
+        program_row = self.program_of(building, state)
+        block = state.block(timestamp)
+        value = state.payloads[program_row, block] if block >= 0 else np.nan
+        return value, state.program_names[program_row]
+
+    def program_payload(self, program, timestamp):
+        state = self.state
+        row = state.programs.get(program)
+        block = state.block(timestamp)
+        if row is None or block < 0:
+            return np.nan
+        return state.payloads[row, block]
+
+    def bulk_payloads(self, timestamp, buildings=None, group=None):
+        """
+        Current payload for many buildings in one vectorized gather,
+        all known buildings by default or only those in `group`.
+        Returns (building ids, payload array).
+        """
+        state = self.state
+        if buildings is None:
+            # building rows are in insertion order, same as the dict
+            ids = list(state.buildings)
+            groups = state.building_group
+        else:
+            ids = list(buildings)
+            rows = np.array([state.buildings.get(building, -1) for building in ids], dtype=np.int64)
+            groups = np.where(rows >= 0, state.building_group[np.maximum(rows, 0)], 0)
+        if group is not None:
+            keep = np.flatnonzero(groups == state.groups.get(group, -1))
+            ids = [ids[row] for row in keep.tolist()]
+            groups = groups[keep]
+
+        block = state.block(timestamp)
+        if block < 0:
+            return ids, np.full(len(ids), np.nan)
+        return ids, state.payloads[state.group_program[groups], block]
+
+    def program_blocks(self, program, start, end):
+        """
+        Quarter hour block starts and payloads of one program from
+        `start` up to `end`, NaN outside what the program set
+        """
+        state = self.state
+        starts = np.arange(floor_block(start), end, BLOCK_SECONDS, dtype=np.int64)
+        values = np.full(starts.size, np.nan)
+        row = state.programs.get(program)
+        if row is None or state.t0 is None:
+            return starts, values
+        blocks = (starts - state.t0) // BLOCK_SECONDS
+        inside = (blocks >= 0) & (blocks < state.payloads.shape[1])
+        values[inside] = state.payloads[row, blocks[inside]]
+        return starts, values
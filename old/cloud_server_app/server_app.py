@@ -1,13 +1,19 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 from flask_jwt_extended import JWTManager, jwt_required, create_access_token
 from datetime import datetime, timezone, timedelta
 import pytz
+import json
+import zlib
 import logging
 import os
 from dateutil import parser
 import secrets
 import string
 
+from schedule_index import ScheduleIndex, DEFAULT_PROGRAM, BLOCK_SECONDS, payload_value
+from payload_documents import PayloadDocuments
+from telemetry_store import TelemetryStore
+
 # Generate a random secret key with a specified length (e.g., 32 characters)
 def generate_random_secret_key(length):
     alphabet = string.ascii_letters + string.digits + string.punctuation
@@ -29,12 +35,79 @@ app = Flask(__name__)
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', secret_key)
 jwt = JWTManager(app)
 
-# In-memory storage
-payload_data = {}
+# In-memory storage, schedules per program with buildings mapped to
+# programs through building groups, its revision is bumped on every
+# upload so gateways only refetch the schedule when it changed
+schedule_index = ScheduleIndex()
+
+# /payload/current response bytes per program, rebuilt once per block
+payload_documents = PayloadDocuments(schedule_index, nyc_tz)
+payload_documents.start_refresher()
+
+# gateway meter and zone readings, append-only segments per day, building and point
+telemetry_store = TelemetryStore(os.getenv("TELEMETRY_ROOT", "telemetry"))
+MAX_TELEMETRY_BATCH_BYTES = 16 * 1024 * 1024
+
+BLOCK_MINUTES = BLOCK_SECONDS // 60
+MAX_RANGE_HOURS = 7 * 24
+# past blocks kept in the schedule index, older ones are dropped on upload
+SCHEDULE_RETENTION_HOURS = MAX_RANGE_HOURS
+
+
+def floor_to_block(dt):
+    # Round down to the nearest quarter hour
+    return dt - timedelta(minutes=dt.minute % BLOCK_MINUTES,
+                          seconds=dt.second,
+                          microseconds=dt.microsecond)
+
+
+def parse_request_time(value, default):
+    if value is None:
+        return default
+    dt = parser.isoparse(value)
+    if dt.tzinfo is None:
+        dt = nyc_tz.localize(dt)
+    return dt.astimezone(nyc_tz)
+
+
+def block_time(timestamp):
+    return datetime.fromtimestamp(int(timestamp), nyc_tz)
+
+
+def requested_program():
+    # a building follows its group's program, else an explicit or the default program
+    building = request.args.get("building")
+    if building is not None:
+        return schedule_index.building_program(building)
+    return request.args.get("program", DEFAULT_PROGRAM)
+
+
+def build_block_schedule(program, start, end):
+    """
+    Run length encode a program's quarter hour payloads between start
+    and end, consecutive blocks with the same payload become one block
+    and missing time blocks are the normal operations payload of 0
+    """
+    starts, values = schedule_index.program_blocks(program, start.timestamp(), end.timestamp())
+    blocks = []
+    for block_start, value in zip(starts.tolist(), values.tolist()):
+        payload = payload_value(value)
+        block_end = block_start + BLOCK_SECONDS
+        if blocks and blocks[-1]["payload"] == payload:
+            blocks[-1]["end"] = block_time(block_end).isoformat()
+        else:
+            blocks.append({
+                "start": block_time(block_start).isoformat(),
+                "end": block_time(block_end).isoformat(),
+                "payload": payload,
+            })
+    return blocks
 
 @app.route("/update/data", methods=["POST"])
 @jwt_required()
 def update_data():
+    # ?program=<name> uploads that program's schedule, else the default program
+    program = request.args.get("program", DEFAULT_PROGRAM)
     data = request.get_json()
 
     temp_data = {}
@@ -44,11 +117,15 @@ def update_data():
         for key, value in data.items():
             # Parse the key as NYC time
             dt_key_nyc = parser.isoparse(key).astimezone(nyc_tz)
-            temp_data[dt_key_nyc] = value['payload']
+            temp_data[dt_key_nyc.timestamp()] = value['payload']
 
-        # Clear the existing data and update with new data from temp_data
-        payload_data.clear()
-        payload_data.update(temp_data)
+        # Replace the program's schedule with the new data from temp_data
+        schedule_index.set_program_schedule(program, temp_data)
+        # the time axis only grows on uploads, keep it to the retention window
+        schedule_index.trim_before(
+            datetime.now(nyc_tz).timestamp() - SCHEDULE_RETENTION_HOURS * 3600
+        )
+        payload_documents.refresh()
 
     except Exception as e:
         # Handle any exceptions that occur during parsing and updating
@@ -60,28 +137,143 @@ def update_data():
 
 
 
+@app.route("/update/group", methods=["POST"])
+@jwt_required()
+def update_group():
+    """
+    Put buildings in a building group and point the group at a program
+    {"group": "campus-a", "program": "cpp-summer", "buildings": ["bldg-1", "bldg-2"]}
+    """
+    data = request.get_json()
+    try:
+        schedule_index.assign_group(data["group"], data["program"], data.get("buildings", []))
+    except (KeyError, TypeError) as e:
+        return jsonify({"status": "error", "info": f"Bad group update: {e}"}), 400
+
+    return jsonify({"status": "success", "info": "Group updated successfully"}), 200
+
+
 @app.route("/payload/current", methods=["GET"])
 def get_current_payload():
-    # Get the current time in NYC timezone
+    """
+    Serves the precomputed response for the current block, clients
+    polling with If-None-Match get a 304 until the block or schedule changes
+    """
+    document, _ = payload_documents.get(requested_program())
+    # an upload can change the current block at any time, so caches
+    # always revalidate and the ETag keeps that to a 304
+    headers = {
+        "ETag": f'"{document.etag}"',
+        "Cache-Control": "no-cache",
+    }
+
+    if request.if_none_match.contains(document.etag):
+        return Response(status=304, headers=headers)
+
+    return Response(document.body, mimetype="application/json", headers=headers)
+
+
+@app.route("/payload/bulk", methods=["GET"])
+def get_bulk_payloads():
+    """
+    Current payload of every known building for dashboards, ?group= limits it to one building group
+    """
     nyc_now = datetime.now(nyc_tz)
+    buildings, payloads = schedule_index.bulk_payloads(
+        nyc_now.timestamp(), group=request.args.get("group")
+    )
 
-    # Round down to the nearest quarter hour
-    rounded_time = nyc_now - timedelta(minutes=nyc_now.minute % 15,
-                                       seconds=nyc_now.second,
-                                       microseconds=nyc_now.microsecond)
-
-    # Try to find a payload for the rounded time
-    payload = payload_data.get(rounded_time, None)
-    rounded_time_iso = f"timeblock is {rounded_time.isoformat()}"
-    response = {
+    return jsonify({
         "status": "success",
-        "info": rounded_time_iso if payload is not None else "timeblock is not found",
-        "server_time_corrected": rounded_time_iso,
+        "server_time_corrected": f"timeblock is {floor_to_block(nyc_now).isoformat()}",
         "timezone": str(nyc_tz),
-        "payload": payload if payload is not None else 0
-    }
+        "payloads": {
+            building: payload_value(payload)
+            for building, payload in zip(buildings, payloads.tolist())
+        },
+    })
+
+@app.route("/payload/range", methods=["GET"])
+def get_payload_range():
+    """
+    Block schedule for a time window so gateways can run the
+    schedule locally, defaults to the next 24 hours
+    ?start=2024-05-01T00:00:00-04:00&end=2024-05-02T12:00:00-04:00
+    """
+    nyc_now = datetime.now(nyc_tz)
+
+    try:
+        start = parse_request_time(request.args.get("start"), nyc_now)
+        end = parse_request_time(request.args.get("end"), start + timedelta(hours=24))
+    except (ValueError, OverflowError) as e:
+        return jsonify({"status": "error", "info": f"Bad start or end time: {e}"}), 400
+
+    if end <= start or end - start > timedelta(hours=MAX_RANGE_HOURS):
+        return jsonify({"status": "error",
+                        "info": f"Range must be positive and at most {MAX_RANGE_HOURS} hours"}), 400
+
+    program = requested_program()
+    return jsonify({
+        "status": "success",
+        "revision": schedule_index.revision,
+        "timezone": str(nyc_tz),
+        "program": program,
+        "block_minutes": BLOCK_MINUTES,
+        "blocks": build_block_schedule(program, start, end),
+    })
+
+
+@app.route("/payload/revision", methods=["GET"])
+def get_payload_revision():
+    return jsonify({"status": "success", "revision": schedule_index.revision})
 
-    return jsonify(response)
+@app.route("/telemetry/batch", methods=["POST"])
+@jwt_required()
+def telemetry_batch():
+    """
+    Gateways post delta encoded readings for many points at once,
+    gzip'd with Content-Encoding: gzip, see telemetry_store.py for the format
+    """
+    body = request.get_data()
+
+    try:
+        if request.headers.get("Content-Encoding") == "gzip":
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            body = decompressor.decompress(body, MAX_TELEMETRY_BATCH_BYTES)
+            if decompressor.unconsumed_tail:
+                return jsonify({"status": "error", "info": "Batch too large"}), 413
+        batch = json.loads(body)
+        stored = telemetry_store.append_batch(batch)
+
+    except (ValueError, KeyError, TypeError, AttributeError, OverflowError, zlib.error) as e:
+        logger.error(f"Error storing telemetry batch: {e}")
+        return jsonify({"status": "error", "info": f"Bad telemetry batch: {e}"}), 400
+
+    return jsonify({"status": "success", "stored": stored}), 200
+
+
+@app.route("/telemetry/<building>/<point>", methods=["GET"])
+@jwt_required()
+def get_telemetry(building, point):
+    """
+    Stored readings of one point, defaults to the last 24 hours
+    ?start=<iso>&end=<iso>
+    """
+    nyc_now = datetime.now(nyc_tz)
+    try:
+        end = parse_request_time(request.args.get("end"), nyc_now)
+        start = parse_request_time(request.args.get("start"), end - timedelta(hours=24))
+        records = telemetry_store.read(building, point, start.timestamp(), end.timestamp())
+    except (ValueError, OverflowError) as e:
+        return jsonify({"status": "error", "info": f"Bad telemetry request: {e}"}), 400
+
+    return jsonify({
+        "status": "success",
+        "building": building,
+        "point": point,
+        "t": records["t"].tolist(),
+        "v": records["v"].tolist(),
+    })
 
 # Index Route
 @app.route("/")
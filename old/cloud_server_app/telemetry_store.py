@@ -0,0 +1,165 @@
+"""
+Columnar on-disk telemetry store for gateway batches
+
+Readings land in append-only binary segments, one per day, building
+and point:
+
+    <root>/<YYYY-MM-DD>/<building>/<point>.seg
+
+Each segment is a flat array of (epoch seconds, value) records so a
+batch is appended with one write per point and read back through
+np.memmap without parsing anything.
+
+Batch wire format, gzip'd JSON posted by the gateways. Times and
+values are delta encoded, values quantized to `scale`:
+
+    {
+        "building": "bldg-1",
+        "points": {
+            "main_meter_kw": {"t0": 1714536000, "dt": [60, 60, ...],
+                              "v0": 12345, "dv": [3, -2, ...], "scale": 0.01}
+        }
+    }
+"""
+
+import os
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([("t", "<i8"), ("v", "<f8")])
+DAY_SECONDS = 24 * 3600
+
+# building and point names become path components
+NAME_RE = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]{0,127}$")
+
+
+def encode_point(timestamps, values, scale=0.01):
+    """
+    Delta encode one point's readings for a batch
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    quantized = np.round(np.asarray(values, dtype=np.float64) / scale).astype(np.int64)
+    return {
+        "t0": int(timestamps[0]),
+        "dt": np.diff(timestamps).tolist(),
+        "v0": int(quantized[0]),
+        "dv": np.diff(quantized).tolist(),
+        "scale": scale,
+    }
+
+
+def decode_point(encoded):
+    """
+    Delta encoded point back to a record array, one cumsum per column
+    """
+    dt = np.asarray(encoded.get("dt", []), dtype=np.int64)
+    dv = np.asarray(encoded.get("dv", []), dtype=np.int64)
+    if dt.size != dv.size:
+        raise ValueError("dt and dv must be the same length")
+
+    records = np.empty(dt.size + 1, dtype=RECORD_DTYPE)
+    records["t"][0] = int(encoded["t0"])
+    np.cumsum(dt, out=records["t"][1:])
+    records["t"][1:] += records["t"][0]
+
+    quantized = np.empty(dv.size + 1, dtype=np.int64)
+    quantized[0] = int(encoded["v0"])
+    np.cumsum(dv, out=quantized[1:])
+    quantized[1:] += quantized[0]
+    records["v"] = quantized * float(encoded.get("scale", 1.0))
+    return records
+
+
+def check_name(name):
+    if not isinstance(name, str) or not NAME_RE.match(name):
+        raise ValueError(f"bad building or point name {name!r}")
+    return name
+
+
+def day_of(timestamp):
+    try:
+        return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+    except (OverflowError, OSError) as e:
+        raise ValueError(f"timestamp {timestamp} out of range") from e
+
+
+class TelemetryStore:
+    def __init__(self, root):
+        self.root = root
+
+    def segment_path(self, day, building, point):
+        return os.path.join(self.root, day, building, f"{point}.seg")
+
+    def append_batch(self, batch):
+        """
+        Decode a batch and append it, returns the number of readings stored
+        """
+        if not isinstance(batch, dict) or not isinstance(batch.get("points"), dict):
+            raise ValueError("a batch is an object with building and points")
+        building = check_name(batch["building"])
+        decoded = {}
+        for point, encoded in batch["points"].items():
+            if not isinstance(encoded, dict):
+                raise ValueError(f"point {point!r} is not an encoded point")
+            decoded[check_name(point)] = decode_point(encoded)
+
+        # every segment path is worked out before the first write, a batch
+        # that is rejected leaves nothing behind
+        writes = []
+        for point, records in decoded.items():
+            # split by UTC day, batches are normally inside one day
+            days = records["t"] // DAY_SECONDS
+            for day in np.unique(days):
+                path = self.segment_path(day_of(int(day) * DAY_SECONDS), building, point)
+                writes.append((path, records[days == day]))
+
+        stored = 0
+        for path, rows in writes:
+            self._append(path, rows)
+            stored += rows.size
+        return stored
+
+    def _append(self, path, records):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # one O_APPEND write per point keeps concurrent batches from interleaving records
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, records.tobytes())
+        finally:
+            os.close(fd)
+
+    def _segment(self, path):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        # ignore a partly written record at the tail
+        count = size // RECORD_DTYPE.itemsize
+        if count == 0:
+            return None
+        return np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+    def read(self, building, point, start, end):
+        """
+        Records of one point with start <= t < end, sorted by time
+        """
+        building = check_name(building)
+        point = check_name(point)
+        parts = []
+        for day in range(int(start) // DAY_SECONDS, (int(end) - 1) // DAY_SECONDS + 1):
+            segment = self._segment(self.segment_path(day_of(day * DAY_SECONDS), building, point))
+            if segment is None:
+                continue
+            inside = segment[(segment["t"] >= start) & (segment["t"] < end)]
+            parts.append(np.array(inside))
+        if not parts:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        records = np.concatenate(parts)
+        # batches from a gateway can arrive out of order after a retry
+        return records[np.argsort(records["t"], kind="stable")]
+
+    def buildings(self, day):
+        path = os.path.join(self.root, day)
+        return sorted(os.listdir(path)) if os.path.isdir(path) else []